@@ -0,0 +1,86 @@
+"""Minimal in-process ASGI client for benchmarks.
+
+Calls the application directly, without sockets and without an HTTP
+client library, so the measured time is spent in the service itself.
+"""
+import asyncio
+import typing as tp
+
+from starlette.types import ASGIApp, Message
+
+Headers = tp.Sequence[tp.Tuple[str, str]]
+
+
+class Response(tp.NamedTuple):
+    status_code: int
+    headers: tp.List[tp.Tuple[bytes, bytes]]
+    body: bytes
+
+
+async def call(
+    app: ASGIApp,
+    method: str,
+    path: str,
+    headers: Headers = (),
+    body: bytes = b"",
+) -> Response:
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [
+            (name.lower().encode(), value.encode()) for name, value in headers
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    request_sent = False
+    response_complete = asyncio.Event()
+    status_code = 0
+    response_headers: tp.List[tp.Tuple[bytes, bytes]] = []
+    chunks: tp.List[bytes] = []
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal status_code, response_headers
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            response_headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    return Response(status_code, response_headers, b"".join(chunks))
+
+
+async def startup(app: ASGIApp) -> None:
+    """Run the lifespan startup of `app`."""
+    queue: "asyncio.Queue[Message]" = asyncio.Queue()
+    await queue.put({"type": "lifespan.startup"})
+    started = asyncio.Event()
+
+    async def receive() -> Message:
+        return await queue.get()
+
+    async def send(message: Message) -> None:
+        if message["type"].startswith("lifespan.startup"):
+            started.set()
+
+    asyncio.ensure_future(app({"type": "lifespan"}, receive, send))
+    await started.wait()
@@ -0,0 +1,395 @@
+"""Load test of the recommendation endpoints.
+
+    python -m benchmarks.bench_load --models knn online_knn \\
+        --distributions uniform zipf unknown --concurrency 1 8 32 \\
+        --requests 2000 --output load.json
+
+Every (model, user id distribution, concurrency) run sends `--requests`
+requests from `--concurrency` closed-loop clients and reports RPS and
+latency percentiles. By default the app is called in-process through
+`benchmarks.asgi`; with `--server uvicorn` it is served by a uvicorn
+subprocess, and `--url` points the clients at a running service, e.g.
+gunicorn. `--replay` sends requests from a JSON lines file instead of
+the synthetic distributions, one `{"model_name": ..., "user_id": ...}`
+or `{"path": ...}` per line. `--baseline` compares with a saved run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import typing as tp
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from service.api.app import create_app
+from service.model_loading import model_registry
+from service.settings import get_config
+
+from .asgi import call, startup
+
+AUTH_HEADERS = [("Authorization", "Bearer Team_5")]
+DISTRIBUTIONS = ("uniform", "zipf", "unknown")
+
+# (method, path), the same for every transport
+Request = tp.Tuple[str, str]
+Send = tp.Callable[[Request], tp.Awaitable[int]]
+
+
+class HTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client, one request at a time."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self._reader: tp.Optional[asyncio.StreamReader] = None
+        self._writer: tp.Optional[asyncio.StreamWriter] = None
+
+    async def request(self, request: Request) -> int:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        assert self._reader is not None
+        method, path = request
+        headers = "".join(
+            f"{name}: {value}\r\n" for name, value in AUTH_HEADERS
+        )
+        self._writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            f"{headers}\r\n".encode()
+        )
+        head = await self._reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        content_length = 0
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            if name.lower() == "content-length":
+                content_length = int(value)
+        await self._reader.readexactly(content_length)
+        return int(status_line.split()[1])
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def make_requests(
+    model_name: str,
+    distribution: str,
+    known_user_ids: np.ndarray,
+    n_requests: int,
+    seed: int = 0,
+) -> tp.List[Request]:
+    rng = np.random.default_rng(seed)
+    if distribution == "uniform":
+        user_ids = rng.choice(known_user_ids, size=n_requests)
+    elif distribution == "zipf":
+        # a few heavy users and a long tail, as in real traffic
+        ranks = rng.zipf(1.2, size=n_requests) - 1
+        user_ids = known_user_ids[ranks % len(known_user_ids)]
+    elif distribution == "unknown":
+        user_ids = known_user_ids.max() + 1 + rng.integers(
+            0, 10**6, size=n_requests
+        )
+    else:
+        raise ValueError(f"Unknown distribution {distribution}")
+    return [("GET", f"/reco/{model_name}/{user_id}") for user_id in user_ids]
+
+
+def read_replay(path: str) -> tp.Dict[str, tp.List[Request]]:
+    """Requests of a JSON lines file by model name."""
+    requests: tp.Dict[str, tp.List[Request]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            request_path = record.get("path") or (
+                f"/reco/{record['model_name']}/{record['user_id']}"
+            )
+            model_name = request_path.strip("/").split("/")[1]
+            requests.setdefault(model_name, []).append(("GET", request_path))
+    return requests
+
+
+def load_known_user_ids() -> np.ndarray:
+    # users of the offline knn model, the models know mostly the same users
+    try:
+        user_ids = model_registry.get("knn").user_ids
+    except Exception:  # pylint: disable=broad-except
+        return np.arange(10**5)
+    return np.asarray(user_ids, dtype=np.int64)
+
+
+async def run_load(
+    send: Send,
+    requests: tp.Sequence[Request],
+    concurrency: int,
+) -> tp.Dict[str, tp.Any]:
+    latencies = np.zeros(len(requests))
+    statuses: tp.Dict[int, int] = {}
+    next_request = iter(range(len(requests)))
+
+    async def client() -> None:
+        for i in next_request:
+            started_at = time.perf_counter()
+            status_code = await send(requests[i])
+            latencies[i] = time.perf_counter() - started_at
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": len(requests),
+        "rps": len(requests) / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": latencies.max() * 1000,
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+    }
+
+
+async def asgi_sender() -> tp.Tuple[Send, tp.Callable[[], tp.Awaitable]]:
+    app = create_app(get_config())
+    await startup(app)
+
+    async def send(request: Request) -> int:
+        method, path = request
+        response = await call(app, method, path, AUTH_HEADERS)
+        return response.status_code
+
+    async def close() -> None:
+        pass
+
+    await wait_ready(send)
+    return send, close
+
+
+async def http_sender(
+    url: str,
+    concurrency: int,
+) -> tp.Tuple[Send, tp.Callable[[], tp.Awaitable]]:
+    parts = urlsplit(url)
+    host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    # a connection per client, requests are not pipelined
+    pool = [HTTPConnection(host, port) for _ in range(concurrency)]
+
+    async def send(request: Request) -> int:
+        connection = pool.pop()
+        try:
+            return await connection.request(request)
+        except Exception:
+            await connection.close()
+            raise
+        finally:
+            pool.append(connection)
+
+    async def close() -> None:
+        for connection in pool:
+            await connection.close()
+
+    await wait_ready(send)
+    return send, close
+
+
+async def wait_ready(send: Send, timeout_seconds: float = 120) -> None:
+    # models are loaded in the background after the startup
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        try:
+            if await send(("GET", "/ready")) == 200:
+                return
+        except OSError:
+            # the server is not listening yet
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("The service is not ready")
+        await asyncio.sleep(0.2)
+
+
+def start_uvicorn() -> tp.Tuple[subprocess.Popen, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        stdout=subprocess.DEVNULL,
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def compare(
+    results: tp.List[tp.Dict[str, tp.Any]],
+    baseline: tp.List[tp.Dict[str, tp.Any]],
+) -> None:
+    def key(result: tp.Dict[str, tp.Any]) -> tp.Tuple[str, str, int]:
+        return result["model_name"], result["traffic"], result["concurrency"]
+
+    baseline_runs = {key(result): result for result in baseline}
+    for result in results:
+        base = baseline_runs.get(key(result))
+        if base is None:
+            continue
+        model_name, name, concurrency = key(result)
+        print(
+            f"{model_name:12} {name:8} c={concurrency:<4} "
+            f"rps {result['rps'] / base['rps'] - 1:+7.1%}   "
+            f"p99 {result['p99_ms'] / base['p99_ms'] - 1:+7.1%}"
+        )
+
+
+def split_runs(
+    requests: tp.Sequence[Request],
+    n_runs: int,
+    warm_up: int,
+) -> tp.List[tp.Tuple[tp.Sequence[Request], tp.Sequence[Request]]]:
+    """
+    Warm-up and measured requests of every run: other requests for
+    every run, so that the reco cache filled by the previous runs does
+    not flatter it, and the warm-up is not measured.
+    """
+    run_size = len(requests) // n_runs
+    if run_size <= warm_up:
+        raise ValueError(
+            f"{len(requests)} requests are too few for {n_runs} runs "
+            f"of {warm_up} warm-up requests and a measurement"
+        )
+    return [
+        (
+            requests[i * run_size:i * run_size + warm_up],
+            requests[i * run_size + warm_up:(i + 1) * run_size],
+        )
+        for i in range(n_runs)
+    ]
+
+
+def make_traffic(
+    args: argparse.Namespace,
+) -> tp.Dict[tp.Tuple[str, str], tp.List[Request]]:
+    """Requests by model and traffic name, for all the runs of each."""
+    if args.replay is not None:
+        return {
+            (model_name, "replay"): requests
+            for model_name, requests in read_replay(args.replay).items()
+        }
+    user_ids = load_known_user_ids()
+    run_size = args.warm_up + args.requests
+    return {
+        (model_name, distribution): make_requests(
+            model_name,
+            distribution,
+            user_ids,
+            run_size * len(args.concurrency),
+        )
+        for model_name in args.models
+        for distribution in args.distributions
+    }
+
+
+async def run(args: argparse.Namespace) -> tp.List[tp.Dict[str, tp.Any]]:
+    max_concurrency = max(args.concurrency)
+    process = None
+    if args.url is not None:
+        send, close = await http_sender(args.url, max_concurrency)
+    elif args.server == "uvicorn":
+        process, url = start_uvicorn()
+        send, close = await http_sender(url, max_concurrency)
+    else:
+        send, close = await asgi_sender()
+
+    traffic = make_traffic(args)
+    results = []
+    try:
+        for (model_name, name), requests in traffic.items():
+            runs = split_runs(requests, len(args.concurrency), args.warm_up)
+            for concurrency, (warm_up, measured) in zip(
+                args.concurrency, runs
+            ):
+                await run_load(send, warm_up, concurrency)
+                result = await run_load(send, measured, concurrency)
+                result.update(
+                    model_name=model_name,
+                    traffic=name,
+                    concurrency=concurrency,
+                )
+                results.append(result)
+                print(
+                    f"{model_name:12} {name:8} c={concurrency:<4} "
+                    f"{result['rps']:8.0f} rps   "
+                    f"p50 {result['p50_ms']:7.2f}   "
+                    f"p95 {result['p95_ms']:7.2f}   "
+                    f"p99 {result['p99_ms']:7.2f} ms   "
+                    f"{result['statuses']}"
+                )
+    finally:
+        await close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--models", nargs="+", default=["test_model", "knn", "online_knn"]
+    )
+    parser.add_argument(
+        "--distributions", nargs="+", choices=DISTRIBUTIONS,
+        default=list(DISTRIBUTIONS),
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int,
+                        default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warm-up", type=int, default=200)
+    parser.add_argument("--server", choices=("asgi", "uvicorn"),
+                        default="asgi")
+    parser.add_argument("--url", help="load a running service instead")
+    parser.add_argument("--replay", help="JSON lines file with requests")
+    parser.add_argument("--output", help="write the results to JSON")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    parser.add_argument("--log", action="store_true",
+                        help="keep the service logs, they are off by default")
+    args = parser.parse_args()
+
+    if not args.log:
+        logging.disable(logging.CRITICAL)
+    results = asyncio.run(run(args))
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "args": {
+                        name: value for name, value in vars(args).items()
+                        if name not in ("output", "baseline")
+                    },
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Time the event loop thread spends in logging calls per request.
+
+    python -m benchmarks.bench_logging --requests 20000
+
+Every request logs what get_reco and AccessMiddleware log. Records
+are written to a file, as stdout is when it is redirected.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+import typing as tp
+
+import numpy as np
+from starlette.datastructures import URL
+
+from service import log
+from service.log import access_logger, app_logger, setup_logging
+from service.settings import get_config
+
+
+async def emit(n_requests: int) -> np.ndarray:
+    stalls = np.zeros(n_requests)
+    for user_id in range(n_requests):
+        started_at = time.perf_counter()
+        app_logger.info(
+            "Request for model: %s, user_id: %s", "knn", user_id
+        )
+        access_logger.info(
+            msg="",
+            extra={
+                "request_time": 0.0012,
+                "status_code": 200,
+                "requested_url": URL(f"http://localhost/reco/knn/{user_id}"),
+                "method": "GET",
+            },
+        )
+        stalls[user_id] = time.perf_counter() - started_at
+        if user_id % 64 == 0:
+            # let other tasks run, as a server would
+            await asyncio.sleep(0)
+    return stalls
+
+
+def run(n_requests: int, **log_config: tp.Any) -> tp.Tuple[np.ndarray, float]:
+    config = get_config()
+    for name, value in log_config.items():
+        setattr(config.log_config, name, value)
+
+    stdout = sys.stdout
+    with tempfile.TemporaryFile("w") as sys.stdout:
+        try:
+            setup_logging(config)
+            started_at = time.perf_counter()
+            stalls = asyncio.run(emit(n_requests))
+            log.stop_queue_logging()
+            total = time.perf_counter() - started_at
+        finally:
+            sys.stdout = stdout
+    return stalls, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    cases: tp.Dict[str, tp.Dict[str, tp.Any]] = {
+        "sync handlers": {},
+        "queue": {"queue": True},
+        "queue, access sampled 10%": {
+            "queue": True, "access_sample_rate": 0.1
+        },
+    }
+    print(f"{'':28} {'mean':>9} {'p99':>9} {'max':>9} {'until written':>14}")
+    for name, log_config in cases.items():
+        stalls, total = run(args.requests, **log_config)
+        print(
+            f"{name:28} "
+            f"{stalls.mean() * 1e6:7.2f}us "
+            f"{np.quantile(stalls, 0.99) * 1e6:7.2f}us "
+            f"{stalls.max() * 1e6:7.0f}us "
+            f"{total:13.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
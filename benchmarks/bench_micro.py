@@ -0,0 +1,127 @@
+"""Micro-benchmarks of the model predict and response serialization paths.
+
+    python -m benchmarks.bench_micro --output micro.json
+    python -m benchmarks.bench_micro --baseline micro.json --threshold 20
+
+Models are loaded by the service classes from synthetic artifacts
+written by `benchmarks.fixtures`, so the numbers do not depend on the
+real artifacts. Every case is timed `--repeat` times, the fastest
+repeat is reported, it is the least disturbed by the rest of the
+machine. With `--baseline` the exit code is 1 when any case is slower
+than in the baseline by more than `--threshold` percent.
+"""
+import argparse
+import itertools
+import json
+import sys
+import tempfile
+import timeit
+import typing as tp
+
+import numpy as np
+
+from service.api.views import RecoResponse
+from service.reco_models.popular import CompactPopularModel
+from service.reco_models.reco_models import (
+    OfflineKnnModel,
+    OnlineKnnModel,
+    SimplePopularModel,
+)
+from service.response import DataclassJSONResponse, reco_response
+
+from .fixtures import write_model_fixtures
+
+Case = tp.Callable[[], tp.Any]
+
+
+def make_cases(path: str, seed: int = 0) -> tp.Dict[str, Case]:
+    paths = write_model_fixtures(path, seed=seed)
+    popular = SimplePopularModel(paths["popular_users"], paths["popular_recs"])
+    compact_popular = CompactPopularModel.from_pickles(
+        paths["popular_users"], paths["popular_recs"]
+    )
+    offline_knn = OfflineKnnModel(paths["knn"])
+    online_knn = OnlineKnnModel(paths["online_knn"])
+
+    rng = np.random.default_rng(seed)
+    user_ids = rng.choice(offline_knn.user_ids, size=1000).tolist()
+    next_user = itertools.cycle(user_ids).__next__
+    items = offline_knn.predict(user_ids[0])
+    content = {"user_id": user_ids[0], "items": items}
+    response = DataclassJSONResponse(content)
+
+    return {
+        "SimplePopularModel.predict":
+            lambda: popular.predict(next_user(), 10),
+        "CompactPopularModel.predict":
+            lambda: compact_popular.predict(next_user(), 10),
+        "OfflineKnnModel.predict": lambda: offline_knn.predict(next_user()),
+        "OnlineKnnModel.predict": lambda: online_knn.predict(next_user()),
+        "RecoResponse": lambda: RecoResponse(user_id=1, items=items),
+        "DataclassJSONResponse.render": lambda: response.render(content),
+        "reco_response": lambda: reco_response(1, items),
+    }
+
+
+def measure(case: Case, repeat: int) -> float:
+    """Fastest time of one call over `repeat` runs, in seconds."""
+    timer = timeit.Timer(case)
+    # enough calls for a run to take at least 0.2 seconds
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def find_regressions(
+    results: tp.Dict[str, float],
+    baseline: tp.Dict[str, float],
+    threshold: float,
+) -> tp.Dict[str, float]:
+    """Cases slower than in `baseline` by more than `threshold` percent."""
+    regressions = {}
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1
+        if change * 100 > threshold:
+            regressions[name] = change
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", nargs="+", help="default: all cases")
+    parser.add_argument("--output", help="write the results to JSON")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="allowed slowdown, percent")
+    args = parser.parse_args()
+
+    baseline: tp.Dict[str, float] = {}
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    with tempfile.TemporaryDirectory() as path:
+        cases = make_cases(path)
+        results = {}
+        for name in args.cases or cases:
+            results[name] = measure(cases[name], args.repeat)
+            change = ""
+            if name in baseline:
+                change = f"{results[name] / baseline[name] - 1:+8.1%}"
+            print(f"{name:30} {results[name] * 1e6:10.2f} us {change}")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"unit": "seconds", "results": results}, f, indent=2)
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regressed, slowdown in regressions.items():
+        print(f"REGRESSION {regressed}: {slowdown:+.1%} > {args.threshold}%")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Requests per second with BaseHTTPMiddleware and pure ASGI middlewares.
+
+    python -m benchmarks.bench_middlewares --requests 5000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import (
+    BaseHTTPMiddleware,
+    RequestResponseEndpoint,
+)
+from starlette.responses import Response
+
+from service.api import middlewares
+from service.api.app import create_app
+from service.log import access_logger, app_logger
+from service.models import Error
+from service.response import server_error
+from service.settings import get_config
+
+from .asgi import call
+
+AUTH_HEADERS = [("Authorization", "Bearer Team_5")]
+
+
+# the implementations the pure ASGI middlewares replaced
+class BaseAccessMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint,
+    ) -> Response:
+        started_at = time.perf_counter()
+        response = await call_next(request)
+        request_time = time.perf_counter() - started_at
+
+        access_logger.info(
+            msg="",
+            extra={
+                "request_time": round(request_time, 4),
+                "status_code": response.status_code,
+                "requested_url": request.url,
+                "method": request.method,
+            },
+        )
+        return response
+
+
+class BaseExceptionHandlerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint,
+    ) -> Response:
+        try:
+            return await call_next(request)
+        except Exception as e:  # pylint: disable=broad-except
+            app_logger.exception(
+                msg=f"Caught unhandled {e.__class__} exception: {e}"
+            )
+            error = Error(
+                error_key="server_error",
+                error_message="Internal Server Error"
+            )
+            return server_error([error])
+
+
+def use_base_http_middlewares(app: FastAPI) -> FastAPI:
+    replacements = {
+        middlewares.AccessMiddleware: BaseAccessMiddleware,
+        middlewares.ExceptionHandlerMiddleware: BaseExceptionHandlerMiddleware,
+    }
+    for middleware in app.user_middleware:
+        if middleware.cls in replacements:
+            middleware.cls = replacements[middleware.cls]
+            # e.g. log_timings, the replaced middlewares had no options
+            middleware.options = {}
+    app.middleware_stack = app.build_middleware_stack()
+    return app
+
+
+async def measure_rps(
+    app: FastAPI,
+    path: str,
+    n_requests: int,
+    concurrency: int,
+) -> float:
+    async def worker(n: int) -> None:
+        for _ in range(n):
+            response = await call(app, "GET", path, AUTH_HEADERS)
+            assert response.status_code == 200, response
+
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(worker(n_requests // concurrency) for _ in range(concurrency))
+    )
+    return n_requests / (time.perf_counter() - started_at)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    apps = {
+        "BaseHTTPMiddleware": use_base_http_middlewares(
+            create_app(get_config())
+        ),
+        "pure ASGI": create_app(get_config()),
+    }
+    # the log lines are the same for both stacks, keep them out of the way
+    logging.disable(logging.CRITICAL)
+
+    for path in ("/health", "/reco/test_model/123"):
+        results = {}
+        for name, app in apps.items():
+            # warm up
+            asyncio.run(measure_rps(app, path, 200, args.concurrency))
+            results[name] = asyncio.run(
+                measure_rps(app, path, args.requests, args.concurrency)
+            )
+        before, after = results["BaseHTTPMiddleware"], results["pure ASGI"]
+        print(
+            f"{path:24} before {before:8.0f} rps   after {after:8.0f} rps"
+            f"   {after / before:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
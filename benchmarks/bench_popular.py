@@ -0,0 +1,99 @@
+"""Memory and latency of the popular model: pickled dicts vs arrays.
+
+    python -m benchmarks.bench_popular --iterations 20000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+import typing as tp
+from functools import partial
+
+import numpy as np
+
+from config.configuration import POPULAR_MODEL_RECS, POPULAR_MODEL_USERS
+from service.reco_models.popular import CompactPopularModel, PopularModel
+from service.reco_models.reco_models import SimplePopularModel
+
+
+def allocated(fn: tp.Callable[[], tp.Any]) -> tp.Tuple[tp.Any, int]:
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def timeit(fn: tp.Callable[[], tp.Any], iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started_at) / iterations
+
+
+def predict_next(
+    model: PopularModel, users: tp.Iterator[int], k_recs: int
+) -> tp.List[int]:
+    return model.predict(next(users), k_recs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--k-recs", type=int, default=10)
+    args = parser.parse_args()
+
+    simple, simple_size = allocated(
+        lambda: SimplePopularModel(POPULAR_MODEL_USERS, POPULAR_MODEL_RECS)
+    )
+    compact, compact_size = allocated(
+        lambda: CompactPopularModel.from_dictionaries(
+            simple.users_dictionary, simple.popular_dictionary
+        )
+    )
+    print(f"{'dicts':28} {simple_size / 2**20:8.2f} MB")
+    print(
+        f"{'arrays':28} {compact_size / 2**20:8.2f} MB "
+        f"({compact.nbytes / 2**20:.2f} MB of array data)"
+    )
+
+    rng = np.random.default_rng(0)
+    known = np.array(list(simple.users_dictionary), dtype=np.int64)
+    # half of the requests come from users without a category
+    user_ids = np.where(
+        rng.random(args.batch_size) < 0.5,
+        rng.choice(known, args.batch_size),
+        rng.integers(0, 10**6, args.batch_size),
+    ).tolist()
+    assert compact.predict_batch(user_ids, args.k_recs) == (
+        simple.predict_batch(user_ids, args.k_recs)
+    )
+
+    for name, model in (("dicts", simple), ("arrays", compact)):
+        users = iter(user_ids * (args.iterations // len(user_ids) + 1))
+        elapsed = timeit(
+            partial(predict_next, model, users, args.k_recs),
+            args.iterations,
+        )
+        print(f"{'predict: ' + name:28} {elapsed * 1e6:8.2f} us")
+
+    batch_iterations = max(1, args.iterations // 100)
+    cases = {
+        "predict_batch: dicts":
+            lambda: simple.predict_batch(user_ids, args.k_recs),
+        "predict_batch: arrays":
+            lambda: compact.predict_batch(user_ids, args.k_recs),
+    }
+    for name, fn in cases.items():
+        elapsed = timeit(fn, batch_iterations)
+        print(
+            f"{name:28} {elapsed * 1e6:8.2f} us "
+            f"per {args.batch_size} users"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Per-request cost of building a recommendation or an error response.
+
+    python -m benchmarks.bench_response --iterations 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+import typing as tp
+
+import numpy as np
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel
+
+from service.api.views import RecoResponse, get_reco, router
+from service.models import Error
+from service.response import DataclassJSONResponse, reco_response
+
+
+# the stdlib json based render orjson replaced
+class EnhancedJSONEncoder(json.JSONEncoder):
+    def default(self, o: tp.Any) -> tp.Any:
+        if isinstance(o, BaseModel):
+            return o.dict()
+        try:
+            orjson.dumps(o)
+        except TypeError:
+            return str(o)
+        return super().default(o)
+
+
+class LegacyDataclassJSONResponse(JSONResponse):
+    def render(self, content: tp.Any) -> bytes:
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+            cls=EnhancedJSONEncoder,
+        ).encode("utf-8")
+
+
+def timeit(fn: tp.Callable[[], tp.Any], iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started_at) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    [route] = [
+        route for route in router.routes
+        if isinstance(route, APIRoute) and route.endpoint is get_reco
+    ]
+    user_id = 123
+    items = list(range(10))
+    items_array = np.arange(10, dtype=np.int32)
+    errors = [
+        Error(error_key="user_not_found", error_message="User is unknown")
+    ]
+
+    async def pydantic_path() -> bytes:
+        # what FastAPI did with the RecoResponse returned by get_reco
+        content = await serialize_response(
+            field=route.secure_cloned_response_field,
+            response_content=RecoResponse(user_id=user_id, items=items),
+        )
+        return JSONResponse(content).body
+
+    async def pydantic_path_loop() -> float:
+        started_at = time.perf_counter()
+        for _ in range(args.iterations):
+            await pydantic_path()
+        return (time.perf_counter() - started_at) / args.iterations
+
+    assert asyncio.run(pydantic_path()) == reco_response(user_id, items).body
+    print(
+        f"{'reco: pydantic + json':28} "
+        f"{asyncio.run(pydantic_path_loop()) * 1e6:8.2f} us"
+    )
+    cases: tp.Dict[str, tp.Callable[[], bytes]] = {
+        "reco: orjson": lambda: reco_response(user_id, items).body,
+        "reco: orjson, numpy items":
+            lambda: reco_response(user_id, items_array).body,
+        "error: json encoder":
+            lambda: LegacyDataclassJSONResponse({"errors": errors}).body,
+        "error: orjson":
+            lambda: DataclassJSONResponse({"errors": errors}).body,
+    }
+    assert reco_response(user_id, items_array).body == (
+        reco_response(user_id, items).body
+    )
+    for name, fn in cases.items():
+        fn()
+        print(f"{name:28} {timeit(fn, args.iterations) * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
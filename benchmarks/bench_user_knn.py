@@ -0,0 +1,93 @@
+"""UserKnn engine against the pandas path of the notebook model.
+
+    python -m benchmarks.bench_user_knn --users 20000 --requests 500
+
+Reports the artifact size and load time of the dill'd notebook model
+and of the engine directory, and the latency of a request.
+"""
+import argparse
+import os
+import tempfile
+import time
+import typing as tp
+
+import dill
+import numpy as np
+
+from service.reco_models.user_knn import UserKnn
+
+from .fixtures import make_pandas_user_knn
+
+
+def timeit(
+    predict: tp.Callable[[int], tp.Any],
+    user_ids: tp.Sequence[int],
+) -> float:
+    started_at = time.perf_counter()
+    for user_id in user_ids:
+        predict(user_id)
+    return (time.perf_counter() - started_at) / len(user_ids)
+
+
+def size_mb(path: str) -> float:
+    if os.path.isdir(path):
+        size = sum(
+            os.path.getsize(os.path.join(path, name))
+            for name in os.listdir(path)
+        )
+    else:
+        size = os.path.getsize(path)
+    return size / 2**20
+
+
+def load_seconds(load: tp.Callable[[], tp.Any]) -> float:
+    started_at = time.perf_counter()
+    load()
+    return time.perf_counter() - started_at
+
+
+def load_dill(path: str) -> tp.Any:
+    with open(path, "rb") as f:
+        return dill.load(f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--neighbours", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    legacy = make_pandas_user_knn(args.users, args.items, args.neighbours)
+    engine = UserKnn.from_user_knn_bm25(legacy)
+
+    with tempfile.TemporaryDirectory() as path:
+        dill_path = os.path.join(path, "user-knn.dill")
+        engine_path = os.path.join(path, "user-knn-engine")
+        with open(dill_path, "wb") as f:
+            dill.dump(legacy, f)
+        engine.save(engine_path)
+        print(f"dill:     {size_mb(dill_path):8.1f} MB, loaded in "
+              f"{load_seconds(lambda: load_dill(dill_path)) * 1e3:.1f} ms")
+        print(f"UserKnn:  {size_mb(engine_path):8.1f} MB, loaded in "
+              f"{load_seconds(lambda: UserKnn.load(engine_path)) * 1e3:.1f}"
+              " ms")
+
+    rng = np.random.default_rng(1)
+    user_ids = rng.choice(engine.user_ids, size=args.requests).tolist()
+    mismatches = sum(
+        legacy.predict(user_id) != engine.predict(user_id)
+        for user_id in user_ids
+    )
+
+    pandas_time = timeit(legacy.predict, user_ids)
+    engine_time = timeit(engine.predict, user_ids)
+    print(f"pandas:   {pandas_time * 1e3:8.3f} ms/request")
+    print(f"UserKnn:  {engine_time * 1e3:8.3f} ms/request")
+    print(f"speedup:  {pandas_time / engine_time:8.1f}x")
+    print(f"mismatches: {mismatches} of {len(user_ids)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Small synthetic models for benchmarks and tests.
+
+Real artifacts are built in the notebooks from the KION dataset and are
+not stored in git, so everything here is generated from a seed.
+"""
+import os
+import pickle
+import typing as tp
+from collections import Counter
+
+import dill
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+class SimilarityModel:
+    """Stand-in for a fitted `implicit` ItemItemRecommender."""
+
+    def __init__(self, similarity: sp.csr_matrix) -> None:
+        self.similarity = similarity
+
+    def similar_items(
+        self,
+        itemid: int,
+        N: int = 10,
+    ) -> tp.List[tp.Tuple[int, float]]:
+        start, stop = self.similarity.indptr[itemid:itemid + 2]
+        pairs = zip(
+            self.similarity.indices[start:stop],
+            self.similarity.data[start:stop],
+        )
+        return sorted(pairs, key=lambda x: -x[1])[:N]
+
+
+class PandasUserKnn:  # pylint: disable=too-many-instance-attributes
+    """
+    The pandas prediction path of `UserKnnBM25` from
+    notebooks/hw_3_userknn.ipynb, used as the reference implementation.
+
+    The only difference is a stable sort by IDF, so that ties are
+    resolved deterministically.
+    """
+
+    def __init__(
+        self,
+        interactions: pd.DataFrame,
+        similarity: sp.csr_matrix,
+        N_users: int,
+    ) -> None:
+        self.N_users = N_users
+        self.users_inv_mapping = dict(
+            enumerate(interactions["user_id"].unique())
+        )
+        self.users_mapping = {
+            v: k for k, v in self.users_inv_mapping.items()
+        }
+        self.items_inv_mapping = dict(
+            enumerate(interactions["item_id"].unique())
+        )
+        self.items_mapping = {
+            v: k for k, v in self.items_inv_mapping.items()
+        }
+        self.watched = interactions.groupby("user_id").agg(
+            {"item_id": tuple}
+        )
+        self.n = interactions.shape[0]
+        item_cnt = Counter(interactions["item_id"].values)
+        item_idf = pd.DataFrame.from_dict(
+            item_cnt, orient="index", columns=["doc_freq"]
+        ).reset_index()
+        item_idf["idf"] = np.log(
+            (1 + self.n) / (1 + item_idf["doc_freq"]) + 1
+        )
+        self.item_idf = item_idf
+        self.user_knn = SimilarityModel(similarity)
+
+    def _get_similar_users(self, user_id: int) -> tp.List[int]:
+        internal_user_id = self.users_mapping[user_id]
+        recs = self.user_knn.similar_items(internal_user_id, N=self.N_users)
+        return [self.users_inv_mapping[user] for user, _ in recs]
+
+    def predict(
+        self,
+        user_id: int,
+        N_recs: int = 10,
+    ) -> tp.Optional[tp.List[int]]:
+        if user_id not in self.users_mapping:
+            return None
+
+        recs = pd.DataFrame({
+            "user_id": user_id,
+            "sim_user_id": self._get_similar_users(user_id),
+        })
+        recs = recs.merge(
+            self.watched,
+            left_on=["sim_user_id"],
+            right_on=["user_id"],
+            how="left",
+        ) \
+            .drop(["sim_user_id"], axis=1) \
+            .explode("item_id") \
+            .drop_duplicates(["item_id"], keep="first") \
+            .merge(
+                self.watched,
+                left_on=["user_id"],
+                right_on=["user_id"],
+                how="left",
+            )
+        recs = recs[
+            recs.apply(lambda x: x["item_id_x"] not in x["item_id_y"], axis=1)
+        ] \
+            .drop(["item_id_y"], axis=1) \
+            .merge(
+                self.item_idf,
+                left_on="item_id_x",
+                right_on="index",
+                how="left",
+            )
+        recs = recs.sort_values(["idf"], ascending=True, kind="stable")
+        return recs["item_id_x"][:N_recs].tolist()
+
+
+def make_interactions(
+    n_users: int = 2000,
+    n_items: int = 500,
+    mean_history: int = 20,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 2 * mean_history, size=n_users)
+    # Zipf-like item popularity, like in the real catalogue
+    popularity = 1 / np.arange(1, n_items + 1)
+    popularity /= popularity.sum()
+    user_ids = rng.permutation(10 * n_users)[:n_users]
+    rows: tp.List[tp.Tuple[int, int]] = []
+    for user_id, length in zip(user_ids, lengths):
+        items = rng.choice(
+            n_items, size=min(length, n_items), replace=False, p=popularity
+        )
+        rows.extend((user_id, 1000 + item) for item in items)
+    return pd.DataFrame(rows, columns=["user_id", "item_id"])
+
+
+def make_similarity(
+    n_users: int,
+    n_neighbours: int = 20,
+    seed: int = 0,
+) -> sp.csr_matrix:
+    rng = np.random.default_rng(seed)
+    rows: tp.List[int] = []
+    cols: tp.List[int] = []
+    data: tp.List[float] = []
+    for user in range(n_users):
+        neighbours = rng.choice(n_users, size=n_neighbours, replace=False)
+        neighbours = np.union1d(neighbours, [user])
+        scores = rng.random(len(neighbours)).astype(np.float32)
+        # a user is always the most similar to itself, as in BM25
+        scores[neighbours == user] = 2.0
+        rows.extend([user] * len(neighbours))
+        cols.extend(neighbours)
+        data.extend(scores)
+    return sp.csr_matrix((data, (rows, cols)), shape=(n_users, n_users))
+
+
+def make_pandas_user_knn(
+    n_users: int = 2000,
+    n_items: int = 500,
+    n_neighbours: int = 20,
+    seed: int = 0,
+) -> PandasUserKnn:
+    interactions = make_interactions(n_users, n_items, seed=seed)
+    similarity = make_similarity(
+        interactions["user_id"].nunique(), n_neighbours, seed=seed
+    )
+    return PandasUserKnn(interactions, similarity, N_users=n_neighbours)
+
+
+def make_popular_dictionaries(
+    user_ids: tp.Sequence[int],
+    n_items: int = 500,
+    n_categories: int = 20,
+    n_recs: int = 100,
+    seed: int = 0,
+) -> tp.Tuple[tp.Dict[int, str], tp.Dict[str, tp.List[int]]]:
+    """users_dictionary and popular_dictionary of SimplePopularModel."""
+    rng = np.random.default_rng(seed)
+    categories = [f"category_{i}" for i in range(n_categories)]
+    popular_dictionary = {
+        category: (1000 + rng.permutation(n_items)[:n_recs]).tolist()
+        for category in categories + ["popular_for_all"]
+    }
+    # a tenth of the users belongs to no category
+    codes = rng.integers(0, n_categories + n_categories // 10, len(user_ids))
+    users_dictionary = {
+        int(user_id): categories[code]
+        for user_id, code in zip(user_ids, codes)
+        if code < n_categories
+    }
+    return users_dictionary, popular_dictionary
+
+
+def make_offline_recs(
+    user_ids: tp.Sequence[int],
+    n_items: int = 500,
+    k_recs: int = 10,
+    seed: int = 0,
+) -> tp.Dict[int, tp.List[int]]:
+    """Offline knn dictionary of user id -> recommended items."""
+    rng = np.random.default_rng(seed)
+    return {
+        int(user_id): (1000 + rng.permutation(n_items)[:k_recs]).tolist()
+        for user_id in user_ids
+    }
+
+
+def write_model_fixtures(
+    path: str,
+    n_users: int = 2000,
+    n_items: int = 500,
+    seed: int = 0,
+) -> tp.Dict[str, str]:
+    """
+    Write synthetic artifacts in the formats of the notebook artifacts
+    to `path`, the paths are returned by the name of the artifact,
+    as in the manifest.
+    """
+    interactions = make_interactions(n_users, n_items, seed=seed)
+    user_ids = interactions["user_id"].unique()
+    users_dictionary, popular_dictionary = make_popular_dictionaries(
+        user_ids, n_items, seed=seed
+    )
+    paths = {
+        "popular_users": os.path.join(path, "users_dictionary.pickle"),
+        "popular_recs": os.path.join(path, "popular_dictionary.pickle"),
+        "knn": os.path.join(path, "offline-knn.dill"),
+        "online_knn": os.path.join(path, "user-knn.dill"),
+    }
+    similarity = make_similarity(len(user_ids), seed=seed)
+    artifacts = {
+        "popular_users": (pickle, users_dictionary),
+        "popular_recs": (pickle, popular_dictionary),
+        "knn": (dill, make_offline_recs(user_ids, n_items, seed=seed)),
+        "online_knn": (
+            dill, PandasUserKnn(interactions, similarity, N_users=20)
+        ),
+    }
+    os.makedirs(path, exist_ok=True)
+    for name, (module, artifact) in artifacts.items():
+        with open(paths[name], "wb") as f:
+            module.dump(artifact, f)
+    return paths
@@ -1,6 +1,25 @@
 
+# versioned artifacts, <MODEL_VERSIONS_PATH>/CURRENT names the version
+# to serve, the paths below are used when there is no such file
+MODEL_VERSIONS_PATH = "models/versions"
+
 POPULAR_MODEL_RECS = "models/popular_dictionary.pickle"
 POPULAR_MODEL_USERS = "models/users_dictionary.pickle"
+# output of `python -m service.reco_models.popular`, used instead of
+# the pickles when the directory exists
+POPULAR_MODEL_COMPACT_PATH = "models/popular-compact"
 
 OFFLINE_KNN_MODEL_PATH = "models/offline-dictionary-with-hot-knn-recs.dill"
+# output of `python -m service.reco_models.columnar`,
+# used instead of OFFLINE_KNN_MODEL_PATH when the directory exists
+OFFLINE_KNN_COLUMNAR_PATH = "models/offline-knn-columnar"
+# output of `python -m service.reco_models.response_store`, used by the
+# prebuilt responses mode, built at startup when the directory is missing
+PREBUILT_RESPONSES_PATH = "models/knn-responses"
 ONLINE_KNN_MODEL_PATH = "models/user-knn.dill"
+# output of `python -m service.reco_models.user_knn convert`,
+# used instead of ONLINE_KNN_MODEL_PATH when the directory exists
+ONLINE_KNN_ENGINE_PATH = "models/user-knn-engine"
+# output of `python -m service.reco_models.hnsw build`, searched for the
+# neighbours of the engine when ServiceConfig.online_knn_hnsw_ef is set
+ONLINE_KNN_HNSW_PATH = "models/user-knn-hnsw"
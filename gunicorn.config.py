@@ -1,7 +1,8 @@
+import gc
 from multiprocessing import cpu_count
 from os import getenv as env
 
-from service import log, settings
+from service import log, metrics, settings
 
 # The socket to bind.
 host = env("HOST", "0.0.0.0")
@@ -72,6 +73,8 @@ limit_request_fields = env("GUNICORN_LIMIT_REQUEST_FIELDS", 64)
 limit_request_field_size = env("GUNICORN_LIMIT_REQUEST_FIELD_SIZE", 128)
 
 # Load application code before the worker processes are forked.
+# Set PRELOAD_MODELS=true as well to load the models in the master,
+# restarted workers then do not load them again.
 preload_app = env("GUNICORN_PRELOAD_APP", False)
 
 # Disables the use of sendfile.
@@ -103,3 +106,19 @@ tmp_upload_dir = env("GUNICORN_TMP_UPLOAD_DIR", None)
 
 # Front-end’s IPs from which allowed to handle set secure headers.
 forwarded_allow_ips = env("GUNICORN_FORWARDER_ALLOW_IPS", "127.0.0.1")
+
+
+def on_starting(server) -> None:
+    metrics.clear_multiprocess_dir(
+        settings.get_config().metrics_config.multiprocess_dir
+    )
+
+
+def pre_fork(server, worker) -> None:
+    # the setting parsed by gunicorn, preload_app above is the raw
+    # environment string and "false" is truthy
+    if server.cfg.preload_app:
+        # objects loaded by the master are moved out of the tracked
+        # generations, so the gc of a worker never writes to their pages
+        # and they stay shared with the master
+        gc.freeze()
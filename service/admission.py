@@ -0,0 +1,156 @@
+import asyncio
+import time
+import typing as tp
+from collections import deque
+
+from .settings import AdmissionConfig
+
+CONCURRENCY = "concurrency"
+RATE = "rate"
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, name: str, reason: str) -> None:
+        self.name = name
+        self.reason = reason
+        super().__init__(f"{name}: {reason}")
+
+
+class AdmissionLimiter:  # pylint: disable=too-many-instance-attributes
+    """
+    Concurrency limit and token bucket of one model.
+
+    At most `max_concurrency` requests are admitted at once, the next
+    `max_queue_size` ones wait in FIFO order for at most `max_wait_ms`,
+    the rest are rejected with `AdmissionRejected` right away. With
+    `rate` requests are also admitted at most `rate` per second on
+    average, with bursts of up to `burst` requests. Used from the event
+    loop thread only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: tp.Optional[int],
+        max_queue_size: int,
+        max_wait_ms: float,
+        rate: tp.Optional[float] = None,
+        burst: tp.Optional[float] = None,
+        clock: tp.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_wait_ms = max_wait_ms
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 0.0, 1.0)
+        self.clock = clock
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {CONCURRENCY: 0, RATE: 0}
+        self._tokens = self.burst
+        self._refilled_at = clock()
+        self._waiters: "tp.Deque[asyncio.Future]" = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.rate is not None:
+            await self._take_token()
+        if self.max_concurrency is not None and (
+            self.in_flight >= self.max_concurrency or self._waiters
+        ):
+            await self._wait_for_slot()
+        else:
+            self.in_flight += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        # the slot passes to the longest waiting request that is still
+        # there, so new requests cannot overtake the waiting ones
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def _wait_for_slot(self) -> None:
+        if len(self._waiters) >= self.max_queue_size:
+            self._reject(CONCURRENCY)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.max_wait_ms / 1000)
+        except asyncio.TimeoutError:
+            self._reject(CONCURRENCY)
+        except BaseException:
+            # cancelled right after the slot was handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    async def _take_token(self) -> None:
+        assert self.rate is not None
+        now = self.clock()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+        # the token is taken now, the request waits until it is refilled
+        self._tokens -= 1.0
+        if self._tokens >= 0.0:
+            return
+        delay = -self._tokens / self.rate
+        if delay * 1000 > self.max_wait_ms:
+            self._tokens += 1.0
+            self._reject(RATE)
+        await asyncio.sleep(delay)
+
+    def _reject(self, reason: str) -> tp.NoReturn:
+        self.rejected[reason] += 1
+        raise AdmissionRejected(self.name, reason)
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size,
+            "max_wait_ms": self.max_wait_ms,
+            "rate": self.rate,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class AdmissionControl:
+    """Limiters of the models listed in the config, one per model."""
+
+    def __init__(self, config: AdmissionConfig) -> None:
+        self.config = config
+        self._limiters: tp.Dict[str, AdmissionLimiter] = {}
+        if config.enabled:
+            for name in {**config.max_concurrency, **config.rates}:
+                self._limiters[name] = AdmissionLimiter(
+                    name=name,
+                    max_concurrency=config.max_concurrency.get(name),
+                    max_queue_size=config.max_queue_size,
+                    max_wait_ms=config.max_wait_ms,
+                    rate=config.rates.get(name),
+                    burst=config.bursts.get(name),
+                )
+
+    def get(self, model_name: str) -> tp.Optional[AdmissionLimiter]:
+        return self._limiters.get(model_name)
+
+    def stats(self) -> tp.Dict[str, tp.Dict[str, tp.Any]]:
+        return {
+            name: limiter.stats() for name, limiter in self._limiters.items()
+        }
@@ -0,0 +1,110 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Request
+from fastapi.responses import Response
+from fastapi.security.http import HTTPAuthorizationCredentials
+from pydantic import BaseModel, validator
+
+from config.configuration import MODEL_VERSIONS_PATH
+from service.api.auth import bearer_scheme, check_admin_token
+from service.api.exceptions import ModelVersionNotFoundError
+from service.api.responses import responses
+from service.log import app_logger
+from service.model_loading import load_response_store, model_registry
+from service.reco_models.manifest import (
+    Manifest,
+    check_version,
+    load_version,
+    read_current_version,
+    write_current_version,
+)
+from service.response import DataclassJSONResponse
+
+
+class ReloadRequest(BaseModel):
+    # None reloads the version named in the CURRENT file
+    version: Optional[str] = None
+
+    @validator("version")
+    def version_is_a_directory_name(  # pylint: disable=no-self-argument
+        cls, version: Optional[str],
+    ) -> Optional[str]:
+        return None if version is None else check_version(version)
+
+
+class ReloadResponse(BaseModel):
+    version: str
+
+
+router = APIRouter()
+
+
+@router.post(
+    path="/admin/models/reload",
+    tags=["Admin"],
+    response_model=ReloadResponse,
+    responses=responses,  # type: ignore
+)
+async def reload_models(
+    request: Request,
+    reload_request: ReloadRequest,
+    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> Response:
+    check_admin_token(request.app, token.credentials)
+
+    version = reload_request.version
+    if version is None:
+        version = read_current_version(MODEL_VERSIONS_PATH)
+    if version is None:
+        raise ModelVersionNotFoundError(
+            error_message="No version to reload, CURRENT file is missing"
+        )
+    try:
+        manifest = load_version(MODEL_VERSIONS_PATH, version)
+    except (OSError, ValueError) as e:
+        raise ModelVersionNotFoundError(error_message=str(e))
+
+    await switch_models(request.app, manifest)
+    # the other workers follow the CURRENT file
+    write_current_version(MODEL_VERSIONS_PATH, version)
+    return DataclassJSONResponse({"version": version})
+
+
+async def switch_models(app: FastAPI, manifest: Manifest) -> None:
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, model_registry.reload, manifest)
+    if app.state.response_store is not None:
+        models = model_registry.current()
+        response_store = await loop.run_in_executor(
+            None, load_response_store, models, app.state.k_recs
+        )
+        app.state.response_store = response_store
+        app.state.response_store_version = models.version
+    app.state.reco_cache.invalidate()
+    # process pools are forked again, with the models of the new version
+    app.state.inference.shutdown()
+    app_logger.info("Switched to model version %s", manifest.version)
+
+
+async def watch_model_version(app: FastAPI, interval_seconds: float) -> None:
+    failed_version = None
+    while True:
+        await asyncio.sleep(interval_seconds)
+        version = read_current_version(MODEL_VERSIONS_PATH)
+        if version in (None, model_registry.version, failed_version):
+            continue
+        try:
+            await switch_models(
+                app, load_version(MODEL_VERSIONS_PATH, version)
+            )
+        except Exception:  # pylint: disable=broad-except
+            # not retried until CURRENT names another version
+            app_logger.exception(
+                "Failed to switch to model version %s", version
+            )
+            failed_version = version
+
+
+def add_admin_views(app: FastAPI) -> None:
+    app.include_router(router)
@@ -1,14 +1,29 @@
 import asyncio
 from concurrent.futures.thread import ThreadPoolExecutor
+from functools import partial
 from typing import Any, Dict
 
 import uvloop
 from fastapi import FastAPI
 
+from ..admission import AdmissionControl
+from ..batching import MicroBatcher
+from ..cache import RecoCache
+from ..inference import InferenceExecutors
 from ..log import app_logger, setup_logging
-from ..settings import ServiceConfig
+from ..metrics import MODEL_LOAD_SECONDS, registry, write_snapshots
+from ..model_loading import load_response_store, model_registry, popular_stream
+from ..reco_models.streaming_popular import (
+    PopularityWindow,
+    StreamingPopularity,
+)
+from ..recommend import recommend_batch
+from ..settings import PopularityConfig, ServiceConfig
+from .admin import add_admin_views, watch_model_version
+from .debug import add_debug_views
+from .events import add_event_views, publish_popularity, tail_events
 from .exception_handlers import add_exception_handlers
-from .middlewares import add_middlewares
+from .middlewares import add_middlewares, add_profile_middleware
 from .views import add_views
 
 __all__ = ("create_app",)
@@ -23,21 +38,160 @@ def setup_asyncio(thread_name_prefix: str) -> None:
     loop.set_default_executor(executor)
 
     def handler(_, context: Dict[str, Any]) -> None:
-        message = "Caught asyncio exception: {message}".format_map(context)
-        app_logger.warning(message)
+        app_logger.warning("Caught asyncio exception: %(message)s", context)
 
     loop.set_exception_handler(handler)
 
 
+def add_metrics_loop(app: FastAPI) -> None:
+    def start() -> None:
+        registry.loop = asyncio.get_event_loop()
+
+    def stop() -> None:
+        registry.loop = None
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", stop)
+
+
+def add_metrics_writer(app: FastAPI, interval_seconds: float) -> None:
+    tasks = []
+
+    def start() -> None:
+        tasks.append(asyncio.ensure_future(
+            write_snapshots(registry, interval_seconds)
+        ))
+
+    def stop() -> None:
+        for task in tasks:
+            task.cancel()
+        registry.write_snapshot()
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", stop)
+
+
+def add_model_loader(app: FastAPI) -> None:
+    def on_done(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            app_logger.error(
+                "Failed to load models: %s", future.exception()
+            )
+
+    def start() -> None:
+        # in a thread, so that /health answers while models are loading
+        future = asyncio.get_event_loop().run_in_executor(
+            None, model_registry.load, app.state.eager_models
+        )
+        future.add_done_callback(on_done)
+
+    app.add_event_handler("startup", start)
+
+
+def add_model_watcher(app: FastAPI, interval_seconds: float) -> None:
+    tasks = []
+
+    def start() -> None:
+        tasks.append(asyncio.ensure_future(
+            watch_model_version(app, interval_seconds)
+        ))
+
+    def stop() -> None:
+        for task in tasks:
+            task.cancel()
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", stop)
+
+
+def add_popularity_stream(
+    app: FastAPI,
+    config: PopularityConfig,
+    k_recs: int,
+) -> None:
+    popular_stream.engine = StreamingPopularity(
+        base=lambda: model_registry.get("popular"),
+        window=PopularityWindow(config.bucket_seconds, config.window_buckets),
+        # ServiceConfig.k_recs, the snapshots serve every fallback
+        k_recs=k_recs,
+    )
+    tasks = []
+
+    def start() -> None:
+        tasks.append(asyncio.ensure_future(
+            publish_popularity(config.publish_interval_seconds)
+        ))
+        if config.events_path is not None:
+            tasks.append(asyncio.ensure_future(
+                tail_events(config.events_path, config.tail_interval_seconds)
+            ))
+
+    def stop() -> None:
+        for task in tasks:
+            task.cancel()
+
+    app.add_event_handler("startup", start)
+    app.add_event_handler("shutdown", stop)
+    add_event_views(app)
+
+
 def create_app(config: ServiceConfig) -> FastAPI:
     setup_logging(config)
     setup_asyncio(thread_name_prefix=config.service_name)
 
     app = FastAPI(debug=False)
+    # before the model loader, so that its load times go through the loop
+    add_metrics_loop(app)
     app.state.k_recs = config.k_recs
+    app.state.max_batch_size = config.max_batch_size
+    app.state.eager_models = config.eager_models
+    app.state.latency_budgets_ms = config.latency_budgets_ms
+    app.state.admin_token = config.admin_token
+    model_registry.warm_up_user_ids = config.warm_up_user_ids
+    model_registry.loader_options["online_knn"] = {
+        "hnsw_ef": config.online_knn_hnsw_ef,
+    }
+    model_registry.warm_up_options["popular"] = {"k_recs": config.k_recs}
+    if config.preload_models:
+        model_registry.load(config.eager_models)
+    else:
+        add_model_loader(app)
+    app.state.inference = InferenceExecutors(config.inference_config)
+    app.add_event_handler("shutdown", app.state.inference.shutdown)
+    app.state.reco_cache = RecoCache(config.cache_config)
+    app.state.admission = AdmissionControl(config.admission_config)
+    app.state.response_store = None
+    app.state.response_store_version = None
+    if config.prebuilt_responses:
+        models = model_registry.current()
+        with MODEL_LOAD_SECONDS.time("knn_responses"):
+            app.state.response_store = load_response_store(
+                models, config.k_recs
+            )
+        app.state.response_store_version = models.version
+    app.state.batchers = {}
+    if config.online_knn_max_batch_size > 1:
+        app.state.batchers["online_knn"] = MicroBatcher(
+            partial(recommend_batch, app, "online_knn"),
+            max_batch_size=config.online_knn_max_batch_size,
+            max_wait_ms=config.online_knn_max_wait_ms,
+        )
+
+    if config.model_watch_interval_seconds is not None:
+        add_model_watcher(app, config.model_watch_interval_seconds)
+    popular_stream.engine = None
+    if config.popularity_config.enabled:
+        add_popularity_stream(app, config.popularity_config, config.k_recs)
+    registry.multiprocess_dir = config.metrics_config.multiprocess_dir
+    if registry.multiprocess_dir is not None:
+        add_metrics_writer(app, config.metrics_config.flush_interval_seconds)
 
     add_views(app)
-    add_middlewares(app)
+    add_admin_views(app)
+    add_middlewares(app, log_timings=config.log_config.access_timings)
+    if config.profiling and config.admin_token is not None:
+        add_debug_views(app)
+        add_profile_middleware(app, config.admin_token)
     add_exception_handlers(app)
 
     return app
@@ -0,0 +1,44 @@
+import hmac
+import typing as tp
+
+from fastapi import FastAPI
+from fastapi.security import HTTPBearer
+
+from service.api.exceptions import BearerAccessTokenError
+
+# the token of the recommendation endpoints
+USER_TOKEN = "Team_5"
+BEARER_PREFIX = b"bearer "
+
+bearer_scheme = HTTPBearer()
+
+
+def token_matches(token: tp.Union[str, bytes], expected: str) -> bool:
+    # in constant time, a timing does not tell how much of it is right
+    if isinstance(token, str):
+        token = token.encode()
+    return hmac.compare_digest(token, expected.encode())
+
+
+def is_admin(app: FastAPI, token: tp.Union[str, bytes]) -> bool:
+    """Admin-gated features are disabled without an admin token."""
+    admin_token = app.state.admin_token
+    return admin_token is not None and token_matches(token, admin_token)
+
+
+def bearer_token(authorization: bytes) -> tp.Optional[bytes]:
+    """The token of an `Authorization: Bearer <token>` header value."""
+    if authorization[:len(BEARER_PREFIX)].lower() != BEARER_PREFIX:
+        return None
+    return authorization[len(BEARER_PREFIX):].strip()
+
+
+def check_user_token(app: FastAPI, token: str) -> None:
+    # the admin token is accepted too, e.g. by profiled requests
+    if not (token_matches(token, USER_TOKEN) or is_admin(app, token)):
+        raise BearerAccessTokenError()
+
+
+def check_admin_token(app: FastAPI, token: str) -> None:
+    if not is_admin(app, token):
+        raise BearerAccessTokenError()
@@ -0,0 +1,38 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, FastAPI, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.security.http import HTTPAuthorizationCredentials
+
+from service.api.auth import bearer_scheme, check_admin_token
+from service.api.responses import responses
+from service.profiling import format_collapsed, sample_stacks
+
+MAX_PROFILE_SECONDS = 60
+
+router = APIRouter()
+
+
+@router.get(
+    path="/debug/profile",
+    tags=["Admin"],
+    response_class=PlainTextResponse,
+    responses=responses,  # type: ignore
+)
+async def profile(
+    request: Request,
+    seconds: float = Query(1.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(5.0, ge=1),
+    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> Response:
+    check_admin_token(request.app, token.credentials)
+
+    # samples the stacks of every thread of this worker process
+    stacks = await asyncio.get_running_loop().run_in_executor(
+        None, sample_stacks, seconds, interval_ms / 1000
+    )
+    return PlainTextResponse(format_collapsed(stacks))
+
+
+def add_debug_views(app: FastAPI) -> None:
+    app.include_router(router)
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Request
+from fastapi.responses import Response
+from fastapi.security.http import HTTPAuthorizationCredentials
+from pydantic import BaseModel
+
+from service.api.auth import bearer_scheme, check_admin_token
+from service.api.exceptions import BatchTooLargeError
+from service.api.responses import responses
+from service.log import app_logger
+from service.model_loading import load_models, popular_stream
+from service.reco_models.streaming_popular import EventFileReader, parse_event
+from service.response import DataclassJSONResponse
+
+
+class Event(BaseModel):
+    user_id: int
+    item_id: int
+    # unix time, the time of the request by default
+    timestamp: Optional[float] = None
+
+
+class EventsRequest(BaseModel):
+    events: List[Event]
+
+
+class EventsResponse(BaseModel):
+    accepted: int
+    dropped: int
+
+
+router = APIRouter()
+
+
+@router.post(
+    path="/events",
+    tags=["Admin"],
+    response_model=EventsResponse,
+    responses=responses,  # type: ignore
+)
+async def add_events(
+    request: Request,
+    events_request: EventsRequest,
+    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> Response:
+    check_admin_token(request.app, token.credentials)
+    if len(events_request.events) > request.app.state.max_batch_size:
+        raise BatchTooLargeError(
+            error_message=f"Batch size is limited by "
+                          f"{request.app.state.max_batch_size} events"
+        )
+
+    # counted on the event loop, the only writer of the window, and by
+    # this worker only, see PopularityConfig.events_path
+    engine = popular_stream.engine
+    assert engine is not None
+    # events are counted by the categories of the popular model
+    await load_models("popular")
+    accepted = sum(
+        engine.add(event.user_id, event.item_id, event.timestamp)
+        for event in events_request.events
+    )
+    return DataclassJSONResponse({
+        "accepted": accepted,
+        "dropped": len(events_request.events) - accepted,
+    })
+
+
+@router.get(
+    path="/stats/popularity",
+    tags=["Health"],
+)
+async def popularity_stats() -> Dict[str, Any]:
+    assert popular_stream.engine is not None
+    return popular_stream.engine.stats()
+
+
+async def publish_popularity(interval_seconds: float) -> None:
+    engine = popular_stream.engine
+    assert engine is not None
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await load_models("popular")
+        if engine.stale:
+            engine.publish()
+
+
+async def tail_events(path: str, interval_seconds: float) -> None:
+    engine = popular_stream.engine
+    assert engine is not None
+    reader = EventFileReader(path)
+    try:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await load_models("popular")
+            for line in reader.read_lines():
+                try:
+                    engine.add(*parse_event(line))
+                except (ValueError, KeyError, TypeError):
+                    app_logger.warning("Skipped malformed event %r", line)
+    finally:
+        reader.close()
+
+
+def add_event_views(app: FastAPI) -> None:
+    app.include_router(router)
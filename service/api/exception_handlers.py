@@ -8,18 +8,20 @@ from starlette.exceptions import HTTPException
 from starlette.responses import JSONResponse
 
 from service.log import app_logger
+from service.metrics import ERRORS
 from service.models import Error
 from service.response import create_response, server_error
 
-from .exceptions import AppException
+from .exceptions import AppException, ServiceOverloadedError
 
 
 async def default_error_handler(
     request: Request,
     exc: Exception,
 ) -> JSONResponse:
-    app_logger.error(str(exc))
+    app_logger.error("%s", exc)
     error = Error(error_key="server_error", error_message=str(exc))
+    ERRORS.inc(error.error_key)
     return server_error([error])
 
 
@@ -27,8 +29,9 @@ async def http_error_handler(
     request: Request,
     exc: HTTPException,
 ) -> JSONResponse:
-    app_logger.error(str(exc))
+    app_logger.error("%s", exc)
     error = Error(error_key="http_exception", error_message=exc.detail)
+    ERRORS.inc(error.error_key)
     return create_response(status_code=exc.status_code, errors=[error])
 
 
@@ -43,7 +46,9 @@ async def validation_error_handler(
         )
         for err in exc.errors()
     ]
-    app_logger.error(str(errors))
+    app_logger.error("%s", errors)
+    for error in errors:
+        ERRORS.inc(error.error_key)
     return create_response(status.HTTP_422_UNPROCESSABLE_ENTITY, errors=errors)
 
 
@@ -58,13 +63,34 @@ async def app_exception_handler(
             error_loc=exc.error_loc,
         )
     ]
-    app_logger.error(str(errors))
+    app_logger.error("%s", errors)
+    for error in errors:
+        ERRORS.inc(error.error_key)
     return create_response(exc.status_code, errors=errors)
 
 
+async def overloaded_exception_handler(
+    request: Request,
+    exc: ServiceOverloadedError,
+) -> JSONResponse:
+    # requests are shed when the service is under load, an error record
+    # for each of them would only add to it, they are counted instead
+    error = Error(
+        error_key=exc.error_key,
+        error_message=exc.error_message,
+        error_loc=exc.error_loc,
+    )
+    app_logger.debug("%s", error)
+    ERRORS.inc(error.error_key)
+    return create_response(exc.status_code, errors=[error])
+
+
 def add_exception_handlers(app: FastAPI) -> None:
     app.add_exception_handler(HTTPException, http_error_handler)
     app.add_exception_handler(ValidationError, validation_error_handler)
     app.add_exception_handler(RequestValidationError, validation_error_handler)
     app.add_exception_handler(AppException, app_exception_handler)
+    app.add_exception_handler(
+        ServiceOverloadedError, overloaded_exception_handler
+    )
     app.add_exception_handler(Exception, default_error_handler)
@@ -39,6 +39,17 @@ class ModelNotFoundError(AppException):
         super().__init__(status_code, error_key, error_message, error_loc)
 
 
+class ModelVersionNotFoundError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.NOT_FOUND,
+        error_key: str = "model_version_not_found",
+        error_message: str = "Model version is unknown",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
 class BearerAccessTokenError(AppException):
     def __init__(
         self,
@@ -48,3 +59,25 @@ class BearerAccessTokenError(AppException):
         error_loc: tp.Optional[tp.Sequence[str]] = None,
     ):
         super().__init__(status_code, error_key, error_message, error_loc)
+
+
+class BatchTooLargeError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.UNPROCESSABLE_ENTITY,
+        error_key: str = "batch_too_large",
+        error_message: str = "Too many users in the batch",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
+class ServiceOverloadedError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.SERVICE_UNAVAILABLE,
+        error_key: str = "service_overloaded",
+        error_message: str = "Service is overloaded, try again later",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
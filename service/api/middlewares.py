@@ -1,65 +1,223 @@
+import cProfile
 import time
+import typing as tp
 
-from fastapi import FastAPI, Request
-from starlette.middleware.base import (
-    BaseHTTPMiddleware,
-    RequestResponseEndpoint,
-)
+from fastapi import FastAPI
+from starlette.datastructures import URL
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from service.api.auth import bearer_token, token_matches
 from service.log import access_logger, app_logger
+from service.metrics import ERRORS, REQUEST_DURATION, STAGE_DURATION
 from service.models import Error
+from service.profiling import PSTATS, TEXT, profile_report
 from service.response import server_error
+from service.timing import server_timing, start_stages
 
+# Both middlewares are plain ASGI apps: unlike BaseHTTPMiddleware they do
+# not spawn a task and copy the response body through a memory stream.
 
-class AccessMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
+
+class AccessMiddleware:
+    """
+    Logs and measures requests. The stages recorded by `timing.stage`
+    while the request is served are sent in the Server-Timing header
+    and, with `log_timings`, added to the access record.
+
+    There is no response validation stage: the views return Response
+    objects, which FastAPI sends without validating them against the
+    response model, so `serialize` is the whole cost of the response.
+    """
+
+    def __init__(self, app: ASGIApp, log_timings: bool = False) -> None:
+        self.app = app
+        self.log_timings = log_timings
+
+    async def __call__(
         self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         started_at = time.perf_counter()
-        response = await call_next(request)
-        request_time = time.perf_counter() - started_at
-
-        status_code = response.status_code
-
-        access_logger.info(
-            msg="",
-            extra={
-                "request_time": round(request_time, 4),
-                "status_code": status_code,
-                "requested_url": request.url,
-                "method": request.method,
-            },
+        request_time = 0.0
+        status_code = None
+        stages = start_stages()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal request_time, status_code
+            if message["type"] == "http.response.start":
+                # measured up to the response start, as call_next did
+                request_time = time.perf_counter() - started_at
+                status_code = message["status"]
+                if stages:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (
+                            b"server-timing",
+                            server_timing(
+                                {**stages, "total": request_time}
+                            ).encode(),
+                        ),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        # routing stores the matched route in the scope,
+        # the route template keeps the number of label values bounded
+        route = scope.get("route")
+        REQUEST_DURATION.observe(
+            request_time,
+            scope["method"],
+            route.path if route is not None else "unmatched",
+            str(status_code),
         )
-        return response
+        # per model for the successful responses only, the model name
+        # of the others can be anything a client has sent
+        model_name = scope.get("path_params", {}).get("model_name")
+        if model_name is not None and status_code == 200:
+            for name, seconds in stages.items():
+                STAGE_DURATION.observe(seconds, model_name, name)
 
+        extra = {
+            "request_time": round(request_time, 4),
+            "status_code": status_code,
+            "requested_url": URL(scope=scope),
+            "method": scope["method"],
+        }
+        if self.log_timings:
+            extra["server_timing"] = server_timing(stages)
+        access_logger.info(msg="", extra=extra)
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
+
+class ExceptionHandlerMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
         self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
-        except Exception as e:  # pylint: disable=W0703,W1203
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:  # pylint: disable=W0703
             app_logger.exception(
-                msg=f"Caught unhandled {e.__class__} exception: {e}"
+                "Caught unhandled %s exception: %s", e.__class__, e
             )
+            if response_started:
+                raise
             error = Error(
                 error_key="server_error",
                 error_message="Internal Server Error"
             )
-            return server_error([error])
+            ERRORS.inc(error.error_key)
+            await server_error([error])(scope, receive, send)
+
+
+PROFILE_HEADER = b"x-profile"
+AUTHORIZATION_HEADER = b"authorization"
+
+
+class ProfileMiddleware:
+    """
+    Returns the cProfile report of a request instead of its response
+    when the request has an `X-Profile: text` or `X-Profile: pstats`
+    header and the admin token in `Authorization: Bearer`, as the other
+    admin-gated endpoints.
+
+    The profiler runs in the event loop thread, so the report also
+    includes other requests served meanwhile and misses model calls
+    run in inference threads or processes. One request is profiled
+    at a time, the others are served as usual.
+    """
+
+    def __init__(self, app: ASGIApp, admin_token: str) -> None:
+        self.app = app
+        self.admin_token = admin_token
+        self._profiling = False
+
+    async def __call__(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        if scope["type"] != "http" or self._profiling:
+            await self.app(scope, receive, send)
+            return
+
+        fmt: tp.Optional[str] = None
+        token = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                fmt = value.decode()
+            elif name == AUTHORIZATION_HEADER:
+                token = bearer_token(value)
+        if (
+            fmt not in (TEXT, PSTATS)
+            or token is None
+            or not token_matches(token, self.admin_token)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler = cProfile.Profile()
+        self._profiling = True
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+        finally:
+            self._profiling = False
+
+        response = Response(
+            profile_report(profiler, fmt),
+            media_type="text/plain" if fmt == TEXT
+            else "application/octet-stream",
+            headers={"X-Profiled-Status": str(status_code)},
+        )
+        await response(scope, receive, send)
+
+
+def add_profile_middleware(app: FastAPI, admin_token: str) -> None:
+    # the outermost middleware, so that the logging is profiled too
+    app.add_middleware(ProfileMiddleware, admin_token=admin_token)
 
 
-def add_middlewares(app: FastAPI) -> None:
+def add_middlewares(app: FastAPI, log_timings: bool = False) -> None:
     # do not change order
     app.add_middleware(ExceptionHandlerMiddleware)
-    app.add_middleware(AccessMiddleware)
+    app.add_middleware(AccessMiddleware, log_timings=log_timings)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -103,3 +103,11 @@ class NotFoundError(BasicErrorResponse):
                 }
             },
         }
+
+
+# the error responses of every router
+responses = {
+    '401': AuthorizationResponse().get_response(),   # type: ignore
+    '403': ForbiddenResponse().get_response(),       # type: ignore
+    '404': NotFoundError().get_response()            # type: ignore
+}
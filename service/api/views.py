@@ -1,39 +1,43 @@
-from typing import List
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from http import HTTPStatus
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
 
 from fastapi import APIRouter, Depends, FastAPI, Request
-from fastapi.security import HTTPBearer
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.security.http import HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
-from config.configuration import (
-    OFFLINE_KNN_MODEL_PATH,
-    ONLINE_KNN_MODEL_PATH,
-    POPULAR_MODEL_RECS,
-    POPULAR_MODEL_USERS,
-)
+from service.admission import AdmissionRejected
+from service.api.auth import bearer_scheme, check_user_token
 from service.api.exceptions import (
-    BearerAccessTokenError,
+    BatchTooLargeError,
     ModelNotFoundError,
+    ServiceOverloadedError,
     UserNotFoundError,
 )
-from service.api.responses import (
-    AuthorizationResponse,
-    ForbiddenResponse,
-    NotFoundError,
-)
+from service.api.responses import responses
+from service.inference import InferenceQueueFull
 from service.log import app_logger
-from service.reco_models.reco_models import (
-    OfflineKnnModel,
-    OnlineKnnModel,
-    SimplePopularModel,
+from service.memory import memory_usage
+from service.metrics import (
+    ADMISSION_REJECTIONS,
+    CONTENT_TYPE,
+    RECO_DURATION,
+    registry,
 )
-
-popular_model = SimplePopularModel(
-    POPULAR_MODEL_USERS,
-    POPULAR_MODEL_RECS,
+from service.model_loading import model_registry
+from service.recommend import recommend_batch, recommend_within_budget
+from service.response import (
+    DataclassJSONResponse,
+    raw_json_response,
+    reco_response,
 )
-offline_knn_model = OfflineKnnModel(OFFLINE_KNN_MODEL_PATH)
-online_knn_model = OnlineKnnModel(ONLINE_KNN_MODEL_PATH)
+from service.timing import stage
+
+KNN_MODELS = ("knn", "online_knn")
+MODEL_VERSION_HEADER = "X-Model-Version"
 
 
 class RecoResponse(BaseModel):
@@ -41,15 +45,21 @@ class RecoResponse(BaseModel):
     items: List[int]
 
 
-bearer_scheme = HTTPBearer()
+class BatchRecoRequest(BaseModel):
+    user_ids: List[int]
+
+
+class BatchReco(BaseModel):
+    user_id: int
+    # None for a user that is not found, GET /reco answers 404 for one
+    items: Optional[List[int]]
 
-router = APIRouter()
 
-responses = {
-    '401': AuthorizationResponse().get_response(),   # type: ignore
-    '403': ForbiddenResponse().get_response(),       # type: ignore
-    '404': NotFoundError().get_response()            # type: ignore
-}
+class BatchRecoResponse(BaseModel):
+    recos: List[BatchReco]
+
+
+router = APIRouter()
 
 
 @router.get(
@@ -60,6 +70,71 @@ async def health() -> str:
     return "I am alive"
 
 
+@router.get(
+    path="/ready",
+    tags=["Health"],
+)
+async def ready(request: Request) -> Response:
+    is_ready = model_registry.is_ready(request.app.state.eager_models)
+    return DataclassJSONResponse(
+        {"ready": is_ready, "models": model_registry.status()},
+        status_code=HTTPStatus.OK if is_ready
+        else HTTPStatus.SERVICE_UNAVAILABLE,
+    )
+
+
+@router.get(
+    path="/stats/memory",
+    tags=["Monitoring"],
+)
+async def memory_stats() -> Dict[str, Any]:
+    return {"pid": os.getpid(), **memory_usage()}
+
+
+@router.get(
+    path="/stats/inference",
+    tags=["Monitoring"],
+)
+async def inference_stats(request: Request) -> Dict[str, Dict[str, Any]]:
+    return request.app.state.inference.stats()
+
+
+@router.get(
+    path="/stats/cache",
+    tags=["Monitoring"],
+)
+async def cache_stats(request: Request) -> Dict[str, Dict[str, Any]]:
+    return request.app.state.reco_cache.stats()
+
+
+@router.get(
+    path="/stats/admission",
+    tags=["Monitoring"],
+)
+async def admission_stats(request: Request) -> Dict[str, Dict[str, Any]]:
+    return request.app.state.admission.stats()
+
+
+@router.get(
+    path="/stats/batching",
+    tags=["Monitoring"],
+)
+async def batching_stats(request: Request) -> Dict[str, Dict[str, Any]]:
+    return {
+        model_name: batcher.stats()
+        for model_name, batcher in request.app.state.batchers.items()
+    }
+
+
+@router.get(
+    path="/metrics",
+    tags=["Monitoring"],
+    response_class=PlainTextResponse,
+)
+async def metrics() -> Response:
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
 @router.get(
     path="/reco/{model_name}/{user_id}",
     tags=["Recommendations"],
@@ -71,30 +146,148 @@ async def get_reco(
     model_name: str,
     user_id: int,
     token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-) -> RecoResponse:
-    app_logger.info(f"Request for model: {model_name}, user_id: {user_id}")
+) -> Response:
+    started_at = time.perf_counter()
+    app_logger.info(
+        "Request for model: %s, user_id: %s", model_name, user_id
+    )
+
+    with stage("auth"):
+        check_user_token(request.app, token.credentials)
+        if user_id > 10**9:
+            raise UserNotFoundError(
+                error_message=f"User {user_id} not found"
+            )
+
+    k_recs = request.app.state.k_recs
+
+    async with admit(request.app, model_name):
+        response_store = request.app.state.response_store
+        if model_name == "knn" and response_store is not None:
+            # taken together, both are swapped on the event loop
+            version = request.app.state.response_store_version
+            with stage("model"):
+                body = response_store.get(user_id)
+            response = raw_json_response(body)
+            response.headers[MODEL_VERSION_HEADER] = str(version)
+            RECO_DURATION.observe(
+                time.perf_counter() - started_at, model_name
+            )
+            return response
+
+        if model_name == "test_model":
+            reco, version = list(range(k_recs)), model_registry.version
+        elif model_name in KNN_MODELS:
+            # the version the recommendations come from, a reload while
+            # the request is in flight does not change it
+            with shed_when_queue_full(model_name):
+                reco, _, version = await recommend_within_budget(
+                    request.app, model_name, user_id, started_at
+                )
+        else:
+            raise ModelNotFoundError(
+                error_message=f"Model {model_name} not found"
+            )
+
+    response = reco_response(user_id, reco)
+    response.headers[MODEL_VERSION_HEADER] = str(version)
+    RECO_DURATION.observe(time.perf_counter() - started_at, model_name)
+    return response
+
+
+@asynccontextmanager
+async def admit(app: FastAPI, model_name: str) -> AsyncIterator[None]:
+    limiter = app.state.admission.get(model_name)
+    if limiter is None:
+        yield
+        return
+
+    try:
+        with stage("admission"):
+            await limiter.acquire()
+    except AdmissionRejected as e:
+        ADMISSION_REJECTIONS.inc(model_name, e.reason)
+        raise ServiceOverloadedError(
+            error_key="model_overloaded",
+            error_message=f"Too many requests for model {model_name}",
+        )
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+@contextmanager
+def shed_when_queue_full(model_name: str) -> Iterator[None]:
+    try:
+        yield
+    except InferenceQueueFull:
+        raise ServiceOverloadedError(
+            error_key="inference_queue_full",
+            error_message=f"Too many pending requests for model {model_name}",
+        )
+
+
+@router.post(
+    path="/reco/{model_name}/batch",
+    tags=["Recommendations"],
+    response_model=BatchRecoResponse,
+    responses=responses,  # type: ignore
+)
+async def get_reco_batch(
+    request: Request,
+    model_name: str,
+    batch: BatchRecoRequest,
+    token: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> Response:
+    app_logger.info(
+        "Batch request for model: %s, users: %d",
+        model_name,
+        len(batch.user_ids),
+    )
 
-    if token.credentials != "Team_5":
-        raise BearerAccessTokenError()
-    if user_id > 10**9:
-        raise UserNotFoundError(error_message=f"User {user_id} not found")
+    with stage("auth"):
+        check_user_token(request.app, token.credentials)
+        if len(batch.user_ids) > request.app.state.max_batch_size:
+            raise BatchTooLargeError(
+                error_message=f"Batch size is limited by "
+                              f"{request.app.state.max_batch_size} users"
+            )
 
+    # users that are not found get no items, the others are still served
+    known_user_ids = [
+        user_id for user_id in batch.user_ids if user_id <= 10**9
+    ]
     k_recs = request.app.state.k_recs
+    version = model_registry.version
+
+    async with admit(request.app, model_name):
+        if model_name == "test_model":
+            recos = [list(range(k_recs)) for _ in known_user_ids]
+        elif model_name in KNN_MODELS:
+            with stage("model"), shed_when_queue_full(model_name):
+                predictions = await recommend_batch(
+                    request.app, model_name, known_user_ids
+                )
+            recos = [prediction.reco for prediction in predictions]
+            # a single predict_batch call, with the models of one version
+            if predictions:
+                version = predictions[0].version
+        else:
+            raise ModelNotFoundError(
+                error_message=f"Model {model_name} not found"
+            )
 
-    if model_name == "test_model":
-        reco = list(range(k_recs))
-    elif model_name in ("knn", "online_knn"):
-        try:
-            reco = offline_knn_model.predict(user_id) if model_name == "knn" \
-                else online_knn_model.predict(user_id)
-            if not reco:
-                reco = popular_model.predict(user_id, k_recs)
-        except TypeError:
-            reco = list(range(k_recs))
-    else:
-        raise ModelNotFoundError(error_message=f"Model {model_name} not found")
-
-    return RecoResponse(user_id=user_id, items=reco)
+    known_recos = iter(recos)
+    return DataclassJSONResponse({
+        "recos": [
+            {
+                "user_id": user_id,
+                "items": next(known_recos) if user_id <= 10**9 else None,
+            }
+            for user_id in batch.user_ids
+        ]
+    }, headers={MODEL_VERSION_HEADER: str(version)})
 
 
 def add_views(app: FastAPI) -> None:
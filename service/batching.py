@@ -0,0 +1,85 @@
+import asyncio
+import typing as tp
+
+K = tp.TypeVar("K")
+V = tp.TypeVar("V")
+
+
+class MicroBatcher(tp.Generic[K, V]):  # pylint: disable=R0902
+    """
+    Coalesces concurrent single-key calls into batched calls.
+
+    Keys are collected until `max_batch_size` of them are pending or
+    `max_wait_ms` passed since the first one, then `process_batch`
+    is called once for all of them and every caller gets its own result.
+    """
+
+    def __init__(
+        self,
+        process_batch: tp.Callable[[tp.List[K]], tp.Awaitable[tp.List[V]]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ) -> None:
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.batched_keys = 0
+        self._pending: tp.List[tp.Tuple[K, asyncio.Future]] = []
+        self._timer: tp.Optional[asyncio.TimerHandle] = None
+        # the loop keeps weak references to tasks only
+        self._tasks: tp.Set["asyncio.Task[None]"] = set()
+
+    async def submit(self, key: K) -> V:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(
+                self.max_wait_ms / 1000, self._flush
+            )
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            self.batches += 1
+            self.batched_keys += len(batch)
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self,
+        batch: tp.List[tp.Tuple[K, asyncio.Future]],
+    ) -> None:
+        try:
+            results = await self.process_batch([key for key, _ in batch])
+        except Exception as e:  # pylint: disable=broad-except
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # the caller may be gone already, e.g. on client disconnect
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "mean_batch_size": (
+                self.batched_keys / self.batches if self.batches else 0.0
+            ),
+        }
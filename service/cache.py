@@ -0,0 +1,164 @@
+import asyncio
+import time
+import typing as tp
+from collections import OrderedDict
+from functools import partial
+
+from .settings import CacheConfig
+
+K = tp.Hashable
+V = tp.Any
+
+
+class LRUCache:  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        capacity: int,
+        ttl_seconds: tp.Optional[float] = None,
+        clock: tp.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._data: "OrderedDict[K, tp.Tuple[float, V]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K) -> tp.Tuple[bool, V]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < self.clock():
+            del self._data[key]
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: K, value: V) -> None:
+        if self.capacity <= 0:
+            return
+        expires_at = (
+            self.clock() + self.ttl_seconds
+            if self.ttl_seconds is not None
+            else float("inf")
+        )
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "size": len(self._data),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+        }
+
+
+class RecoCache:
+    """
+    Per-model LRU caches of recommendations with single-flight:
+    concurrent misses for the same key share one computation.
+
+    The computation runs in its own task, so a cancelled caller does not
+    cancel it for the others, and its result is stored even when every
+    caller has gone. `invalidate` must be called when a model
+    is reloaded, results computed by the old model are dropped.
+    Results rejected by `cacheable` are returned and never stored.
+    """
+
+    def __init__(self, config: CacheConfig) -> None:
+        self.config = config
+        self._caches = {
+            model_name: LRUCache(capacity, config.ttl_seconds)
+            for model_name, capacity in config.capacities.items()
+        }
+        self._generations = {model_name: 0 for model_name in self._caches}
+        self._in_flight: tp.Dict[tp.Tuple[str, K], asyncio.Future] = {}
+
+    async def get_or_compute(
+        self,
+        model_name: str,
+        key: K,
+        compute: tp.Callable[[], tp.Awaitable[V]],
+        cacheable: tp.Optional[tp.Callable[[V], bool]] = None,
+    ) -> V:
+        cache = self._caches.get(model_name)
+        if cache is None or not self.config.enabled:
+            return await compute()
+
+        found, value = cache.get(key)
+        if found:
+            return value
+
+        task = self._in_flight.get((model_name, key))
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._in_flight[(model_name, key)] = task
+            task.add_done_callback(
+                partial(
+                    self._on_done,
+                    model_name,
+                    key,
+                    self._generations[model_name],
+                    cacheable,
+                )
+            )
+        else:
+            cache.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _on_done(
+        self,
+        model_name: str,
+        key: K,
+        generation: int,
+        cacheable: tp.Optional[tp.Callable[[V], bool]],
+        task: asyncio.Future,
+    ) -> None:
+        if self._in_flight.get((model_name, key)) is task:
+            del self._in_flight[(model_name, key)]
+        # exception() also marks the error as retrieved
+        if task.cancelled() or task.exception() is not None:
+            return
+        if generation != self._generations[model_name]:
+            return
+        if cacheable is None or cacheable(task.result()):
+            self._caches[model_name].set(key, task.result())
+
+    def invalidate(self, model_name: tp.Optional[str] = None) -> None:
+        model_names = (
+            list(self._caches) if model_name is None else [model_name]
+        )
+        for name in model_names:
+            if name not in self._caches:
+                continue
+            self._caches[name].clear()
+            self._generations[name] += 1
+            for flight_key in list(self._in_flight):
+                if flight_key[0] == name:
+                    del self._in_flight[flight_key]
+
+    def stats(self) -> tp.Dict[str, tp.Dict[str, tp.Any]]:
+        return {
+            model_name: cache.stats()
+            for model_name, cache in self._caches.items()
+        }
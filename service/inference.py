@@ -0,0 +1,142 @@
+import asyncio
+import typing as tp
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.thread import ThreadPoolExecutor
+from enum import Enum
+
+from .settings import InferenceConfig
+
+T = tp.TypeVar("T")
+
+
+class ExecutionMode(str, Enum):
+    INLINE = "inline"
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+class InferenceQueueFull(Exception):
+    pass
+
+
+class InferenceExecutor:
+    """
+    Runs model calls inline, in a thread pool or in a process pool.
+
+    At most `max_workers` calls run at once and at most `max_queue_size`
+    more wait for a worker, everything above is rejected with
+    `InferenceQueueFull`. In process mode `fn` and its arguments
+    are pickled, so `fn` must be a module level function.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        mode: ExecutionMode,
+        max_workers: int,
+        max_queue_size: int,
+    ) -> None:
+        self.name = name
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.in_flight = 0
+        self.rejected = 0
+        # pools are created on first use, so that they are never
+        # inherited by forked gunicorn workers
+        self._pool: tp.Optional[Executor] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.mode == ExecutionMode.PROCESS:
+                self._pool = ProcessPoolExecutor(self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    self.max_workers,
+                    thread_name_prefix=f"inference_{self.name}",
+                )
+        return self._pool
+
+    async def run(self, fn: tp.Callable[..., T], *args: tp.Any) -> T:
+        if self.mode == ExecutionMode.INLINE:
+            return fn(*args)
+
+        if self.in_flight >= self.max_workers + self.max_queue_size:
+            self.rejected += 1
+            raise InferenceQueueFull(self.name)
+
+        # the counter is only touched from the event loop thread
+        loop = asyncio.get_running_loop()
+
+        def release(_: Future) -> None:
+            # called in the worker, after the loop is closed on shutdown
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._release)
+
+        future = self._get_pool().submit(fn, *args)
+        self.in_flight += 1
+        # released when the call is done and not when the caller stops
+        # waiting for it, e.g. over a latency budget: a running call
+        # goes on in its worker and still takes it up
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "mode": self.mode.value,
+            "max_workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+class InferenceExecutors:
+    def __init__(self, config: InferenceConfig) -> None:
+        self.config = config
+        self._executors: tp.Dict[str, InferenceExecutor] = {}
+
+    def get(self, model_name: str) -> InferenceExecutor:
+        executor = self._executors.get(model_name)
+        if executor is None:
+            executor = InferenceExecutor(
+                name=model_name,
+                mode=ExecutionMode(
+                    self.config.modes.get(model_name, ExecutionMode.INLINE)
+                ),
+                max_workers=self.config.max_workers,
+                max_queue_size=self.config.max_queue_size,
+            )
+            self._executors[model_name] = executor
+        return executor
+
+    async def run(
+        self,
+        model_name: str,
+        fn: tp.Callable[..., T],
+        *args: tp.Any,
+    ) -> T:
+        return await self.get(model_name).run(fn, *args)
+
+    def stats(self) -> tp.Dict[str, tp.Dict[str, tp.Any]]:
+        return {
+            name: executor.stats()
+            for name, executor in self._executors.items()
+        }
+
+    def shutdown(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown()
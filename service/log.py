@@ -1,4 +1,11 @@
+import atexit
+import copy
 import logging.config
+import os
+import queue
+import random
+import threading
+import time
 import typing as tp
 
 from .settings import ServiceConfig
@@ -19,6 +26,125 @@ class ServiceNameFilter(logging.Filter):
         return super().filter(record)
 
 
+class AccessSampleFilter(logging.Filter):
+    """Passes `rate` of the access records and every error record."""
+
+    def __init__(self, name: str = "", rate: float = 1.0) -> None:
+        self.rate = rate
+
+        super().__init__(name)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0:
+            return True
+        status_code = getattr(record, "status_code", None) or 500
+        return status_code >= 400 or random.random() < self.rate
+
+
+class LogWriter:
+    """
+    Formats and writes log records in a background thread.
+
+    Everything queued while the previous batch was being written
+    is written to each stream with a single write call.
+    """
+
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+        self.queue: "queue.SimpleQueue[tp.Any]" = queue.SimpleQueue()
+        self._thread: tp.Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="log_writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def put(
+        self, handler: logging.StreamHandler, record: logging.LogRecord
+    ) -> None:
+        self.queue.put((handler, record))
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            self._write([item for item in batch if item is not None])
+            if stop:
+                return
+
+    @staticmethod
+    def _write(
+        batch: tp.List[tp.Tuple[logging.StreamHandler, logging.LogRecord]],
+    ) -> None:
+        lines: tp.Dict[logging.StreamHandler, tp.List[str]] = {}
+        for i, (handler, record) in enumerate(batch):
+            if i % 16 == 15:
+                # formatting holds the GIL, give it back to the event
+                # loop instead of waiting for the switch interval
+                time.sleep(0)
+            try:
+                if handler.filter(record):
+                    lines.setdefault(handler, []).append(
+                        handler.format(record) + handler.terminator
+                    )
+            except Exception:  # pylint: disable=broad-except
+                handler.handleError(record)
+        for handler, handler_lines in lines.items():
+            handler.acquire()
+            try:
+                handler.stream.write("".join(handler_lines))
+                handler.flush()
+            finally:
+                handler.release()
+
+
+class QueueLogHandler(logging.Handler):
+    """
+    Hands records over to LogWriter, which formats them. Only
+    the message is merged with its args, and the traceback rendered,
+    here: as in QueueHandler.prepare, args changed after the call
+    would change the record, and exc_info keeps the frames alive.
+    """
+
+    def __init__(
+        self, target: logging.StreamHandler, writer: LogWriter
+    ) -> None:
+        self.target = target
+        self.writer = writer
+
+        super().__init__(target.level)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # a copy, the other handlers of the logger get the record as is
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                formatter = self.target.formatter or logging.Formatter()
+                record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.writer.put(self.target, self.prepare(record))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+
 def get_config(service_config: ServiceConfig) -> tp.Dict[str, tp.Any]:
     level = service_config.log_config.level
     datetime_format = service_config.log_config.datetime_format
@@ -40,6 +166,7 @@ def get_config(service_config: ServiceConfig) -> tp.Dict[str, tp.Any]:
             access_logger.name: {
                 "level": level,
                 "handlers": ["access"],
+                "filters": ["access_sample"],
                 "propagate": False,
             },
             "gunicorn.error": {
@@ -114,6 +241,11 @@ def get_config(service_config: ServiceConfig) -> tp.Dict[str, tp.Any]:
                     'requested_url="%(requested_url)s" '
                     'status_code="%(status_code)s" '
                     'request_time="%(request_time)s" '
+                    + (
+                        'server_timing="%(server_timing)s" '
+                        if service_config.log_config.access_timings
+                        else ""
+                    )
                 ),
                 "datefmt": datetime_format,
             },
@@ -133,12 +265,53 @@ def get_config(service_config: ServiceConfig) -> tp.Dict[str, tp.Any]:
                 "()": "service.log.ServiceNameFilter",
                 "service_name": service_config.service_name,
             },
+            "access_sample": {
+                "()": "service.log.AccessSampleFilter",
+                "rate": service_config.log_config.access_sample_rate,
+            },
         },
     }
 
     return config
 
 
+_writer: tp.Optional[LogWriter] = None
+
+
+def setup_queue_logging(batch_size: int) -> None:
+    global _writer  # pylint: disable=global-statement
+    if _writer is not None:
+        _writer.stop()
+    _writer = LogWriter(batch_size)
+    _writer.start()
+
+    for logger in (logging.getLogger(), app_logger, access_logger):
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.StreamHandler):
+                logger.removeHandler(handler)
+                logger.addHandler(QueueLogHandler(handler, _writer))
+
+
+def stop_queue_logging() -> None:
+    if _writer is not None:
+        _writer.stop()
+
+
+def _restart_writer() -> None:
+    # the thread is not inherited by a forked process, e.g. by
+    # a gunicorn worker when the app is preloaded in the master
+    if _writer is not None:
+        _writer.queue = queue.SimpleQueue()
+        _writer.start()
+
+
+atexit.register(stop_queue_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_writer)
+
+
 def setup_logging(service_config: ServiceConfig) -> None:
     config = get_config(service_config)
     logging.config.dictConfig(config)
+    if service_config.log_config.queue:
+        setup_queue_logging(service_config.log_config.queue_batch_size)
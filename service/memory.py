@@ -0,0 +1,72 @@
+import argparse
+import os
+import typing as tp
+
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared",
+    "Shared_Dirty": "shared",
+    "Private_Clean": "uss",
+    "Private_Dirty": "uss",
+}
+
+
+def memory_usage(pid: tp.Optional[int] = None) -> tp.Dict[str, int]:
+    """
+    RSS of a process split into pages shared with other processes
+    and pages only this process uses (USS), in bytes.
+
+    Forked workers keep sharing the pages of the models loaded before
+    the fork until they write to them. Linux only, empty elsewhere.
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    if not os.path.exists(path):
+        return {}
+
+    usage = dict.fromkeys(SMAPS_FIELDS.values(), 0)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in SMAPS_FIELDS:
+                # values are reported in kB
+                usage[SMAPS_FIELDS[name]] += int(value.split()[0]) * 1024
+    return usage
+
+
+def child_pids(pid: int) -> tp.List[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as f:
+                # the command name in parentheses may contain spaces
+                fields = f.read().rpartition(")")[2].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Shared and unique memory of gunicorn workers",
+    )
+    parser.add_argument("pid", type=int, help="gunicorn master pid")
+    args = parser.parse_args()
+
+    print(f"{'pid':>8} {'rss':>10} {'pss':>10} {'shared':>10} {'uss':>10}")
+    for pid in [args.pid] + child_pids(args.pid):
+        usage = memory_usage(pid)
+        if not usage:
+            continue
+        print(f"{pid:>8} " + " ".join(
+            f"{usage[name] / 2**20:8.1f}MB"
+            for name in ("rss", "pss", "shared", "uss")
+        ))
+
+
+if __name__ == "__main__":
+    main()
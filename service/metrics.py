@@ -0,0 +1,362 @@
+import asyncio
+import fcntl
+import glob
+import os
+import time
+import typing as tp
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import orjson
+
+Labels = tp.Tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tp.Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: tp.Dict[Labels, tp.Any] = {}
+
+    @abstractmethod
+    def merge(self, labels: Labels, value: tp.Any) -> None:
+        pass
+
+    def empty_copy(self: "M") -> "M":
+        """The same metric without values, to merge snapshots into."""
+        return type(self)(self.name, self.documentation, self.labelnames)
+
+    def samples(
+        self,
+        values: tp.Dict[Labels, tp.Any],
+    ) -> tp.Iterator[tp.Tuple[str, tp.Dict[str, str], float]]:
+        for labels, value in values.items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def merge(self, labels: Labels, value: tp.Any) -> None:
+        self.inc(*labels, amount=value)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    @contextmanager
+    def time(self, *labels: str) -> tp.Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.set(time.perf_counter() - started_at, *labels)
+
+    def merge(self, labels: Labels, value: tp.Any) -> None:
+        # workers report their own values, the largest one is exported
+        self.values[labels] = max(value, self.values.get(labels, value))
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tp.Sequence[str] = (),
+        buckets: tp.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def empty_copy(self) -> "Histogram":
+        return Histogram(
+            self.name, self.documentation, self.labelnames, self.buckets
+        )
+
+    def observe(self, value: float, *labels: str) -> None:
+        # per bucket (not cumulative) counts, then the sum of values
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def merge(self, labels: Labels, value: tp.Any) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            self.values[labels] = list(value)
+            return
+        for i, count in enumerate(value):
+            state[i] += count
+
+    def samples(
+        self,
+        values: tp.Dict[Labels, tp.Any],
+    ) -> tp.Iterator[tp.Tuple[str, tp.Dict[str, str], float]]:
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, state in values.items():
+            label_dict = dict(zip(self.labelnames, labels))
+            cumulative = 0.0
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    {**label_dict, "le": bound},
+                    cumulative,
+                )
+            yield f"{self.name}_sum", label_dict, state[-1]
+            yield f"{self.name}_count", label_dict, cumulative
+
+
+M = tp.TypeVar("M", bound=Metric)
+
+
+class MetricsRegistry:
+    """
+    Process-local metrics rendered in the Prometheus text format.
+
+    Recording is a dict update without locks, so metrics must be
+    recorded from the event loop thread only, other threads hand their
+    records over to it with `record_threadsafe`. With `multiprocess_dir`
+    every worker writes snapshots of its values to `<pid>.json` there,
+    and a scrape of any worker sums the snapshots of all of them,
+    including the workers that have already exited: their snapshots
+    are merged into `archive.json` by the scrape that finds them, so
+    the files do not pile up as gunicorn restarts workers.
+    """
+
+    def __init__(self, multiprocess_dir: tp.Optional[str] = None) -> None:
+        self.multiprocess_dir = multiprocess_dir
+        # the event loop of the service, set by the app on startup
+        self.loop: tp.Optional[asyncio.AbstractEventLoop] = None
+        self._metrics: tp.Dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def record_threadsafe(
+        self,
+        record: tp.Callable[..., None],
+        *args: tp.Any,
+    ) -> None:
+        """
+        `record(*args)` from any thread: called on `loop`, or right away
+        before it is set, when nothing reads the metrics yet.
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            record(*args)
+        else:
+            loop.call_soon_threadsafe(record, *args)
+
+    def snapshot(self) -> tp.Dict[str, tp.List[tp.Any]]:
+        return _snapshot(self._metrics)
+
+    def write_snapshot(self) -> None:
+        if self.multiprocess_dir is None:
+            return
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        # readers never see a partially written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+    def collect(self) -> tp.Dict[str, tp.Dict[Labels, tp.Any]]:
+        if self.multiprocess_dir is None:
+            return {
+                name: metric.values for name, metric in self._metrics.items()
+            }
+
+        self.write_snapshot()
+        self.compact()
+        merged = self._merge(
+            glob.glob(os.path.join(self.multiprocess_dir, "*.json"))
+        )
+        return {name: metric.values for name, metric in merged.items()}
+
+    def compact(self) -> None:
+        """Merge the snapshots of the exited workers into the archive."""
+        assert self.multiprocess_dir is not None
+        with open(os.path.join(self.multiprocess_dir, LOCK_FILE), "wb") as f:
+            # one compaction at a time, or two workers archive a file twice
+            fcntl.flock(f, fcntl.LOCK_EX)
+            exited = [
+                path
+                for path in glob.glob(
+                    os.path.join(self.multiprocess_dir, "*.json")
+                )
+                if _exited_pid(path)
+            ]
+            if not exited:
+                return
+            archive = os.path.join(self.multiprocess_dir, ARCHIVE_FILE)
+            merged = self._merge(exited + glob.glob(archive))
+            tmp_path = f"{archive}.tmp"
+            with open(tmp_path, "wb") as tmp:
+                tmp.write(orjson.dumps(_snapshot(merged)))
+            os.replace(tmp_path, archive)
+            for path in exited:
+                os.remove(path)
+
+    def _merge(self, paths: tp.Iterable[str]) -> tp.Dict[str, Metric]:
+        merged = {
+            name: metric.empty_copy()
+            for name, metric in self._metrics.items()
+        }
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    snapshot = orjson.loads(f.read())
+            except FileNotFoundError:
+                # archived by another worker meanwhile
+                continue
+            for name, values in snapshot.items():
+                if name not in merged:
+                    continue
+                for labels, value in values:
+                    merged[name].merge(tuple(labels), value)
+        return merged
+
+    def render(self) -> str:
+        lines = []
+        for name, values in self.collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample_name, labels, value in metric.samples(values):
+                lines.append(
+                    f"{sample_name}{_format_labels(labels)} "
+                    f"{_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def clear_multiprocess_dir(multiprocess_dir: tp.Optional[str]) -> None:
+    # snapshots of a previous run must not be summed with the new ones
+    if multiprocess_dir is None:
+        return
+    for path in glob.glob(os.path.join(multiprocess_dir, "*.json")):
+        os.remove(path)
+
+
+async def write_snapshots(
+    metrics_registry: MetricsRegistry,
+    interval_seconds: float,
+) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        metrics_registry.write_snapshot()
+
+
+def _snapshot(metrics: tp.Dict[str, Metric]) -> tp.Dict[str, tp.List[tp.Any]]:
+    return {
+        name: [[labels, value] for labels, value in metric.values.items()]
+        for name, metric in metrics.items()
+    }
+
+
+def _exited_pid(path: str) -> bool:
+    # <pid>.json of a worker that is gone, not the archive
+    pid = os.path.basename(path)[:-len(".json")]
+    if not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _format_labels(labels: tp.Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\n", "\\n")
+            .replace('"', '\\"'),
+        )
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Time until the response start by route",
+    ("method", "route", "status_code"),
+))
+RECO_DURATION = registry.register(Histogram(
+    "reco_duration_seconds",
+    "Time to build a recommendation response by model",
+    ("model_name",),
+))
+STAGE_DURATION = registry.register(Histogram(
+    "reco_stage_duration_seconds",
+    "Time spent in a stage of a recommendation request by model",
+    ("model_name", "stage"),
+))
+POPULAR_FALLBACKS = registry.register(Counter(
+    "reco_popular_fallbacks_total",
+    "Recommendations replaced by the popular model",
+    ("model_name", "reason"),
+))
+ERRORS = registry.register(Counter(
+    "errors_total",
+    "Error responses by error key",
+    ("error_key",),
+))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "admission_rejections_total",
+    "Requests rejected by the admission control of a model",
+    ("model_name", "reason"),
+))
+MODEL_LOAD_SECONDS = registry.register(Gauge(
+    "model_load_seconds",
+    "Time spent loading a model",
+    ("model_name",),
+))
@@ -0,0 +1,218 @@
+import asyncio
+import os
+from functools import partial
+from typing import Any, List, Optional
+
+from config.configuration import (
+    MODEL_VERSIONS_PATH,
+    OFFLINE_KNN_COLUMNAR_PATH,
+    OFFLINE_KNN_MODEL_PATH,
+    ONLINE_KNN_ENGINE_PATH,
+    ONLINE_KNN_HNSW_PATH,
+    ONLINE_KNN_MODEL_PATH,
+    POPULAR_MODEL_COMPACT_PATH,
+    POPULAR_MODEL_RECS,
+    POPULAR_MODEL_USERS,
+    PREBUILT_RESPONSES_PATH,
+)
+from service.log import app_logger
+from service.metrics import MODEL_LOAD_SECONDS, registry
+from service.reco_models.hnsw import HnswIndex
+from service.reco_models.manifest import (
+    Manifest,
+    load_version,
+    read_current_version,
+)
+from service.reco_models.popular import CompactPopularModel, PopularModel
+from service.reco_models.reco_models import (
+    ColumnarKnnModel,
+    OfflineKnnModel,
+    OnlineKnnModel,
+    SimplePopularModel,
+)
+from service.reco_models.registry import ModelRegistry, ModelVersion
+from service.reco_models.response_store import ResponseStore
+from service.reco_models.streaming_popular import StreamingPopularity
+from service.reco_models.user_knn import UserKnn
+
+DEFAULT_VERSION = "default"
+
+
+def default_manifest() -> Manifest:
+    # the unversioned artifacts listed in config/configuration.py
+    artifacts = {
+        "popular_users": POPULAR_MODEL_USERS,
+        "popular_recs": POPULAR_MODEL_RECS,
+        "knn": OFFLINE_KNN_COLUMNAR_PATH
+        if os.path.isdir(OFFLINE_KNN_COLUMNAR_PATH)
+        else OFFLINE_KNN_MODEL_PATH,
+        "online_knn": ONLINE_KNN_ENGINE_PATH
+        if os.path.isdir(ONLINE_KNN_ENGINE_PATH)
+        else ONLINE_KNN_MODEL_PATH,
+    }
+    if os.path.isdir(POPULAR_MODEL_COMPACT_PATH):
+        artifacts["popular"] = POPULAR_MODEL_COMPACT_PATH
+    if os.path.isdir(PREBUILT_RESPONSES_PATH):
+        artifacts["knn_responses"] = PREBUILT_RESPONSES_PATH
+    if os.path.isdir(ONLINE_KNN_HNSW_PATH):
+        artifacts["online_knn_hnsw"] = ONLINE_KNN_HNSW_PATH
+    return Manifest(version=DEFAULT_VERSION, artifacts=artifacts)
+
+
+def current_manifest() -> Manifest:
+    version = read_current_version(MODEL_VERSIONS_PATH)
+    if version is None:
+        return default_manifest()
+    return load_version(MODEL_VERSIONS_PATH, version)
+
+
+def load_popular_model(manifest: Manifest) -> PopularModel:
+    # the compact arrays when they are converted, the pickles otherwise
+    if "popular" in manifest.artifacts:
+        return CompactPopularModel.load(manifest.path("popular"))
+    return SimplePopularModel(
+        manifest.path("popular_users"),
+        manifest.path("popular_recs"),
+    )
+
+
+def load_offline_knn_model(manifest: Manifest) -> Any:
+    # directories are converted artifacts, files are notebook dill dumps
+    path = manifest.path("knn")
+    if os.path.isdir(path):
+        return ColumnarKnnModel(path)
+    return OfflineKnnModel(path)
+
+
+def load_online_knn_model(
+    manifest: Manifest,
+    hnsw_ef: Optional[int] = None,
+) -> Any:
+    # hnsw_ef is ServiceConfig.online_knn_hnsw_ef, see create_app
+    path = manifest.path("online_knn")
+    if not os.path.isdir(path):
+        return OnlineKnnModel(path)
+    model = UserKnn.load(path)
+    if hnsw_ef is not None and "online_knn_hnsw" in manifest.artifacts:
+        model.set_neighbour_index(
+            HnswIndex.load(manifest.path("online_knn_hnsw"), ef=hnsw_ef)
+        )
+    return model
+
+
+def warm_up_popular_model(
+    model: PopularModel,
+    user_ids: List[int],
+    k_recs: int = 10,
+) -> None:
+    # k_recs is ServiceConfig.k_recs, see create_app
+    model.predict_batch(user_ids, k_recs)
+
+
+def warm_up_knn_model(model: Any, user_ids: List[int]) -> None:
+    for user_id in user_ids:
+        try:
+            model.predict(user_id)
+        except TypeError:
+            # the same failure predict falls back on
+            pass
+    model.predict_batch(user_ids)
+
+
+model_registry = ModelRegistry(
+    manifest=current_manifest(),
+    # called in the threads that load models
+    on_load=lambda name, seconds: registry.record_threadsafe(
+        MODEL_LOAD_SECONDS.set, seconds, name
+    ),
+)
+model_registry.register("popular", load_popular_model, warm_up_popular_model)
+model_registry.register("knn", load_offline_knn_model, warm_up_knn_model)
+model_registry.register(
+    "online_knn", load_online_knn_model, warm_up_knn_model
+)
+
+
+class PopularStream:
+    # set by create_app when the popularity stream is on
+    engine: Optional[StreamingPopularity] = None
+
+
+popular_stream = PopularStream()
+
+
+async def load_models(*names: str) -> None:
+    """
+    Load `names` in a thread: the event loop would stop for the load,
+    or for the lock of a load that has started in the background.
+    """
+    missing = [name for name in names if not model_registry.is_ready([name])]
+    if missing:
+        await asyncio.get_running_loop().run_in_executor(
+            None, model_registry.load, missing
+        )
+
+
+def popular_model(models: Optional[ModelVersion] = None) -> PopularModel:
+    """
+    The last snapshot of the stream, or the artifacts without one
+    or before the stream is published on the popular model of `models`,
+    the current version by default.
+    """
+    popular = (models or model_registry.current()).get("popular")
+    engine = popular_stream.engine
+    if (
+        engine is not None
+        and engine.snapshot is not None
+        and engine.published_base is popular
+    ):
+        return engine.snapshot
+    return popular
+
+
+def response_store_path(models: ModelVersion) -> Optional[str]:
+    if models.manifest is not None:
+        path = models.manifest.artifacts.get("knn_responses")
+        if path is not None:
+            return path
+    # the unversioned artifacts get one when it is built
+    if models.version == DEFAULT_VERSION:
+        return PREBUILT_RESPONSES_PATH
+    return None
+
+
+def load_response_store(models: ModelVersion, k_recs: int) -> ResponseStore:
+    """
+    The knn responses of the version of `models`, built and saved
+    when there are none for `k_recs`, so that the next start and the
+    other workers load them. Popular fallbacks are taken from
+    `popular_model` on every request, with the snapshots of the
+    popularity stream, as the knn responses that are not prebuilt.
+    """
+    # loaded here, in a thread, and not by the first fallback
+    models.get("popular")
+    popular = partial(popular_model, models)
+    path = response_store_path(models)
+    if path is not None and os.path.isdir(path):
+        response_store = ResponseStore.load(path, popular)
+        if response_store.k_recs == k_recs:
+            return response_store
+        app_logger.warning(
+            "Prebuilt responses are built for k_recs=%d, rebuilding",
+            response_store.k_recs,
+        )
+    offline_knn_model = models.get("knn")
+    user_ids = offline_knn_model.user_ids
+    response_store = ResponseStore.build(
+        user_ids,
+        offline_knn_model.predict_batch(user_ids),
+        popular,
+        k_recs,
+    )
+    if path is not None:
+        try:
+            response_store.save(path)
+        except OSError:
+            # served from memory all the same
+            app_logger.exception("Failed to save prebuilt responses")
+    return response_store
@@ -0,0 +1,65 @@
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import typing as tp
+from collections import Counter
+from types import FrameType
+
+TEXT = "text"
+PSTATS = "pstats"
+
+
+def profile_report(profiler: cProfile.Profile, fmt: str) -> bytes:
+    """`text` is a pstats listing, `pstats` is a file for pstats.Stats."""
+    if fmt == PSTATS:
+        # the format of Profile.dump_stats
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+    return stream.getvalue().encode()
+
+
+def fold_stack(thread_name: str, frame: tp.Optional[FrameType]) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(
+            f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+def sample_stacks(
+    seconds: float,
+    interval_seconds: float = 0.005,
+) -> tp.Counter[str]:
+    """
+    Stacks of all threads of the process but the calling one, sampled
+    every `interval_seconds` for `seconds`, in the collapsed format of
+    flamegraph.pl: `thread;outer;...;inner` -> number of samples.
+    """
+    own_ident = threading.get_ident()
+    stacks: tp.Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, frame in frames.items():
+            if ident != own_ident:
+                stacks[fold_stack(names.get(ident, str(ident)), frame)] += 1
+        time.sleep(interval_seconds)
+    return stacks
+
+
+def format_collapsed(stacks: tp.Counter[str]) -> str:
+    return "".join(
+        f"{stack} {count}\n" for stack, count in stacks.most_common()
+    )
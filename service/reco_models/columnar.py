@@ -0,0 +1,133 @@
+import argparse
+import os
+import typing as tp
+from itertools import chain
+
+import dill
+import numpy as np
+
+USER_IDS_FILE = "user_ids.npy"
+OFFSETS_FILE = "offsets.npy"
+ITEM_IDS_FILE = "item_ids.npy"
+
+
+class ColumnarIndex:
+    """
+    Read-only {user_id: items} mapping stored as three flat arrays:
+    sorted user ids, offsets into the flat item array and the items.
+
+    Arrays are opened with mmap, so every process that loads the same
+    directory shares one copy in the page cache.
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        offsets: np.ndarray,
+        item_ids: np.ndarray,
+    ) -> None:
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.item_ids = item_ids
+
+    @classmethod
+    def load(cls, path: str) -> "ColumnarIndex":
+        return cls(
+            np.load(os.path.join(path, USER_IDS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r"),
+            np.load(os.path.join(path, ITEM_IDS_FILE), mmap_mode="r"),
+        )
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def position(self, user_id: int) -> tp.Optional[int]:
+        idx = int(np.searchsorted(self.user_ids, user_id))
+        if idx < len(self.user_ids) and self.user_ids[idx] == user_id:
+            return idx
+        return None
+
+    def get(self, user_id: int) -> tp.Optional[np.ndarray]:
+        idx = self.position(user_id)
+        if idx is None:
+            return None
+        # slice of a memmap is a view, nothing is copied
+        return self.item_ids[self.offsets[idx]:self.offsets[idx + 1]]
+
+    def positions(self, user_ids: tp.Sequence[int]) -> np.ndarray:
+        """Positions of `user_ids` in the index, -1 for unknown users."""
+        ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.user_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        idx = np.searchsorted(self.user_ids, ids)
+        idx[idx == len(self.user_ids)] = 0
+        return np.where(self.user_ids[idx] == ids, idx, -1)
+
+    def get_batch(
+        self,
+        user_ids: tp.Sequence[int],
+    ) -> tp.List[tp.Optional[np.ndarray]]:
+        positions = self.positions(user_ids)
+        starts = self.offsets[positions]
+        stops = self.offsets[positions + 1]
+        return [
+            None if idx < 0 else self.item_ids[start:stop]
+            for idx, start, stop in zip(positions, starts, stops)
+        ]
+
+
+def write_columnar(
+    mapping: tp.Mapping[int, tp.Sequence[int]],
+    path: str,
+    dtype: tp.Any = np.int32,
+) -> None:
+    n_users = len(mapping)
+    user_ids = np.fromiter(mapping.keys(), dtype=np.int64, count=n_users)
+    order = np.argsort(user_ids, kind="stable")
+    values = list(mapping.values())
+
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=n_users)
+    offsets = np.zeros(n_users + 1, dtype=np.int64)
+    np.cumsum(lengths[order], out=offsets[1:])
+    item_ids = np.fromiter(
+        chain.from_iterable(values[i] for i in order),
+        dtype=dtype,
+        count=int(offsets[-1]),
+    )
+
+    save_columnar(path, user_ids[order], offsets, item_ids)
+
+
+def save_columnar(
+    path: str,
+    user_ids: np.ndarray,
+    offsets: np.ndarray,
+    item_ids: np.ndarray,
+) -> None:
+    """Save the arrays of a ColumnarIndex, `user_ids` must be sorted."""
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, USER_IDS_FILE), user_ids)
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    np.save(os.path.join(path, ITEM_IDS_FILE), item_ids)
+
+
+def convert_dictionary(src_path: str, dst_path: str) -> None:
+    # dill reads plain pickle files as well
+    with open(src_path, "rb") as f:
+        mapping = dill.load(f)
+    write_columnar(mapping, dst_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert {user_id: List[item_id]} dill/pickle dictionary "
+                    "to the memory-mapped columnar format",
+    )
+    parser.add_argument("src", help="path to dill/pickle dictionary")
+    parser.add_argument("dst", help="output directory")
+    args = parser.parse_args()
+    convert_dictionary(args.src, args.dst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+import time
+import typing as tp
+
+import numpy as np
+import scipy.sparse as sp
+
+from .offline_knn import bm25_weight, nearest_neighbours, read_interactions
+from .user_knn import USER_IDS_FILE, UserKnn
+
+INDEX_FILE = "hnsw.bin"
+VECTORS_FILE = "vectors.npz"
+PARAMS_FILE = "params.json"
+# the smallest distance is the largest dot product, as in BM25 similarity
+SPACE = "negdotprod_sparse_fast"
+
+Neighbours = tp.Tuple[np.ndarray, np.ndarray]
+
+
+try:
+    import nmslib
+except ImportError:
+    # an optional dependency, needed by HnswIndex only
+    nmslib = None
+
+
+def _nmslib() -> tp.Any:
+    if nmslib is None:
+        raise ImportError("HnswIndex needs nmslib: pip install nmslib")
+    return nmslib
+
+
+def _init_index() -> tp.Any:
+    return _nmslib().init(
+        method="hnsw",
+        space=SPACE,
+        data_type=_nmslib().DataType.SPARSE_VECTOR,
+    )
+
+
+def to_table(
+    n_rows: int,
+    rows: np.ndarray,
+    neighbours: np.ndarray,
+    scores: np.ndarray,
+    k: int,
+) -> Neighbours:
+    """
+    Neighbour pairs grouped by row, the closest first, as the
+    fixed-width tables of UserKnn: int32 ids padded with -1 and float32
+    scores.
+    """
+    table = np.full((n_rows, k), -1, dtype=np.int32)
+    table_scores = np.zeros((n_rows, k), dtype=np.float32)
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    table[rows, ranks] = neighbours
+    table_scores[rows, ranks] = scores
+    return table, table_scores
+
+
+class ExactIndex:
+    """
+    Exact user neighbours by the dot product of BM25 vectors,
+    the reference for the recall of HnswIndex. Rows are searched
+    in blocks of `block_size`, see `nearest_neighbours`.
+    """
+
+    def __init__(
+        self,
+        vectors: sp.csr_matrix,
+        user_ids: np.ndarray,
+        block_size: int = 128,
+    ) -> None:
+        self.vectors = vectors
+        self.user_ids = user_ids
+        self.block_size = block_size
+
+    def search(self, rows: np.ndarray, k: int) -> Neighbours:
+        tables = [
+            to_table(
+                len(block),
+                *nearest_neighbours(self.vectors, block, k),
+                k,
+            )
+            for block in np.array_split(
+                rows, max(1, -(-len(rows) // self.block_size))
+            )
+        ]
+        return (
+            np.concatenate([table for table, _ in tables]),
+            np.concatenate([scores for _, scores in tables]),
+        )
+
+
+class HnswIndex:
+    """
+    Approximate user neighbours from an nmslib HNSW index over the
+    BM25 vectors of users, which are the index ids and are kept next
+    to the index to query it by user.
+
+    `ef` is the size of the candidate list of a query: a larger one
+    finds more of the exact neighbours and is slower.
+    """
+
+    def __init__(
+        self,
+        index: tp.Any,
+        vectors: sp.csr_matrix,
+        user_ids: np.ndarray,
+        ef: int = 100,
+    ) -> None:
+        self.index = index
+        self.vectors = vectors
+        self.user_ids = user_ids
+        self.set_ef(ef)
+
+    def set_ef(self, ef: int) -> None:
+        self.index.setQueryTimeParams({"efSearch": ef})
+        self.ef = ef
+
+    @classmethod
+    def build(
+        cls,
+        vectors: sp.csr_matrix,
+        user_ids: np.ndarray,
+        M: int = 16,
+        ef_construction: int = 200,
+        num_threads: int = 0,
+    ) -> "HnswIndex":
+        index = _init_index()
+        index.addDataPointBatch(vectors, np.arange(vectors.shape[0]))
+        index.createIndex(
+            {
+                "M": M,
+                "efConstruction": ef_construction,
+                "indexThreadQty": num_threads,
+                "post": 0,
+            },
+            print_progress=False,
+        )
+        return cls(index, vectors, user_ids)
+
+    def save(self, path: str, params: tp.Dict[str, tp.Any]) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.index.saveIndex(os.path.join(path, INDEX_FILE), save_data=True)
+        sp.save_npz(
+            os.path.join(path, VECTORS_FILE), self.vectors, compressed=False
+        )
+        np.save(os.path.join(path, USER_IDS_FILE), self.user_ids)
+        with open(
+            os.path.join(path, PARAMS_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump(params, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str, ef: int = 100) -> "HnswIndex":
+        index = _init_index()
+        index.loadIndex(os.path.join(path, INDEX_FILE), load_data=True)
+        return cls(
+            index,
+            sp.load_npz(os.path.join(path, VECTORS_FILE)).tocsr(),
+            np.load(os.path.join(path, USER_IDS_FILE), mmap_mode="r"),
+            ef=ef,
+        )
+
+    def search(self, rows: np.ndarray, k: int) -> Neighbours:
+        # a list of (ids, distances) arrays per query, the closest first,
+        # with fewer than k of them when the graph search finds fewer
+        results = self.index.knnQueryBatch(
+            self.vectors[rows], k=k, num_threads=1
+        )
+        lengths = [len(ids) for ids, _ in results]
+        positions = np.repeat(np.arange(len(rows)), lengths)
+        neighbours = np.concatenate(
+            [np.asarray(ids, dtype=np.int32) for ids, _ in results]
+            + [np.zeros(0, np.int32)]
+        )
+        scores = -np.concatenate(
+            [np.asarray(distances, dtype=np.float32)
+             for _, distances in results]
+            + [np.zeros(0, np.float32)]
+        )
+        # zero similarity is no similarity, as in the exact search
+        valid = scores > 0
+        return to_table(
+            len(rows),
+            positions[valid],
+            neighbours[valid],
+            scores[valid],
+            k,
+        )
+
+
+def recall_at_n(approx: np.ndarray, exact: np.ndarray) -> float:
+    """
+    Share of the exact neighbours found by the approximate search,
+    averaged over the rows with any, both are -1 padded tables.
+    """
+    recalls = []
+    for approx_row, exact_row in zip(approx, exact):
+        exact_row = exact_row[exact_row >= 0]
+        if len(exact_row):
+            found = np.intersect1d(approx_row[approx_row >= 0], exact_row)
+            recalls.append(len(found) / len(exact_row))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def build(args: argparse.Namespace) -> None:
+    interactions = read_interactions(
+        args.interactions,
+        weight_col=args.weight_col or None,
+        min_interactions=args.min_interactions,
+    )
+    vectors = bm25_weight(interactions.matrix, args.K1, args.B)
+    started_at = time.perf_counter()
+    index = HnswIndex.build(
+        vectors,
+        interactions.user_ids,
+        M=args.M,
+        ef_construction=args.ef_construction,
+        num_threads=args.threads,
+    )
+    print(f"built in {time.perf_counter() - started_at:.1f}s")
+    index.save(
+        args.dst,
+        {
+            "space": SPACE,
+            "M": args.M,
+            "ef_construction": args.ef_construction,
+            "min_interactions": args.min_interactions,
+            "K1": args.K1,
+            "B": args.B,
+        },
+    )
+
+
+def engine_recall(
+    index: tp.Any,
+    engine: UserKnn,
+    rows: np.ndarray,
+    n: int,
+) -> float:
+    """
+    recall@`n` of the neighbours found in `index` against the
+    neighbours table of `engine`, the neighbours the index replaces.
+    """
+    if not np.array_equal(index.user_ids, engine.user_ids):
+        raise ValueError("Neighbour index is built for other users")
+    approx, _ = index.search(rows, n)
+    return recall_at_n(approx, engine.neighbours_table[rows, :n])
+
+
+def recall(args: argparse.Namespace) -> None:
+    index = HnswIndex.load(args.path)
+    rng = np.random.default_rng(args.seed)
+    n_users = index.vectors.shape[0]
+    rows = rng.choice(n_users, size=min(args.sample, n_users), replace=False)
+    if args.engine is not None:
+        # the table of the engine is the reference the index replaces
+        engine = UserKnn.load(args.engine)
+        exact = ExactIndex(index.vectors, index.user_ids)
+        print(
+            f"exact search recall@{args.n} against the engine table: "
+            f"{engine_recall(exact, engine, rows, args.n):.4f}"
+        )
+        exact_table = engine.neighbours_table[rows, :args.n]
+    else:
+        exact_table, _ = ExactIndex(index.vectors, index.user_ids).search(
+            rows, args.n
+        )
+
+    print(f"{'ef':>6} {f'recall@{args.n}':>10} {'ms/query':>10}")
+    for ef in args.ef:
+        index.set_ef(ef)
+        started_at = time.perf_counter()
+        approx_table = np.concatenate(
+            [index.search(rows[i:i + 1], args.n)[0] for i in range(len(rows))]
+        )
+        elapsed = (time.perf_counter() - started_at) / len(rows)
+        print(
+            f"{ef:6} {recall_at_n(approx_table, exact_table):10.4f} "
+            f"{elapsed * 1e3:10.3f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="HNSW index of the BM25 user vectors for online KNN",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser(
+        "build", help="build the index from interactions.csv"
+    )
+    build_parser.add_argument("interactions", help="path to interactions.csv")
+    build_parser.add_argument("dst", help="output directory")
+    build_parser.add_argument("--weight-col", default="watched_pct")
+    build_parser.add_argument("--min-interactions", type=int, default=10)
+    build_parser.add_argument("--K1", type=float, default=1.2)
+    build_parser.add_argument("--B", type=float, default=0.75)
+    build_parser.add_argument("--M", type=int, default=16)
+    build_parser.add_argument("--ef-construction", type=int, default=200)
+    build_parser.add_argument("--threads", type=int, default=0,
+                              help="0 is all cores")
+    build_parser.set_defaults(handler=build)
+
+    recall_parser = commands.add_parser(
+        "recall", help="recall@N of the index against the exact search"
+    )
+    recall_parser.add_argument("path", help="index directory")
+    recall_parser.add_argument("--n", type=int, default=20)
+    recall_parser.add_argument("--ef", type=int, nargs="+",
+                               default=[10, 20, 50, 100, 200])
+    recall_parser.add_argument("--sample", type=int, default=1000)
+    recall_parser.add_argument("--seed", type=int, default=0)
+    recall_parser.add_argument(
+        "--engine",
+        help="UserKnn engine directory, its neighbours table is "
+             "the reference instead of the exact search",
+    )
+    recall_parser.set_defaults(handler=recall)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import json
+import os
+import typing as tp
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+
+class Manifest:
+    """
+    Version of the model artifacts and their paths.
+
+    A versioned directory `<versions_path>/<version>/` holds the
+    artifacts and `manifest.json`:
+
+        {"version": "2022-12-20", "artifacts": {"knn": "knn-columnar", ...}}
+
+    Artifact paths are relative to the version directory.
+    `<versions_path>/CURRENT` contains the version to serve.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        artifacts: tp.Dict[str, str],
+    ) -> None:
+        self.version = version
+        self.artifacts = artifacts
+
+    def path(self, artifact: str) -> str:
+        return self.artifacts[artifact]
+
+    @classmethod
+    def load(cls, version_path: str) -> "Manifest":
+        with open(
+            os.path.join(version_path, MANIFEST_FILE), encoding="utf-8"
+        ) as f:
+            manifest = json.load(f)
+        return cls(
+            version=manifest["version"],
+            artifacts={
+                name: os.path.join(version_path, path)
+                for name, path in manifest["artifacts"].items()
+            },
+        )
+
+    def save(self, version_path: str) -> None:
+        os.makedirs(version_path, exist_ok=True)
+        with open(
+            os.path.join(version_path, MANIFEST_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "version": self.version,
+                    "artifacts": {
+                        name: os.path.relpath(path, version_path)
+                        for name, path in self.artifacts.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+
+
+def check_version(version: str) -> str:
+    """A version is a directory name, never a path out of versions_path."""
+    separators = [sep for sep in (os.sep, os.altsep) if sep]
+    if version in ("", ".", "..") or any(
+        sep in version for sep in separators
+    ):
+        raise ValueError(f"Invalid model version {version!r}")
+    return version
+
+
+def read_current_version(versions_path: str) -> tp.Optional[str]:
+    try:
+        with open(
+            os.path.join(versions_path, CURRENT_FILE), encoding="utf-8"
+        ) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_current_version(versions_path: str, version: str) -> None:
+    check_version(version)
+    path = os.path.join(versions_path, CURRENT_FILE)
+    # workers polling the file never read a partially written version
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+
+
+def load_version(versions_path: str, version: str) -> Manifest:
+    manifest = Manifest.load(
+        os.path.join(versions_path, check_version(version))
+    )
+    if manifest.version != version:
+        raise ValueError(
+            f"Manifest of {version} is for version {manifest.version}"
+        )
+    return manifest
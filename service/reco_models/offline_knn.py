@@ -0,0 +1,396 @@
+import argparse
+import os
+import resource
+import sys
+import time
+import typing as tp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import dill
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from .columnar import save_columnar
+from .user_knn import _row_numbers, gather_rows
+
+Progress = tp.Callable[[str], None]
+
+
+class Interactions(tp.NamedTuple):
+    # users x items weights, rows and columns are the positions
+    # of the ids in the sorted `user_ids` and `item_ids`
+    matrix: sp.csr_matrix
+    user_ids: np.ndarray
+    item_ids: np.ndarray
+    # number of interactions of every item, and of all items
+    item_counts: np.ndarray
+    n_interactions: int
+
+
+def read_interactions(
+    path: str,
+    weight_col: tp.Optional[str] = "watched_pct",
+    min_interactions: int = 10,
+    chunk_size: int = 1_000_000,
+    progress: Progress = print,
+) -> Interactions:
+    """
+    Interactions of the hot users, the users with at least
+    `min_interactions` of them, read from the csv file in chunks.
+
+    Only the id and weight columns are kept, so the memory is bounded
+    by about 20 bytes per interaction. Missing weights are zeros.
+    """
+    columns = ["user_id", "item_id"] + ([weight_col] if weight_col else [])
+    user_chunks, item_chunks, weight_chunks = [], [], []
+    n_rows = 0
+    for chunk in pd.read_csv(
+        path,
+        usecols=columns,
+        dtype={column: np.float32 if column == weight_col else np.int64
+               for column in columns},
+        chunksize=chunk_size,
+    ):
+        user_chunks.append(chunk["user_id"].to_numpy())
+        item_chunks.append(chunk["item_id"].to_numpy())
+        weight_chunks.append(
+            chunk[weight_col].fillna(0).to_numpy()
+            if weight_col
+            else np.ones(len(chunk), dtype=np.float32)
+        )
+        n_rows += len(chunk)
+        progress(f"read {n_rows} interactions")
+
+    user_ids = np.concatenate(user_chunks)
+    item_ids = np.concatenate(item_chunks)
+    weights = np.concatenate(weight_chunks)
+    del user_chunks, item_chunks, weight_chunks
+
+    _, user_index, user_counts = np.unique(
+        user_ids, return_inverse=True, return_counts=True
+    )
+    hot = user_counts[user_index] >= min_interactions
+    user_ids, user_index = np.unique(user_ids[hot], return_inverse=True)
+    item_ids, item_index = np.unique(item_ids[hot], return_inverse=True)
+    matrix = sp.csr_matrix(
+        (weights[hot], (user_index, item_index)),
+        shape=(len(user_ids), len(item_ids)),
+        dtype=np.float32,
+    )
+    progress(
+        f"{len(user_ids)} hot users, {len(item_ids)} items, "
+        f"{len(user_index)} interactions"
+    )
+    return Interactions(
+        matrix=matrix,
+        user_ids=user_ids,
+        item_ids=item_ids,
+        item_counts=np.bincount(item_index, minlength=len(item_ids)),
+        n_interactions=len(user_index),
+    )
+
+
+def bm25_weight(
+    matrix: sp.csr_matrix,
+    K1: float = 1.2,
+    B: float = 0.75,
+) -> sp.csr_matrix:
+    """
+    BM25 weights of a users x items matrix, as `BM25Recommender.fit`
+    of implicit 0.4.4 computes them on the matrix it is given: users
+    are the documents and items are the terms, so the IDF is over the
+    users of an item and the length is the total weight of a user.
+    """
+    coo = matrix.tocoo()
+    n_users, n_items = matrix.shape
+    idf = np.log(n_users) - np.log1p(np.bincount(coo.col, minlength=n_items))
+    user_lengths = np.bincount(coo.row, weights=coo.data, minlength=n_users)
+    length_norm = (1.0 - B) + B * user_lengths / user_lengths.mean()
+    data = (
+        coo.data * (K1 + 1.0) / (K1 * length_norm[coo.row] + coo.data)
+        * idf[coo.col]
+    )
+    return sp.csr_matrix(
+        (data.astype(np.float32), (coo.row, coo.col)), shape=matrix.shape
+    )
+
+
+def item_idf(item_counts: np.ndarray, n_interactions: int) -> np.ndarray:
+    # the IDF of UserKnn._count_item_idf from the notebook
+    return np.log((1 + n_interactions) / (1 + item_counts) + 1)
+
+
+# arrays shared by the pool workers, inherited on fork
+_state: tp.Dict[str, tp.Any] = {}
+
+
+def init_worker(
+    weighted: sp.csr_matrix,
+    watched_indptr: np.ndarray,
+    watched_indices: np.ndarray,
+    idf: np.ndarray,
+    n_neighbours: int,
+    n_recs: int,
+) -> None:
+    _state.update(
+        weighted=weighted,
+        watched_indptr=watched_indptr,
+        watched_indices=watched_indices,
+        idf=idf,
+        n_neighbours=n_neighbours,
+        n_recs=n_recs,
+    )
+
+
+def nearest_neighbours(
+    weighted: sp.csr_matrix,
+    rows: np.ndarray,
+    n_neighbours: int,
+) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The `n_neighbours` users with the largest dot products of BM25
+    weights for each of the users `rows`, the user itself included,
+    as the similarity of implicit's ItemItemRecommender.
+
+    Returns the position in `rows`, the neighbour and the similarity of
+    every pair, the most similar neighbours of a row go first. Memory
+    is one dense float32 array of len(rows) x users.
+    """
+    block = weighted[rows].toarray()
+    scores = np.asarray(weighted @ block.T).T
+    k = min(n_neighbours, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    similarity = np.take_along_axis(scores, top, axis=1).ravel()
+    rows = np.repeat(np.arange(len(rows)), k)
+    neighbours = top.ravel()
+    # zero similarity is no similarity, as in a sparse product
+    valid = similarity > 0
+    rows, neighbours, similarity = (
+        rows[valid], neighbours[valid], similarity[valid]
+    )
+    order = np.lexsort((-similarity, rows))
+    return rows[order], neighbours[order], similarity[order]
+
+
+def recommend_block(
+    start: int,
+    stop: int,
+) -> tp.Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Recommendations of the users `start:stop`, as `UserKnn.predict`
+    of the notebook makes them: items watched by the neighbours but not
+    by the user, each with the similarity of the closest neighbour who
+    watched it, ordered by similarity * IDF.
+
+    Returns `start`, the number of items of every user and the items.
+    """
+    watched_indptr = _state["watched_indptr"]
+    watched_indices = _state["watched_indices"]
+    idf = _state["idf"]
+    n_items = len(idf)
+
+    rows, neighbours, similarity = nearest_neighbours(
+        _state["weighted"], np.arange(start, stop), _state["n_neighbours"]
+    )
+    # the user is not a neighbour of itself
+    other = neighbours != rows + start
+    rows, neighbours, similarity = (
+        rows[other], neighbours[other], similarity[other]
+    )
+
+    # candidates are keyed by (row, item), the first occurrence of a key
+    # is the one of the most similar neighbour
+    lengths = watched_indptr[neighbours + 1] - watched_indptr[neighbours]
+    keys = (
+        np.repeat(rows, lengths) * n_items
+        + gather_rows(watched_indptr, watched_indices, neighbours)
+    )
+    keys, first_seen = np.unique(keys, return_index=True)
+    similarity = np.repeat(similarity, lengths)[first_seen]
+
+    # vectorized removal of the items the users have watched
+    block_rows = np.arange(start, stop)
+    watched_keys = (
+        _row_numbers(watched_indptr, block_rows) * n_items
+        + gather_rows(watched_indptr, watched_indices, block_rows)
+    )
+    new = ~np.isin(keys, watched_keys)
+    keys, similarity = keys[new], similarity[new]
+    owners, items = np.divmod(keys, n_items)
+
+    order = np.lexsort((-similarity * idf[items], owners))
+    owners, items = owners[order], items[order]
+    bounds = np.searchsorted(owners, np.arange(stop - start + 1))
+    ranks = np.arange(len(owners)) - bounds[owners]
+    top = ranks < _state["n_recs"]
+    counts = np.bincount(owners[top], minlength=stop - start)
+    return start, counts, items[top]
+
+
+def build_offline_knn(
+    interactions: Interactions,
+    n_neighbours: int = 20,
+    n_recs: int = 10,
+    K1: float = 1.2,
+    B: float = 0.75,
+    block_size: int = 128,
+    workers: int = 1,
+    progress: Progress = print,
+) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Recommendations of all the users of `interactions` as ColumnarIndex
+    arrays: sorted user ids, offsets and item ids. Users without
+    recommendations are left out, as from the notebook dictionary.
+
+    Blocks of `block_size` users are processed by `workers` processes,
+    each holds about `block_size` * users * 4 bytes at a time.
+    """
+    n_users = len(interactions.user_ids)
+    initargs = (
+        bm25_weight(interactions.matrix, K1, B),
+        interactions.matrix.indptr,
+        interactions.matrix.indices,
+        item_idf(interactions.item_counts, interactions.n_interactions),
+        n_neighbours,
+        n_recs,
+    )
+    blocks = [
+        (start, min(start + block_size, n_users))
+        for start in range(0, n_users, block_size)
+    ]
+    counts = np.zeros(n_users, dtype=np.int64)
+    block_items: tp.Dict[int, np.ndarray] = {}
+
+    started_at = time.monotonic()
+    reported_at = 0.0
+    done = 0
+
+    def collect(result: tp.Tuple[int, np.ndarray, np.ndarray]) -> None:
+        nonlocal reported_at, done
+        start, block_counts, items = result
+        counts[start:start + len(block_counts)] = block_counts
+        block_items[start] = items
+        done += len(block_counts)
+        elapsed = time.monotonic() - started_at
+        # at most once a second, and at the end
+        if elapsed - reported_at >= 1.0 or done == n_users:
+            reported_at = elapsed
+            eta = elapsed / done * (n_users - done)
+            progress(
+                f"users {done}/{n_users} ({done / n_users:.0%}), "
+                f"{elapsed:.0f}s elapsed, {eta:.0f}s left"
+            )
+
+    if workers <= 1:
+        init_worker(*initargs)
+        for start, stop in blocks:
+            collect(recommend_block(start, stop))
+    else:
+        with ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=initargs
+        ) as pool:
+            futures = [
+                pool.submit(recommend_block, start, stop)
+                for start, stop in blocks
+            ]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    has_recs = counts > 0
+    offsets = np.zeros(int(has_recs.sum()) + 1, dtype=np.int64)
+    np.cumsum(counts[has_recs], out=offsets[1:])
+    items = np.concatenate(
+        [block_items[start] for start, _ in blocks] or [np.zeros(0, int)]
+    )
+    return (
+        interactions.user_ids[has_recs],
+        offsets,
+        interactions.item_ids[items].astype(np.int32),
+    )
+
+
+def peak_memory_mb() -> tp.Tuple[float, float]:
+    """Peak RSS of this process and of its largest finished child."""
+    # kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build offline user KNN recommendations "
+                    "of the hot users from interactions.csv",
+    )
+    parser.add_argument("interactions", help="path to interactions.csv")
+    parser.add_argument(
+        "dst",
+        help="output directory of the columnar format, "
+             "or a file with --dill",
+    )
+    parser.add_argument("--dill", action="store_true",
+                        help="write a dill'd {user_id: items} dictionary")
+    parser.add_argument("--weight-col", default="watched_pct")
+    parser.add_argument("--min-interactions", type=int, default=10)
+    parser.add_argument("--neighbours", type=int, default=20)
+    parser.add_argument("--recs", type=int, default=10)
+    parser.add_argument("--K1", type=float, default=1.2)
+    parser.add_argument("--B", type=float, default=0.75)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--block-size", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    started_at = time.monotonic()
+
+    def progress(message: str) -> None:
+        print(
+            f"[{time.monotonic() - started_at:7.1f}s] {message}",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    interactions = read_interactions(
+        args.interactions,
+        weight_col=args.weight_col or None,
+        min_interactions=args.min_interactions,
+        chunk_size=args.chunk_size,
+        progress=progress,
+    )
+    user_ids, offsets, item_ids = build_offline_knn(
+        interactions,
+        n_neighbours=args.neighbours,
+        n_recs=args.recs,
+        K1=args.K1,
+        B=args.B,
+        block_size=args.block_size,
+        workers=args.workers,
+        progress=progress,
+    )
+    if args.dill:
+        with open(args.dst, "wb") as f:
+            dill.dump(
+                {
+                    int(user_id): item_ids[start:stop].tolist()
+                    for user_id, start, stop in zip(
+                        user_ids, offsets[:-1], offsets[1:]
+                    )
+                },
+                f,
+            )
+    else:
+        save_columnar(args.dst, user_ids, offsets, item_ids)
+
+    main_mb, worker_mb = peak_memory_mb()
+    progress(
+        f"wrote recommendations of {len(user_ids)} users to {args.dst}, "
+        f"peak memory {main_mb:.0f} MB, "
+        f"of the largest worker process {worker_mb:.0f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
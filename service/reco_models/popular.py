@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import pickle
+import typing as tp
+from bisect import bisect_left
+
+import numpy as np
+
+from .reco_models import SimplePopularModel
+
+USER_IDS_FILE = "user_ids.npy"
+USER_CATEGORIES_FILE = "user_categories.npy"
+RECS_FILE = "recs.npy"
+RECS_LENGTHS_FILE = "recs_lengths.npy"
+CATEGORIES_FILE = "categories.json"
+
+POPULAR_FOR_ALL = "popular_for_all"
+# max uint32, user ids outside [0, MAX_USER_ID) are unknown
+MAX_USER_ID = 2**32
+
+
+class CompactPopularModel:  # pylint: disable=too-many-instance-attributes
+    """
+    SimplePopularModel on flat arrays.
+
+    Users are a sorted uint32 id array with a parallel uint8 array
+    of category codes, popular items of the categories are the rows
+    of a 2-D array padded with -1 to the longest list. Users that are
+    not in the index get the `popular_for_all` row.
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        user_categories: np.ndarray,
+        recs: np.ndarray,
+        recs_lengths: np.ndarray,
+        categories: tp.List[str],
+    ) -> None:
+        self.user_ids = user_ids
+        self.user_categories = user_categories
+        self.recs = recs
+        self.recs_lengths = recs_lengths
+        self.categories = categories
+        self.default_code = categories.index(POPULAR_FOR_ALL)
+        # a scalar numpy searchsorted costs several microseconds,
+        # bisect over the buffers of the same arrays is much cheaper
+        self._user_ids_view = np.ascontiguousarray(user_ids).data
+        self._user_categories_view = (
+            np.ascontiguousarray(user_categories).data
+        )
+        self._rows: tp.Dict[int, tp.List[tp.List[int]]] = {}
+
+    @classmethod
+    def from_dictionaries(
+        cls,
+        users_dictionary: tp.Mapping[int, str],
+        popular_dictionary: tp.Mapping[str, tp.Sequence[int]],
+    ) -> "CompactPopularModel":
+        categories = list(popular_dictionary)
+        if len(categories) > np.iinfo(np.uint8).max + 1:
+            raise ValueError(
+                f"{len(categories)} categories do not fit into uint8 codes"
+            )
+        codes = {category: code for code, category in enumerate(categories)}
+        default_code = codes[POPULAR_FOR_ALL]
+
+        user_ids = np.fromiter(
+            users_dictionary.keys(), dtype=np.int64,
+            count=len(users_dictionary),
+        )
+        if len(user_ids) and (
+            user_ids.min() < 0 or user_ids.max() >= MAX_USER_ID
+        ):
+            raise ValueError("User ids do not fit into uint32")
+        # users of the categories without popular items get popular_for_all,
+        # as SimplePopularModel.predict does
+        user_categories = np.fromiter(
+            (
+                codes.get(category, default_code)
+                for category in users_dictionary.values()
+            ),
+            dtype=np.uint8,
+            count=len(users_dictionary),
+        )
+        order = np.argsort(user_ids, kind="stable")
+
+        recs_lengths = np.array(
+            [len(popular_dictionary[category]) for category in categories],
+            dtype=np.int64,
+        )
+        recs = np.full(
+            (len(categories), max(recs_lengths, default=0)), -1,
+            dtype=np.int64,
+        )
+        for code, category in enumerate(categories):
+            recs[code, :recs_lengths[code]] = popular_dictionary[category]
+
+        return cls(
+            user_ids=user_ids[order].astype(np.uint32),
+            user_categories=user_categories[order],
+            recs=recs,
+            recs_lengths=recs_lengths,
+            categories=categories,
+        )
+
+    @classmethod
+    def from_pickles(
+        cls,
+        users_path: str,
+        recs_path: str,
+    ) -> "CompactPopularModel":
+        with open(users_path, "rb") as f:
+            users_dictionary = pickle.load(f)
+        with open(recs_path, "rb") as f:
+            popular_dictionary = pickle.load(f)
+        return cls.from_dictionaries(users_dictionary, popular_dictionary)
+
+    @classmethod
+    def load(cls, path: str) -> "CompactPopularModel":
+        def _load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        with open(
+            os.path.join(path, CATEGORIES_FILE), encoding="utf-8"
+        ) as f:
+            categories = json.load(f)
+        return cls(
+            user_ids=_load(USER_IDS_FILE),
+            user_categories=_load(USER_CATEGORIES_FILE),
+            recs=_load(RECS_FILE),
+            recs_lengths=_load(RECS_LENGTHS_FILE),
+            categories=categories,
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, USER_IDS_FILE), self.user_ids)
+        np.save(os.path.join(path, USER_CATEGORIES_FILE), self.user_categories)
+        np.save(os.path.join(path, RECS_FILE), self.recs)
+        np.save(os.path.join(path, RECS_LENGTHS_FILE), self.recs_lengths)
+        with open(
+            os.path.join(path, CATEGORIES_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump(self.categories, f, ensure_ascii=False)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes for array in (
+                self.user_ids,
+                self.user_categories,
+                self.recs,
+                self.recs_lengths,
+            )
+        )
+
+    def code(self, user_id: int) -> int:
+        if not 0 <= user_id < MAX_USER_ID:
+            return self.default_code
+        user_ids = self._user_ids_view
+        idx = bisect_left(user_ids, user_id)
+        if idx < len(user_ids) and user_ids[idx] == user_id:
+            return self._user_categories_view[idx]
+        return self.default_code
+
+    def codes(self, user_ids: tp.Sequence[int]) -> np.ndarray:
+        ids = np.fromiter(user_ids, dtype=np.int64, count=len(user_ids))
+        if len(self.user_ids) == 0:
+            return np.full(len(ids), self.default_code)
+        valid = (ids >= 0) & (ids < MAX_USER_ID)
+        # uint32 queries, otherwise numpy casts the whole index to int64
+        queries = np.where(valid, ids, 0).astype(np.uint32)
+        idx = np.searchsorted(self.user_ids, queries)
+        np.minimum(idx, len(self.user_ids) - 1, out=idx)
+        found = valid & (self.user_ids[idx] == queries)
+        return np.where(found, self.user_categories[idx], self.default_code)
+
+    def rows(self, k_recs: int) -> tp.List[tp.List[int]]:
+        """Top `k_recs` items of every category as lists, cached per k."""
+        rows = self._rows.get(k_recs)
+        if rows is None:
+            rows = self._rows[k_recs] = [
+                self.recs[code, :min(k_recs, length)].tolist()
+                for code, length in enumerate(self.recs_lengths)
+            ]
+        return rows
+
+    def predict(self, user_id: int, k_recs: int) -> tp.List[int]:
+        return list(self.rows(k_recs)[self.code(user_id)])
+
+    def predict_batch(
+        self,
+        user_ids: tp.Sequence[int],
+        k_recs: int,
+    ) -> tp.List[tp.List[int]]:
+        # one list per category, shared by the users of the category
+        rows = self.rows(k_recs)
+        return [rows[code] for code in self.codes(user_ids).tolist()]
+
+    def category(self, user_id: int) -> str:
+        return self.categories[self.code(user_id)]
+
+    def predict_category(self, category: str, k_recs: int) -> tp.List[int]:
+        return list(self.rows(k_recs)[self.categories.index(category)])
+
+
+PopularModel = tp.Union[SimplePopularModel, CompactPopularModel]
+
+
+def to_compact(model: PopularModel) -> CompactPopularModel:
+    if isinstance(model, CompactPopularModel):
+        return model
+    return CompactPopularModel.from_dictionaries(
+        model.users_dictionary, model.popular_dictionary
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert users and popular dictionaries "
+                    "to the CompactPopularModel format",
+    )
+    parser.add_argument("users", help="path to users_dictionary.pickle")
+    parser.add_argument("recs", help="path to popular_dictionary.pickle")
+    parser.add_argument("dst", help="output directory")
+    args = parser.parse_args()
+    CompactPopularModel.from_pickles(args.users, args.recs).save(args.dst)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import pickle
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 import dill
+import numpy as np
+
+from .columnar import ColumnarIndex
 
 
 class SimplePopularModel:
@@ -21,6 +24,37 @@ class SimplePopularModel:
             reco = self.popular_dictionary['popular_for_all'][:k_recs]
         return reco
 
+    def predict_batch(
+        self,
+        user_ids: Sequence[int],
+        k_recs: int,
+    ) -> List[List[int]]:
+        # срезаем списки один раз на категорию, а не на каждого юзера
+        popular_for_all = self.popular_dictionary['popular_for_all'][:k_recs]
+        category_recs = {
+            category: reco[:k_recs]
+            for category, reco in self.popular_dictionary.items()
+        }
+        return [
+            category_recs.get(
+                self.users_dictionary.get(user_id), popular_for_all
+            )
+            for user_id in user_ids
+        ]
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self.popular_dictionary)
+
+    def category(self, user_id: int) -> str:
+        category = self.users_dictionary.get(user_id)
+        if category not in self.popular_dictionary:
+            return 'popular_for_all'
+        return category
+
+    def predict_category(self, category: str, k_recs: int) -> List[int]:
+        return self.popular_dictionary[category][:k_recs]
+
 
 class KnnModel(ABC):
     def __init__(self, name: str):
@@ -31,6 +65,13 @@ class KnnModel(ABC):
     def predict(self, user_id: int) -> Optional[List[int]]:
         pass
 
+    @abstractmethod
+    def predict_batch(
+        self,
+        user_ids: Sequence[int],
+    ) -> List[Optional[List[int]]]:
+        pass
+
 
 class OfflineKnnModel(KnnModel):
     def predict(self, user_id: int) -> Optional[List[int]]:
@@ -38,7 +79,51 @@ class OfflineKnnModel(KnnModel):
             return self.model[user_id]
         return None
 
+    @property
+    def user_ids(self) -> List[int]:
+        return list(self.model.keys())
+
+    def predict_batch(
+        self,
+        user_ids: Sequence[int],
+    ) -> List[Optional[List[int]]]:
+        return [self.model.get(user_id) for user_id in user_ids]
+
 
 class OnlineKnnModel(KnnModel):
     def predict(self, user_id: int) -> Optional[List[int]]:
         return self.model.predict(user_id)
+
+    def predict_batch(
+        self,
+        user_ids: Sequence[int],
+    ) -> List[Optional[List[int]]]:
+        # модель из ноутбука умеет предсказывать только по одному юзеру
+        return [self.model.predict(user_id) for user_id in user_ids]
+
+
+class ColumnarKnnModel:
+    # оффлайн рекомендации в memory-mapped формате (см. columnar.py):
+    # ничего не распаковывается при старте, а страницы файлов
+    # разделяются между всеми воркерами
+    def __init__(self, path: str):
+        self.index = ColumnarIndex.load(path)
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        return self.index.user_ids
+
+    def predict(self, user_id: int) -> Optional[List[int]]:
+        items = self.index.get(user_id)
+        if items is None:
+            return None
+        return items.tolist()
+
+    def predict_batch(
+        self,
+        user_ids: Sequence[int],
+    ) -> List[Optional[List[int]]]:
+        return [
+            None if items is None else items.tolist()
+            for items in self.index.get_batch(user_ids)
+        ]
@@ -0,0 +1,185 @@
+import threading
+import time
+import typing as tp
+
+from .manifest import Manifest
+
+M = tp.Any
+# called with the manifest of the version to load the model from
+# and the keyword arguments of ModelRegistry.loader_options
+Loader = tp.Callable[..., M]
+# called with the model, the user ids to predict for
+# and the keyword arguments of ModelRegistry.warm_up_options
+WarmUp = tp.Callable[..., tp.Any]
+
+
+class ModelEntry:  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        name: str,
+        loader: Loader,
+        warm_up: tp.Optional[WarmUp],
+        manifest: tp.Optional[Manifest],
+    ) -> None:
+        self.name = name
+        self.loader = loader
+        self.warm_up = warm_up
+        self.manifest = manifest
+        self.model: tp.Optional[M] = None
+        self.loaded = False
+        self.load_seconds: tp.Optional[float] = None
+        self.warm_up_seconds: tp.Optional[float] = None
+        self.lock = threading.Lock()
+
+    def status(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "warm_up_seconds": self.warm_up_seconds,
+        }
+
+
+class ModelVersion:
+    """
+    The models of one version of the registry. A reload swaps in
+    another ModelVersion, this one keeps its models and `version`,
+    so that callers get every model of a request from one version.
+    """
+
+    def __init__(
+        self,
+        manifest: tp.Optional[Manifest],
+        entries: tp.Dict[str, ModelEntry],
+        load: tp.Callable[[ModelEntry], None],
+    ) -> None:
+        self.manifest = manifest
+        self.entries = entries
+        self._load = load
+
+    @property
+    def version(self) -> tp.Optional[str]:
+        return self.manifest.version if self.manifest is not None else None
+
+    def get(self, name: str) -> M:
+        entry = self.entries[name]
+        if not entry.loaded:
+            self._load(entry)
+        return entry.model
+
+
+class ModelRegistry:
+    """
+    Models by name, each loaded by its loader on first use.
+
+    A model is available only after its warm-up predictions for
+    `warm_up_user_ids`, so the first request served by a model does not
+    pay for cold caches and page faults. `get` is thread-safe:
+    concurrent callers wait for a single load.
+
+    `reload` loads and warms up another version next to the current
+    one and then swaps them with a single assignment. Callers that got
+    a model of the old version keep using it until they are done, and
+    callers that need several models of one version take `current()`.
+
+    `loader_options[name]` and `warm_up_options[name]` are keyword
+    arguments of the loader and the warm-up of `name`, the service
+    settings the artifacts do not carry.
+    """
+
+    def __init__(
+        self,
+        manifest: tp.Optional[Manifest] = None,
+        warm_up_user_ids: tp.Sequence[int] = (),
+        on_load: tp.Optional[tp.Callable[[str, float], None]] = None,
+    ) -> None:
+        self.warm_up_user_ids = list(warm_up_user_ids)
+        self.on_load = on_load
+        self.loader_options: tp.Dict[str, tp.Dict[str, tp.Any]] = {}
+        self.warm_up_options: tp.Dict[str, tp.Dict[str, tp.Any]] = {}
+        self._current = ModelVersion(manifest, {}, self._load)
+        self._reload_lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    @property
+    def _entries(self) -> tp.Dict[str, ModelEntry]:
+        return self._current.entries
+
+    @property
+    def manifest(self) -> tp.Optional[Manifest]:
+        return self._current.manifest
+
+    @property
+    def names(self) -> tp.List[str]:
+        return list(self._entries)
+
+    @property
+    def version(self) -> tp.Optional[str]:
+        return self._current.version
+
+    def current(self) -> ModelVersion:
+        """The models and the version to serve now."""
+        return self._current
+
+    def register(
+        self,
+        name: str,
+        loader: Loader,
+        warm_up: tp.Optional[WarmUp] = None,
+    ) -> None:
+        if name in self._entries:
+            raise ValueError(f"Model {name} is already registered")
+        self._entries[name] = ModelEntry(name, loader, warm_up, self.manifest)
+
+    def get(self, name: str) -> M:
+        return self._current.get(name)
+
+    def load(self, names: tp.Optional[tp.Iterable[str]] = None) -> None:
+        for name in self.names if names is None else names:
+            self._load(self._entries[name])
+
+    def reload(self, manifest: Manifest) -> None:
+        """Switch to `manifest`, the models loaded now are loaded anew."""
+        with self._reload_lock:
+            entries = {
+                name: ModelEntry(name, entry.loader, entry.warm_up, manifest)
+                for name, entry in self._entries.items()
+            }
+            for name, entry in entries.items():
+                if self._entries[name].loaded:
+                    self._load(entry)
+            # a failed load above leaves the current version in place
+            self._current = ModelVersion(manifest, entries, self._load)
+
+    def _load(self, entry: ModelEntry) -> None:
+        with entry.lock:
+            if entry.loaded:
+                return
+
+            started_at = time.perf_counter()
+            model = entry.loader(
+                entry.manifest, **self.loader_options.get(entry.name, {})
+            )
+            entry.load_seconds = time.perf_counter() - started_at
+            if self.on_load is not None:
+                self.on_load(entry.name, entry.load_seconds)
+
+            if entry.warm_up is not None:
+                started_at = time.perf_counter()
+                entry.warm_up(
+                    model,
+                    self.warm_up_user_ids,
+                    **self.warm_up_options.get(entry.name, {}),
+                )
+                entry.warm_up_seconds = time.perf_counter() - started_at
+            entry.model = model
+            entry.loaded = True
+
+    def is_ready(self, names: tp.Iterable[str]) -> bool:
+        return all(self._entries[name].loaded for name in names)
+
+    def status(self) -> tp.Dict[str, tp.Dict[str, tp.Any]]:
+        return {
+            name: entry.status() for name, entry in self._entries.items()
+        }
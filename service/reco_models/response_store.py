@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import shutil
+import typing as tp
+
+import numpy as np
+import orjson
+
+from .columnar import ITEM_IDS_FILE, OFFSETS_FILE, USER_IDS_FILE, ColumnarIndex
+from .popular import PopularModel
+from .reco_models import SimplePopularModel
+
+META_FILE = "meta.json"
+
+Items = tp.Union[tp.Sequence[int], np.ndarray]
+
+# byte-identical to service.response.reco_response
+BODY_TEMPLATE = b'{"user_id":%d,"items":%s}'
+
+
+def dump_items(items: tp.Any) -> bytes:
+    return orjson.dumps(items, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class ResponseStore:
+    """
+    Ready-to-send JSON bodies of `knn` responses.
+
+    Bodies of the users with knn recos are stored in a ColumnarIndex
+    of bytes, so a request costs one binary search and one slice
+    of the mmap'ed blob. Everybody else gets the popular fallback,
+    whose items are serialized once per category and `k_recs`.
+
+    `popular_model` is called for every fallback, so that they come
+    from the model served now, e.g. the last snapshot of the popularity
+    stream, and the bodies are serialized again when it changes.
+    """
+
+    def __init__(
+        self,
+        index: ColumnarIndex,
+        k_recs: int,
+        popular_model: tp.Callable[[], PopularModel],
+    ) -> None:
+        self.index = index
+        self.k_recs = k_recs
+        self.popular_model = popular_model
+        # the model the bodies of _popular_items are serialized from
+        self._popular_items_model: tp.Optional[PopularModel] = None
+        self._popular_items: tp.Dict[int, tp.Dict[str, bytes]] = {}
+
+    @classmethod
+    def build(
+        cls,
+        user_ids: tp.Sequence[int],
+        recos: tp.Sequence[tp.Optional[Items]],
+        popular_model: tp.Callable[[], PopularModel],
+        k_recs: int,
+    ) -> "ResponseStore":
+        ids = np.asarray(user_ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        stored = []
+        bodies = []
+        for i in order:
+            user_id = int(ids[i])
+            reco = recos[int(i)]
+            # same fallbacks as service.recommend.predict
+            try:
+                if reco is None or len(reco) == 0:
+                    # not stored, served by popular_body
+                    continue
+                items = dump_items(reco)
+            except TypeError:
+                items = dump_items(list(range(k_recs)))
+            stored.append(user_id)
+            bodies.append(BODY_TEMPLATE % (user_id, items))
+
+        offsets = np.zeros(len(bodies) + 1, dtype=np.int64)
+        np.cumsum([len(body) for body in bodies], out=offsets[1:])
+        index = ColumnarIndex(
+            np.asarray(stored, dtype=np.int64),
+            offsets,
+            np.frombuffer(b"".join(bodies), dtype=np.uint8),
+        )
+        return cls(index, k_recs, popular_model)
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        popular_model: tp.Callable[[], PopularModel],
+    ) -> "ResponseStore":
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(ColumnarIndex.load(path), meta["k_recs"], popular_model)
+
+    def save(self, path: str) -> None:
+        """
+        Written next to `path` and moved in place: workers that start
+        meanwhile never load a partially written store, and the ones
+        that have mmap'ed the replaced files keep them.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, USER_IDS_FILE), self.index.user_ids)
+        np.save(os.path.join(tmp_path, OFFSETS_FILE), self.index.offsets)
+        np.save(os.path.join(tmp_path, ITEM_IDS_FILE), self.index.item_ids)
+        with open(
+            os.path.join(tmp_path, META_FILE), "w", encoding="utf-8"
+        ) as f:
+            json.dump({"k_recs": self.k_recs}, f)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+
+    def popular_body(self, user_id: int, k_recs: int) -> bytes:
+        popular_model = self.popular_model()
+        if popular_model is not self._popular_items_model:
+            self._popular_items = {}
+            self._popular_items_model = popular_model
+        popular_items = self._popular_items.get(k_recs)
+        if popular_items is None:
+            popular_items = {
+                category: dump_items(
+                    popular_model.predict_category(category, k_recs)
+                )
+                for category in popular_model.categories
+            }
+            self._popular_items[k_recs] = popular_items
+        category = popular_model.category(user_id)
+        return BODY_TEMPLATE % (user_id, popular_items[category])
+
+    def get(self, user_id: int) -> bytes:
+        body = self.index.get(user_id)
+        if body is None:
+            return self.popular_body(user_id, self.k_recs)
+        return body.tobytes()
+
+
+def main() -> None:
+    # pylint: disable=import-outside-toplevel
+    from config.configuration import (
+        OFFLINE_KNN_COLUMNAR_PATH,
+        OFFLINE_KNN_MODEL_PATH,
+        POPULAR_MODEL_RECS,
+        POPULAR_MODEL_USERS,
+        PREBUILT_RESPONSES_PATH,
+    )
+
+    from .reco_models import ColumnarKnnModel, OfflineKnnModel
+
+    parser = argparse.ArgumentParser(
+        description="Precompute knn response bodies for every known user",
+    )
+    parser.add_argument("--k-recs", type=int, default=10)
+    parser.add_argument("--dst", default=PREBUILT_RESPONSES_PATH)
+    args = parser.parse_args()
+
+    offline_knn_model: tp.Union[ColumnarKnnModel, OfflineKnnModel] = (
+        ColumnarKnnModel(OFFLINE_KNN_COLUMNAR_PATH)
+        if os.path.isdir(OFFLINE_KNN_COLUMNAR_PATH)
+        else OfflineKnnModel(OFFLINE_KNN_MODEL_PATH)
+    )
+    popular_model = SimplePopularModel(POPULAR_MODEL_USERS, POPULAR_MODEL_RECS)
+    user_ids = np.asarray(offline_knn_model.user_ids).tolist()
+    ResponseStore.build(
+        user_ids,
+        offline_knn_model.predict_batch(user_ids),
+        lambda: popular_model,
+        args.k_recs,
+    ).save(args.dst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import heapq
+import json
+import os
+import time
+import typing as tp
+from collections import Counter
+from operator import itemgetter
+
+import numpy as np
+
+from .popular import (
+    POPULAR_FOR_ALL,
+    CompactPopularModel,
+    PopularModel,
+    to_compact,
+)
+
+_by_count = itemgetter(1)
+
+
+class PopularityWindow:
+    """
+    Item counts per category over the events of the last
+    `window_buckets` time buckets of `bucket_seconds`, as the
+    `delta_days` windows of notebooks/hw_3_popular.ipynb.
+
+    An event updates the counts of its bucket and the totals of the
+    window, each in O(1). The window ends at the bucket of the latest
+    event: when it moves on, the buckets that fall out are subtracted
+    from the totals, so every event is counted and uncounted once.
+    Events older than the window are dropped.
+
+    Not thread-safe, it has a single writer.
+    """
+
+    def __init__(self, bucket_seconds: float, window_buckets: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.last_bucket: tp.Optional[int] = None
+        # bucket -> category -> item -> count
+        self._buckets: tp.Dict[int, tp.Dict[str, tp.Counter[int]]] = {}
+        # category -> item -> count over all the buckets
+        self._totals: tp.Dict[str, tp.Counter[int]] = {}
+        # categories with counts changed since the last `pop_dirty`
+        self._dirty: tp.Set[str] = set()
+
+    def add(self, category: str, item_id: int, timestamp: float) -> bool:
+        bucket = int(timestamp // self.bucket_seconds)
+        if self.last_bucket is None or bucket > self.last_bucket:
+            self.last_bucket = bucket
+            self._expire()
+        elif bucket <= self.last_bucket - self.window_buckets:
+            return False
+
+        categories = self._buckets.get(bucket)
+        if categories is None:
+            categories = self._buckets[bucket] = {}
+        counts = categories.get(category)
+        if counts is None:
+            counts = categories[category] = Counter()
+        counts[item_id] += 1
+
+        totals = self._totals.get(category)
+        if totals is None:
+            totals = self._totals[category] = Counter()
+        totals[item_id] += 1
+        self._dirty.add(category)
+        return True
+
+    def _expire(self) -> None:
+        assert self.last_bucket is not None
+        oldest = self.last_bucket - self.window_buckets + 1
+        for bucket in [bucket for bucket in self._buckets if bucket < oldest]:
+            for category, counts in self._buckets.pop(bucket).items():
+                totals = self._totals[category]
+                for item_id, count in counts.items():
+                    left = totals[item_id] - count
+                    if left:
+                        totals[item_id] = left
+                    else:
+                        # the totals hold the items of the window only
+                        del totals[item_id]
+                self._dirty.add(category)
+
+    def top(self, category: str, k: int) -> tp.List[int]:
+        """
+        The `k` most popular items of `category`, heap-selected from the
+        totals in O(n log k) for the n items of the window. It is called
+        on publish for the changed categories only, and keeps `add` O(1):
+        a heap kept per category would be updated by every event and,
+        as expired buckets lower the counts, filled with stale entries.
+        """
+        totals = self._totals.get(category)
+        if not totals:
+            return []
+        return [
+            item_id
+            for item_id, _ in heapq.nlargest(k, totals.items(), key=_by_count)
+        ]
+
+    @property
+    def changed(self) -> bool:
+        return bool(self._dirty)
+
+    def pop_dirty(self) -> tp.Set[str]:
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "buckets": len(self._buckets),
+            "last_bucket_start": None if self.last_bucket is None
+            else self.last_bucket * self.bucket_seconds,
+            "items": {
+                category: len(totals)
+                for category, totals in self._totals.items()
+            },
+        }
+
+
+class StreamingPopularity:  # pylint: disable=too-many-instance-attributes
+    """
+    Popular recommendations counted from a stream of interactions.
+
+    Events are counted in a PopularityWindow by the category of the
+    user in the `base` model, and for popular_for_all. `publish`
+    builds a new CompactPopularModel on the users of `base`, converted
+    once per loaded model when it is a SimplePopularModel, with the
+    top `k_recs` items of every category, filled up with the items
+    of `base` when the window has fewer, and swaps it in with a single
+    assignment: readers take `snapshot` and never wait for a lock.
+
+    `add` and `publish` are called by a single writer, the event loop.
+    """
+
+    def __init__(
+        self,
+        base: tp.Callable[[], PopularModel],
+        window: PopularityWindow,
+        k_recs: int = 20,
+        clock: tp.Callable[[], float] = time.time,
+    ) -> None:
+        self.base = base
+        self.window = window
+        self.k_recs = k_recs
+        self.clock = clock
+        self.snapshot: tp.Optional[CompactPopularModel] = None
+        self.published_at: tp.Optional[float] = None
+        self._tops: tp.Dict[str, tp.List[int]] = {}
+        # the base model of `snapshot`
+        self.published_base: tp.Optional[PopularModel] = None
+        self._compact_base: tp.Optional[CompactPopularModel] = None
+        self.n_events = 0
+        self.n_dropped = 0
+
+    def add(
+        self,
+        user_id: int,
+        item_id: int,
+        timestamp: tp.Optional[float] = None,
+    ) -> bool:
+        if timestamp is None:
+            timestamp = self.clock()
+        category = self.base().category(user_id)
+        if not self.window.add(POPULAR_FOR_ALL, item_id, timestamp):
+            self.n_dropped += 1
+            return False
+        if category != POPULAR_FOR_ALL:
+            self.window.add(category, item_id, timestamp)
+        self.n_events += 1
+        return True
+
+    @property
+    def stale(self) -> bool:
+        """The window or, after a reload, the base model has changed."""
+        return self.window.changed or (
+            self.snapshot is not None
+            and self.base() is not self.published_base
+        )
+
+    def publish(self) -> CompactPopularModel:
+        loaded = self.base()
+        if loaded is not self.published_base or self._compact_base is None:
+            self._compact_base = to_compact(loaded)
+        base = self._compact_base
+        # only the categories with new or expired events are ranked again
+        for category in self.window.pop_dirty():
+            self._tops[category] = self.window.top(category, self.k_recs)
+
+        rows = base.rows(self.k_recs)
+        recs = np.full(
+            (len(base.categories), self.k_recs), -1, dtype=np.int64
+        )
+        recs_lengths = np.zeros(len(base.categories), dtype=np.int64)
+        for code, category in enumerate(base.categories):
+            top = self._tops.get(category, [])
+            seen = set(top)
+            row = top + [item for item in rows[code] if item not in seen]
+            row = row[:self.k_recs]
+            recs[code, :len(row)] = row
+            recs_lengths[code] = len(row)
+
+        snapshot = CompactPopularModel(
+            user_ids=base.user_ids,
+            user_categories=base.user_categories,
+            recs=recs,
+            recs_lengths=recs_lengths,
+            categories=base.categories,
+        )
+        self.snapshot = snapshot
+        self.published_base = loaded
+        self.published_at = self.clock()
+        return snapshot
+
+    def stats(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "events": self.n_events,
+            "dropped": self.n_dropped,
+            "published_at": self.published_at,
+            **self.window.stats(),
+        }
+
+
+def parse_event(
+    line: tp.Union[str, bytes],
+) -> tp.Tuple[int, int, tp.Optional[float]]:
+    """`{"user_id": 1, "item_id": 2, "timestamp": 1671000000.0}`."""
+    event = json.loads(line)
+    timestamp = event.get("timestamp")
+    return (
+        int(event["user_id"]),
+        int(event["item_id"]),
+        None if timestamp is None else float(timestamp),
+    )
+
+
+class EventFileReader:
+    """
+    Reads the lines appended to a file of JSON events since the last
+    call, as `tail -F`: a line is read once it ends with a newline, and
+    the file is read from the start again when it is replaced or
+    truncated.
+    """
+
+    def __init__(self, path: str, from_end: bool = True) -> None:
+        self.path = path
+        self._file: tp.Optional[tp.BinaryIO] = None
+        self._inode: tp.Optional[int] = None
+        self._partial = b""
+        self._from_end = from_end
+
+    def _reopen(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return self._file is not None
+        if self._file is not None and stat.st_ino == self._inode:
+            if stat.st_size < self._file.tell():
+                self._file.seek(0)
+                self._partial = b""
+            return True
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "rb")  # pylint: disable=R1732
+        self._inode = stat.st_ino
+        self._partial = b""
+        if self._from_end:
+            # the events written before the service started are skipped
+            self._file.seek(0, os.SEEK_END)
+            self._from_end = False
+        return True
+
+    def read_lines(self) -> tp.List[bytes]:
+        if not self._reopen():
+            return []
+        assert self._file is not None
+        data = self._partial + self._file.read()
+        *lines, self._partial = data.split(b"\n")
+        return [line for line in lines if line.strip()]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
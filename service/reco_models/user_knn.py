@@ -0,0 +1,407 @@
+import argparse
+import os
+import typing as tp
+
+import dill
+import numpy as np
+
+USER_IDS_FILE = "user_ids.npy"
+ITEM_IDS_FILE = "item_ids.npy"
+ITEM_IDF_FILE = "item_idf.npy"
+WATCHED_INDPTR_FILE = "watched_indptr.npy"
+WATCHED_INDICES_FILE = "watched_indices.npy"
+NEIGHBOURS_FILE = "neighbours.npy"
+NEIGHBOUR_SCORES_FILE = "neighbour_scores.npy"
+# neighbour lists of the artifacts saved before the fixed-width table
+NEIGHBOURS_INDPTR_FILE = "neighbours_indptr.npy"
+NEIGHBOURS_INDICES_FILE = "neighbours_indices.npy"
+
+
+def gather_rows(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    rows: np.ndarray,
+) -> np.ndarray:
+    """Concatenate CSR rows `rows` without a Python loop over rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return indices[:0]
+    row_offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(total) + np.repeat(starts - row_offsets, lengths)
+    return indices[positions]
+
+
+def top_k_smallest(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k smallest scores, ties broken by position."""
+    if len(scores) > k:
+        kth = np.partition(scores, k - 1)[k - 1]
+        positions = np.flatnonzero(scores <= kth)
+    else:
+        positions = np.arange(len(scores))
+    order = np.argsort(scores[positions], kind="stable")
+    return positions[order[:k]]
+
+
+class UserKnn:  # pylint: disable=too-many-instance-attributes
+    """
+    Inference engine for the online user KNN model.
+
+    Users are indexed by their position in the sorted `user_ids` array.
+    Watched histories are CSR arrays over internal ids, IDF is a dense
+    array indexed by internal item id. Precomputed neighbours are
+    a fixed-width users x N table of int32 internal ids, the closest
+    first and padded with -1, and a float32 table of their similarity.
+    Nothing but numpy is needed to load and serve the model.
+
+    With a `neighbour_index` (see hnsw.py) the neighbours are searched
+    in the index at request time instead of read from the table.
+
+    Recommendations match `UserKnnBM25.predict` from
+    notebooks/hw_3_userknn.ipynb: items watched by the neighbours
+    (the closest neighbour first) that the user has not watched,
+    ordered by ascending IDF. Ties are broken by first occurrence,
+    where the pandas implementation left the order unspecified.
+    """
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        item_ids: np.ndarray,
+        item_idf: np.ndarray,
+        watched_indptr: np.ndarray,
+        watched_indices: np.ndarray,
+        neighbours: np.ndarray,
+        neighbour_scores: np.ndarray,
+    ) -> None:
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.item_idf = item_idf
+        self.watched_indptr = watched_indptr
+        self.watched_indices = watched_indices
+        self.neighbours_table = neighbours
+        self.neighbour_scores = neighbour_scores
+        self.neighbour_index: tp.Optional[tp.Any] = None
+
+    @classmethod
+    def load(cls, path: str) -> "UserKnn":
+        def _load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        if not os.path.exists(os.path.join(path, NEIGHBOURS_FILE)):
+            raise FileNotFoundError(
+                f"No neighbours table in {path}, neighbour lists are "
+                f"converted by: python -m service.reco_models.user_knn "
+                f"upgrade {path}"
+            )
+        return cls(
+            user_ids=_load(USER_IDS_FILE),
+            item_ids=_load(ITEM_IDS_FILE),
+            item_idf=_load(ITEM_IDF_FILE),
+            watched_indptr=_load(WATCHED_INDPTR_FILE),
+            watched_indices=_load(WATCHED_INDICES_FILE),
+            neighbours=_load(NEIGHBOURS_FILE),
+            neighbour_scores=_load(NEIGHBOUR_SCORES_FILE),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            USER_IDS_FILE: self.user_ids,
+            ITEM_IDS_FILE: self.item_ids,
+            ITEM_IDF_FILE: self.item_idf,
+            WATCHED_INDPTR_FILE: self.watched_indptr,
+            WATCHED_INDICES_FILE: self.watched_indices,
+            NEIGHBOURS_FILE: self.neighbours_table,
+            NEIGHBOUR_SCORES_FILE: self.neighbour_scores,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name), array)
+
+    @classmethod
+    def from_user_knn_bm25(cls, model: tp.Any) -> "UserKnn":
+        """Build the engine from a fitted notebook `UserKnnBM25`."""
+        n_users = len(model.users_inv_mapping)
+        legacy_user_ids = np.array(
+            [model.users_inv_mapping[i] for i in range(n_users)],
+            dtype=np.int64,
+        )
+        order = np.argsort(legacy_user_ids, kind="stable")
+        internal_ids = np.empty(n_users, dtype=np.int64)
+        internal_ids[order] = np.arange(n_users)
+
+        n_items = len(model.items_inv_mapping)
+        item_ids = np.array(
+            [model.items_inv_mapping[i] for i in range(n_items)],
+            dtype=np.int64,
+        )
+        item_idf = np.zeros(n_items, dtype=np.float64)
+        item_idf[[model.items_mapping[i] for i in model.item_idf["index"]]] = (
+            model.item_idf["idf"].to_numpy()
+        )
+
+        watched = model.watched["item_id"]
+        watched_rows = [
+            [model.items_mapping[item_id] for item_id in watched[user_id]]
+            for user_id in legacy_user_ids[order]
+        ]
+
+        # similar_items sorts every similarity row by descending score
+        # and takes the first N_users entries
+        similarity = model.user_knn.similarity.tocsr()
+        neighbour_rows, score_rows = [], []
+        for legacy_id in order:
+            start, stop = similarity.indptr[legacy_id:legacy_id + 2]
+            scores = similarity.data[start:stop]
+            top = np.argsort(-scores, kind="stable")[:model.N_users]
+            neighbour_rows.append(
+                internal_ids[similarity.indices[start:stop][top]]
+            )
+            score_rows.append(scores[top])
+
+        watched_indptr, watched_indices = _to_csr(watched_rows)
+        neighbours, neighbour_scores = _to_fixed_width(
+            neighbour_rows, score_rows, model.N_users
+        )
+        return cls(
+            user_ids=legacy_user_ids[order],
+            item_ids=item_ids,
+            item_idf=item_idf,
+            watched_indptr=watched_indptr,
+            watched_indices=watched_indices,
+            neighbours=neighbours,
+            neighbour_scores=neighbour_scores,
+        )
+
+    def internal_id(self, user_id: int) -> tp.Optional[int]:
+        idx = int(np.searchsorted(self.user_ids, user_id))
+        if idx < len(self.user_ids) and self.user_ids[idx] == user_id:
+            return idx
+        return None
+
+    def watched(self, internal_id: int) -> np.ndarray:
+        start, stop = self.watched_indptr[internal_id:internal_id + 2]
+        return self.watched_indices[start:stop]
+
+    def set_neighbour_index(self, index: tp.Any) -> None:
+        """
+        Search the neighbours in `index`, an object with the user ids of
+        the index and a `search(rows, k)` that returns neighbour tables.
+        """
+        if not np.array_equal(index.user_ids, self.user_ids):
+            raise ValueError("Neighbour index is built for other users")
+        self.neighbour_index = index
+
+    def neighbour_rows(
+        self,
+        internal_ids: np.ndarray,
+    ) -> tp.Tuple[np.ndarray, np.ndarray]:
+        """Neighbour tables of `internal_ids`, ids and scores."""
+        if self.neighbour_index is not None:
+            return self.neighbour_index.search(
+                internal_ids, self.neighbours_table.shape[1]
+            )
+        return (
+            self.neighbours_table[internal_ids],
+            self.neighbour_scores[internal_ids],
+        )
+
+    def neighbours(self, internal_id: int) -> np.ndarray:
+        row = self.neighbour_rows(np.array([internal_id]))[0][0]
+        return row[row >= 0]
+
+    def similar_users(
+        self,
+        user_id: int,
+    ) -> tp.Optional[tp.Tuple[np.ndarray, np.ndarray]]:
+        """Ids and similarity of the neighbours of `user_id`."""
+        internal_id = self.internal_id(user_id)
+        if internal_id is None:
+            return None
+        rows, scores = self.neighbour_rows(np.array([internal_id]))
+        valid = rows[0] >= 0
+        return self.user_ids[rows[0][valid]], scores[0][valid]
+
+    def predict(
+        self,
+        user_id: int,
+        n_recs: int = 10,
+    ) -> tp.Optional[tp.List[int]]:
+        internal_id = self.internal_id(user_id)
+        if internal_id is None:
+            return None
+
+        candidates = gather_rows(
+            self.watched_indptr,
+            self.watched_indices,
+            self.neighbours(internal_id),
+        )
+        # unique items in order of the first occurrence
+        _, first_seen = np.unique(candidates, return_index=True)
+        candidates = candidates[np.sort(first_seen)]
+        candidates = candidates[
+            ~np.isin(candidates, self.watched(internal_id))
+        ]
+
+        top = top_k_smallest(self.item_idf[candidates], n_recs)
+        return self.item_ids[candidates[top]].tolist()
+
+    def internal_ids(self, user_ids: tp.Sequence[int]) -> np.ndarray:
+        """Internal ids of `user_ids`, -1 for unknown users."""
+        ids = np.asarray(user_ids, dtype=np.int64)
+        if len(self.user_ids) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        idx = np.searchsorted(self.user_ids, ids)
+        idx[idx == len(self.user_ids)] = 0
+        return np.where(self.user_ids[idx] == ids, idx, -1)
+
+    def predict_batch(
+        self,
+        user_ids: tp.Sequence[int],
+        n_recs: int = 10,
+    ) -> tp.List[tp.Optional[tp.List[int]]]:
+        """Same as `predict` for every user, in one vectorized pass."""
+        internal_ids = self.internal_ids(user_ids)
+        rows = internal_ids[internal_ids >= 0]
+        n_items = len(self.item_ids)
+
+        # every candidate is keyed by (query number, item)
+        table, _ = self.neighbour_rows(rows)
+        valid = table >= 0
+        neighbours = table[valid]
+        neighbour_owner = np.nonzero(valid)[0]
+        candidates = gather_rows(
+            self.watched_indptr, self.watched_indices, neighbours
+        )
+        owner = np.repeat(
+            neighbour_owner,
+            self.watched_indptr[neighbours + 1]
+            - self.watched_indptr[neighbours],
+        )
+        keys = owner * n_items + candidates
+
+        _, first_seen = np.unique(keys, return_index=True)
+        first_seen.sort()
+        keys = keys[first_seen]
+        watched_keys = (
+            _row_numbers(self.watched_indptr, rows) * n_items
+            + gather_rows(self.watched_indptr, self.watched_indices, rows)
+        )
+        keys = keys[~np.isin(keys, watched_keys)]
+        owner, candidates = np.divmod(keys, n_items)
+
+        # stable sort keeps the first occurrence order for equal IDF
+        order = np.lexsort((self.item_idf[candidates], owner))
+        owner, candidates = owner[order], candidates[order]
+        bounds = np.searchsorted(owner, np.arange(len(rows) + 1))
+
+        recos: tp.List[tp.Optional[tp.List[int]]] = []
+        query = 0
+        for internal_id in internal_ids:
+            if internal_id < 0:
+                recos.append(None)
+                continue
+            start = bounds[query]
+            stop = min(bounds[query + 1], start + n_recs)
+            recos.append(self.item_ids[candidates[start:stop]].tolist())
+            query += 1
+        return recos
+
+
+def _row_numbers(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    # for every element of gather_rows(indptr, ..., rows)
+    # the position of its row in `rows`
+    lengths = indptr[rows + 1] - indptr[rows]
+    return np.repeat(np.arange(len(rows)), lengths)
+
+
+def _to_csr(
+    rows: tp.Sequence[tp.Sequence[int]],
+) -> tp.Tuple[np.ndarray, np.ndarray]:
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.zeros(int(indptr[-1]), dtype=np.int32)
+    for i, row in enumerate(rows):
+        indices[indptr[i]:indptr[i + 1]] = row
+    return indptr, indices
+
+
+def _to_fixed_width(
+    rows: tp.Sequence[tp.Sequence[int]],
+    scores: tp.Sequence[tp.Sequence[float]],
+    width: tp.Optional[int] = None,
+) -> tp.Tuple[np.ndarray, np.ndarray]:
+    if width is None:
+        width = max((len(row) for row in rows), default=0)
+    neighbours = np.full((len(rows), width), -1, dtype=np.int32)
+    neighbour_scores = np.zeros((len(rows), width), dtype=np.float32)
+    for i, (row, row_scores) in enumerate(zip(rows, scores)):
+        neighbours[i, :len(row)] = row
+        neighbour_scores[i, :len(row)] = row_scores
+    return neighbours, neighbour_scores
+
+
+def convert_user_knn_bm25(src_path: str, dst_path: str) -> None:
+    # unpickling the notebook model needs pandas and implicit
+    with open(src_path, "rb") as f:
+        model = dill.load(f)
+    UserKnn.from_user_knn_bm25(model).save(dst_path)
+
+
+def upgrade_neighbour_lists(path: str) -> None:
+    """
+    Replace the neighbour lists of the artifacts saved before the
+    fixed-width table with the table. The order of the neighbours
+    is kept, their scores were not saved and are NaN.
+    """
+    indptr = np.load(os.path.join(path, NEIGHBOURS_INDPTR_FILE))
+    indices = np.load(os.path.join(path, NEIGHBOURS_INDICES_FILE))
+    lengths = np.diff(indptr)
+    width = int(lengths.max(initial=0))
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    ranks = np.arange(len(indices)) - np.repeat(indptr[:-1], lengths)
+    neighbours = np.full((len(lengths), width), -1, dtype=np.int32)
+    neighbours[rows, ranks] = indices
+    neighbour_scores = np.zeros((len(lengths), width), dtype=np.float32)
+    neighbour_scores[rows, ranks] = np.nan
+
+    np.save(os.path.join(path, NEIGHBOURS_FILE), neighbours)
+    np.save(os.path.join(path, NEIGHBOUR_SCORES_FILE), neighbour_scores)
+    os.remove(os.path.join(path, NEIGHBOURS_INDPTR_FILE))
+    os.remove(os.path.join(path, NEIGHBOURS_INDICES_FILE))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="UserKnn engine artifacts",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = commands.add_parser(
+        "convert",
+        help="convert dill'd notebook UserKnnBM25 model "
+             "to the UserKnn engine format",
+    )
+    convert_parser.add_argument("src", help="path to user-knn.dill")
+    convert_parser.add_argument("dst", help="output directory")
+    convert_parser.set_defaults(
+        handler=lambda args: convert_user_knn_bm25(args.src, args.dst)
+    )
+
+    upgrade_parser = commands.add_parser(
+        "upgrade",
+        help="replace the neighbour lists of an engine saved before "
+             "the neighbours table with the table, once",
+    )
+    upgrade_parser.add_argument("path", help="engine directory")
+    upgrade_parser.set_defaults(
+        handler=lambda args: upgrade_neighbour_lists(args.path)
+    )
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
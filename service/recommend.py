@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import Counter
+from functools import partial
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+
+from service.metrics import POPULAR_FALLBACKS
+from service.model_loading import load_models, model_registry, popular_model
+from service.timing import stage
+
+# reasons of the popular fallback
+NO_RECOS = "no_recos"
+MODEL_ERROR = "model_error"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+
+class Prediction(NamedTuple):
+    reco: List[int]
+    # the reason of the popular fallback, None without one
+    fallback: Optional[str]
+    version: Optional[str]
+
+
+# predict and predict_batch are module level functions,
+# so that they can be sent to a process pool. Both also return
+# the reasons of the popular fallback, to be counted by the caller,
+# and the model version, the one of the process they ran in. Every
+# model of a prediction comes from that version, even when the
+# models are reloaded while it runs
+
+def predict(
+    model_name: str,
+    user_id: int,
+    k_recs: int,
+) -> Prediction:
+    models = model_registry.current()
+    fallback = None
+    try:
+        reco = models.get(model_name).predict(user_id)
+        if not reco:
+            fallback = NO_RECOS
+            reco = popular_model(models).predict(user_id, k_recs)
+    except TypeError:
+        fallback = MODEL_ERROR
+        reco = list(range(k_recs))
+    return Prediction(reco, fallback, models.version)
+
+
+def predict_batch(
+    model_name: str,
+    user_ids: Sequence[int],
+    k_recs: int,
+) -> Tuple[List[List[int]], List[Optional[str]], Optional[str]]:
+    models = model_registry.current()
+    fallbacks: List[Optional[str]] = [None] * len(user_ids)
+    try:
+        predicted: List[Optional[List[int]]] = (
+            models.get(model_name).predict_batch(user_ids)
+        )
+        # popular fallback for the users knn knows nothing about
+        cold = [i for i, reco in enumerate(predicted) if not reco]
+        popular_recos = iter(popular_model(models).predict_batch(
+            [user_ids[i] for i in cold], k_recs
+        ))
+        recos = [reco or next(popular_recos) for reco in predicted]
+        for i in cold:
+            fallbacks[i] = NO_RECOS
+    except TypeError:
+        recos = [list(range(k_recs)) for _ in user_ids]
+        fallbacks = [MODEL_ERROR] * len(user_ids)
+    return recos, fallbacks, models.version
+
+
+async def recommend(
+    app: FastAPI,
+    model_name: str,
+    user_id: int,
+) -> Prediction:
+    """
+    A prediction by the micro-batcher or the inference executor of
+    `model_name`, which raise InferenceQueueFull when they are full.
+    """
+    if model_name in app.state.batchers:
+        return await app.state.batchers[model_name].submit(user_id)
+    # predict may run inline, on the event loop
+    await load_models(model_name, "popular")
+    prediction = await app.state.inference.run(
+        model_name, predict, model_name, user_id, app.state.k_recs
+    )
+    if prediction.fallback is not None:
+        POPULAR_FALLBACKS.inc(model_name, prediction.fallback)
+    return prediction
+
+
+async def recommend_batch(
+    app: FastAPI,
+    model_name: str,
+    user_ids: List[int],
+) -> List[Prediction]:
+    """Recommendations and popular fallback reasons of `user_ids`."""
+    await load_models(model_name, "popular")
+    recos, fallbacks, version = await app.state.inference.run(
+        model_name, predict_batch, model_name, user_ids, app.state.k_recs
+    )
+    # counted here, on the event loop, and not in the inference workers
+    for fallback, count in Counter(filter(None, fallbacks)).items():
+        POPULAR_FALLBACKS.inc(model_name, fallback, amount=count)
+    return [
+        Prediction(reco, fallback, version)
+        for reco, fallback in zip(recos, fallbacks)
+    ]
+
+
+async def recommend_within_budget(
+    app: FastAPI,
+    model_name: str,
+    user_id: int,
+    started_at: float,
+) -> Prediction:
+    """
+    A cached or computed prediction, or the popular one when it is not
+    ready within the latency budget of `model_name`, counted from
+    `started_at`.
+    """
+    k_recs = app.state.k_recs
+    # popular fallbacks are not cached, the popular model they come
+    # from is reloaded or, with the popularity stream, republished
+    compute = app.state.reco_cache.get_or_compute(
+        model_name,
+        (user_id, k_recs),
+        partial(recommend, app, model_name, user_id),
+        cacheable=_is_not_fallback,
+    )
+    budget_ms = app.state.latency_budgets_ms.get(model_name)
+    if budget_ms is None:
+        with stage("model"):
+            return await compute
+
+    timeout = budget_ms / 1000 - (time.perf_counter() - started_at)
+    try:
+        with stage("model"):
+            return await asyncio.wait_for(compute, max(timeout, 0.0))
+    except asyncio.TimeoutError:
+        POPULAR_FALLBACKS.inc(model_name, DEADLINE_EXCEEDED)
+    with stage("fallback"):
+        await load_models("popular")
+        models = model_registry.current()
+        return Prediction(
+            popular_model(models).predict(user_id, k_recs),
+            DEADLINE_EXCEEDED,
+            models.version,
+        )
+
+
+def _is_not_fallback(prediction: Prediction) -> bool:
+    return prediction.fallback is None
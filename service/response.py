@@ -1,37 +1,64 @@
-import json
+import dataclasses
+import math
 import typing as tp
 from http import HTTPStatus
 
+import numpy as np
 import orjson
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 
 from service.models import Error
+from service.timing import stage
 
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o: tp.Any) -> tp.Any:
-        if isinstance(o, BaseModel):
-            return o.dict()
-        try:
-            orjson.dumps(o)
-        except TypeError:
-            return str(o)
-        return super().default(o)
+def default(o: tp.Any) -> tp.Any:
+    # orjson calls this only for types it can not serialize natively
+    if isinstance(o, BaseModel):
+        return o.dict()
+    return str(o)
+
+
+def has_non_finite(o: tp.Any) -> bool:
+    # the common leaves first, isinstance of an ABC such as BaseModel
+    # is slow
+    if isinstance(o, (str, int, type(None))):
+        return False
+    if isinstance(o, dict):
+        o = list(o.values())
+    if isinstance(o, (list, tuple)):
+        return any(has_non_finite(value) for value in o)
+    if isinstance(o, (float, np.floating)):
+        return not math.isfinite(o)
+    if isinstance(o, np.ndarray):
+        return o.dtype.kind in "fc" and not np.isfinite(o).all()
+    # the field values of a model, nested models are searched in turn
+    return (
+        isinstance(o, BaseModel)
+        or dataclasses.is_dataclass(o) and not isinstance(o, type)
+    ) and has_non_finite(vars(o))
 
 
 class DataclassJSONResponse(JSONResponse):
     media_type = "application/json"
 
     def render(self, content: tp.Any) -> bytes:
-        return json.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            cls=EnhancedJSONEncoder,
-        ).encode("utf-8")
+        # numpy arrays and scalars returned by the models
+        # are serialized without converting them to lists first
+        with stage("serialize"):
+            body = orjson.dumps(
+                content,
+                default=default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+            # orjson writes NaN and infinity as null, where json.dumps
+            # with allow_nan=False raised. Content is searched for them
+            # only when the body has a null at all
+            if b"null" in body and has_non_finite(content):
+                raise ValueError(
+                    "Out of range float values are not JSON compliant"
+                )
+            return body
 
 
 def create_response(
@@ -54,5 +81,16 @@ def create_response(
     return DataclassJSONResponse(content, status_code=status_code)
 
 
+def reco_response(user_id: int, items: tp.Any) -> JSONResponse:
+    # the hot path skips pydantic, the schema is still documented
+    # by the RecoResponse response model of the view
+    return DataclassJSONResponse({"user_id": user_id, "items": items})
+
+
+def raw_json_response(body: bytes) -> Response:
+    # body is already serialized, e.g. by ResponseStore
+    return Response(body, media_type="application/json")
+
+
 def server_error(errors: tp.List[Error]) -> JSONResponse:
     return create_response(HTTPStatus.INTERNAL_SERVER_ERROR, errors=errors)
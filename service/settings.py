@@ -1,3 +1,5 @@
+import typing as tp
+
 from pydantic import BaseSettings
 
 
@@ -9,22 +11,157 @@ class Config(BaseSettings):
 class LogConfig(Config):
     level: str = "INFO"
     datetime_format: str = "%Y-%m-%d %H:%M:%S"
+    # records are formatted and written by a background thread
+    queue: bool = False
+    queue_batch_size: int = 1024
+    # share of access records that are logged, errors are always logged
+    access_sample_rate: float = 1.0
+    # stage durations of the Server-Timing header in access records
+    access_timings: bool = False
 
     class Config:
         case_sensitive = False
         fields = {
             "level": {"env": ["log_level"]},
+            "queue": {"env": ["log_queue"]},
+            "queue_batch_size": {"env": ["log_queue_batch_size"]},
+            "access_sample_rate": {"env": ["log_access_sample_rate"]},
+            "access_timings": {"env": ["log_access_timings"]},
         }
 
 
+class InferenceConfig(Config):
+    # model name -> "inline", "thread" or "process",
+    # models that are not listed run inline
+    modes: tp.Dict[str, str] = {"online_knn": "thread"}
+    max_workers: int = 4
+    max_queue_size: int = 64
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "inference_"
+
+
+class CacheConfig(Config):
+    # off by default, recommendations are computed for every request
+    enabled: bool = False
+    # model name -> max number of cached users, other models are not cached
+    capacities: tp.Dict[str, int] = {"online_knn": 100_000}
+    ttl_seconds: tp.Optional[float] = None
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "reco_cache_"
+
+
+class AdmissionConfig(Config):
+    # off by default, every request is admitted
+    enabled: bool = False
+    # model name -> max requests served at once,
+    # every model is limited separately, models that are not listed
+    # in max_concurrency or rates are not limited
+    max_concurrency: tp.Dict[str, int] = {"online_knn": 64}
+    # model name -> admitted requests per second, with bursts of
+    # bursts[model name] requests, by default a second of the rate
+    rates: tp.Dict[str, float] = {}
+    bursts: tp.Dict[str, float] = {}
+    # requests over the limit wait that long at most, and only
+    # max_queue_size of them, the others are rejected at once
+    max_queue_size: int = 64
+    max_wait_ms: float = 50.0
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "admission_"
+
+
+class PopularityConfig(Config):
+    # popular recommendations are counted from interaction events,
+    # POST /events and the lines appended to events_path,
+    # over a sliding window of window_buckets buckets of bucket_seconds.
+    # Snapshots have ServiceConfig.k_recs items per category. Models
+    # that run in the "process" inference mode fall back on the snapshot
+    # their pool was forked with, not on the ones published since
+    enabled: bool = False
+    bucket_seconds: float = 3600.0
+    window_buckets: int = 7 * 24
+    publish_interval_seconds: float = 10.0
+    # JSON lines {"user_id": ..., "item_id": ..., "timestamp": ...}.
+    # Every worker counts its own window: with several gunicorn workers
+    # only events_path, which each of them tails, is seen by all of
+    # them, an event posted to /events is counted by one worker only
+    events_path: tp.Optional[str] = None
+    tail_interval_seconds: float = 1.0
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "popularity_"
+
+
+class MetricsConfig(Config):
+    # set for gunicorn with several workers, so that /metrics
+    # of any worker reports the sum over all of them
+    multiprocess_dir: tp.Optional[str] = None
+    flush_interval_seconds: float = 1.0
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "metrics_"
+
+
 class ServiceConfig(Config):
     service_name: str = "reco_service"
     k_recs: int = 10
+    max_batch_size: int = 1000
+    # concurrent online_knn requests are predicted together, every
+    # request waits up to max_wait_ms for the others. Off by default,
+    # with the max batch size of 1: it pays off under concurrent load
+    # only, see benchmarks/bench_load.py
+    online_knn_max_batch_size: int = 1
+    online_knn_max_wait_ms: float = 2.0
+    # the neighbours of online_knn are searched in the HNSW index with
+    # this ef instead of read from the table of the engine, a larger ef
+    # finds more of the exact neighbours and is slower. Needs nmslib
+    online_knn_hnsw_ef: tp.Optional[int] = None
+    # model name -> time a recommendation may take, counted from the
+    # request start. Over the budget the popular recommendations are
+    # returned and only the wait is abandoned: a computation that has
+    # started keeps running in its worker until it is done, and still
+    # counts against the inference queue, a cached one fills the cache.
+    # Only models that run in a thread, a process or a batcher return
+    # before the computation is done
+    latency_budgets_ms: tp.Dict[str, float] = {}
+    # knn responses are served as JSON bodies serialized in advance
+    prebuilt_responses: bool = False
+    # models loaded in the background at startup, /ready waits for them,
+    # the other models are loaded by the first request that needs them
+    eager_models: tp.List[str] = ["popular", "knn", "online_knn"]
+    warm_up_user_ids: tp.List[int] = list(range(10))
+    # eager models are loaded by create_app itself, with gunicorn
+    # preload_app that is the master, and the workers share them
+    preload_models: bool = False
+    # how often workers check MODEL_VERSIONS_PATH/CURRENT, None is never
+    model_watch_interval_seconds: tp.Optional[float] = None
+    # bearer token of the /admin endpoints, they are disabled without it
+    admin_token: tp.Optional[str] = None
+    # X-Profile requests and /debug/profile, they are guarded by
+    # the admin token, nothing is added to the app when off
+    profiling: bool = False
 
     log_config: LogConfig
+    inference_config: InferenceConfig
+    cache_config: CacheConfig
+    admission_config: AdmissionConfig
+    popularity_config: PopularityConfig
+    metrics_config: MetricsConfig
 
 
 def get_config() -> ServiceConfig:
     return ServiceConfig(
         log_config=LogConfig(),
+        inference_config=InferenceConfig(),
+        cache_config=CacheConfig(),
+        admission_config=AdmissionConfig(),
+        popularity_config=PopularityConfig(),
+        metrics_config=MetricsConfig(),
     )
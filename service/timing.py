@@ -0,0 +1,39 @@
+import time
+import typing as tp
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+Stages = tp.Dict[str, float]
+
+# stage name -> seconds, of the request served by the current task
+_stages: ContextVar[tp.Optional[Stages]] = ContextVar("stages", default=None)
+
+
+def start_stages() -> Stages:
+    """Start recording the stages of the request of the current task."""
+    stages: Stages = {}
+    _stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str) -> tp.Iterator[None]:
+    # a no-op outside of a request, e.g. in inference threads
+    stages = _stages.get()
+    if stages is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = (
+            stages.get(name, 0.0) + time.perf_counter() - started_at
+        )
+
+
+def server_timing(stages: Stages) -> str:
+    """Server-Timing header value, durations are in milliseconds."""
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items()
+    )
@@ -0,0 +1,30 @@
+import pytest
+from fastapi import FastAPI
+
+from service.api.auth import bearer_token, check_admin_token, check_user_token
+from service.api.exceptions import BearerAccessTokenError
+
+
+def test_bearer_token() -> None:
+    assert bearer_token(b"Bearer admin") == b"admin"
+    assert bearer_token(b"bearer  admin ") == b"admin"
+    assert bearer_token(b"Basic admin") is None
+    assert bearer_token(b"admin") is None
+
+
+def test_check_tokens() -> None:
+    app = FastAPI()
+    app.state.admin_token = None
+    check_user_token(app, "Team_5")
+    # admin-gated features are disabled without an admin token
+    with pytest.raises(BearerAccessTokenError):
+        check_admin_token(app, "")
+
+    app.state.admin_token = "admin"
+    check_admin_token(app, "admin")
+    check_user_token(app, "admin")
+    for token in ("Team_5", "admin ", "adm"):
+        with pytest.raises(BearerAccessTokenError):
+            check_admin_token(app, token)
+    with pytest.raises(BearerAccessTokenError):
+        check_user_token(app, "Team_6")
@@ -0,0 +1,90 @@
+import logging
+import typing as tp
+from http import HTTPStatus
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from service.api.middlewares import add_middlewares
+from service.log import access_logger
+from service.timing import stage
+
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: tp.List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ok")
+    async def ok() -> str:
+        return "ok"
+
+    @app.get("/fail")
+    async def fail() -> str:
+        raise RuntimeError("boom")
+
+    @app.get("/stages")
+    async def stages() -> str:
+        with stage("first"):
+            pass
+        with stage("second"):
+            pass
+        return "ok"
+
+    add_middlewares(app, log_timings=True)
+    return app
+
+
+def test_unhandled_exception_is_converted_to_server_error() -> None:
+    client = TestClient(make_app(), raise_server_exceptions=False)
+    response = client.get("/fail")
+    assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert response.json()["errors"][0]["error_key"] == "server_error"
+
+
+def test_access_log_record() -> None:
+    handler = ListHandler()
+    level = access_logger.level
+    access_logger.addHandler(handler)
+    access_logger.setLevel(logging.INFO)
+    try:
+        TestClient(make_app()).get("/ok?x=1")
+    finally:
+        access_logger.removeHandler(handler)
+        access_logger.setLevel(level)
+
+    assert len(handler.records) == 1
+    extra = handler.records[0].__dict__
+    assert extra["status_code"] == HTTPStatus.OK
+    assert extra["method"] == "GET"
+    assert str(extra["requested_url"]) == "http://testserver/ok?x=1"
+    assert extra["request_time"] >= 0
+
+
+def test_server_timing() -> None:
+    handler = ListHandler()
+    level = access_logger.level
+    access_logger.addHandler(handler)
+    access_logger.setLevel(logging.INFO)
+    try:
+        client = TestClient(make_app())
+        response = client.get("/stages")
+        assert "server-timing" not in client.get("/ok").headers
+    finally:
+        access_logger.removeHandler(handler)
+        access_logger.setLevel(level)
+
+    names = [
+        metric.split(";")[0]
+        for metric in response.headers["server-timing"].split(", ")
+    ]
+    assert names == ["first", "second", "total"]
+    server_timing = getattr(handler.records[0], "server_timing")
+    assert server_timing.startswith("first;dur=")
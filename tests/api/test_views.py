@@ -1,10 +1,21 @@
+import asyncio
+import os
+import time
+import typing as tp
 from http import HTTPStatus
 
 from starlette.testclient import TestClient
 
+from service import model_loading, recommend
+from service.api import admin
+from service.api.app import create_app
+from service.log import app_logger
+from service.reco_models.manifest import Manifest
+from service.reco_models.registry import ModelRegistry
 from service.settings import ServiceConfig
 
 GET_RECO_PATH = "/reco/{model_name}/{user_id}"
+GET_RECO_BATCH_PATH = "/reco/{model_name}/batch"
 
 
 def test_health(
@@ -67,3 +78,396 @@ def test_bearer_failed(
         )
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json()["errors"][0]["error_key"] == "incorrect_bearer_key"
+
+
+def test_get_reco_batch_success(
+    client: TestClient,
+    service_config: ServiceConfig,
+) -> None:
+    user_ids = [1, 2, 3]
+    path = GET_RECO_BATCH_PATH.format(model_name="test_model")
+    with client:
+        response = client.post(
+            path,
+            json={"user_ids": user_ids},
+            headers={"Authorization": "Bearer Team_5"},
+        )
+    assert response.status_code == HTTPStatus.OK
+    recos = response.json()["recos"]
+    assert [reco["user_id"] for reco in recos] == user_ids
+    assert all(len(reco["items"]) == service_config.k_recs for reco in recos)
+
+
+def test_get_reco_batch_with_unknown_user(
+    client: TestClient,
+    service_config: ServiceConfig,
+) -> None:
+    user_ids = [1, 10**10, 3]
+    for model_name in ("test_model", "knn"):
+        path = GET_RECO_BATCH_PATH.format(model_name=model_name)
+        with client:
+            response = client.post(
+                path,
+                json={"user_ids": user_ids},
+                headers={"Authorization": "Bearer Team_5"},
+            )
+        assert response.status_code == HTTPStatus.OK
+        recos = response.json()["recos"]
+        assert [reco["user_id"] for reco in recos] == user_ids
+        assert recos[1]["items"] is None
+        assert len(recos[0]["items"]) == service_config.k_recs
+        assert len(recos[2]["items"]) == service_config.k_recs
+
+
+def test_get_reco_batch_too_large(
+    client: TestClient,
+    service_config: ServiceConfig,
+) -> None:
+    user_ids = list(range(service_config.max_batch_size + 1))
+    path = GET_RECO_BATCH_PATH.format(model_name="test_model")
+    with client:
+        response = client.post(
+            path,
+            json={"user_ids": user_ids},
+            headers={"Authorization": "Bearer Team_5"},
+        )
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()["errors"][0]["error_key"] == "batch_too_large"
+
+
+def test_prebuilt_responses_match_computed(
+    client: TestClient,
+    service_config: ServiceConfig,
+    tmp_path,
+    monkeypatch,
+) -> None:
+    path = tmp_path / "knn-responses"
+    monkeypatch.setattr(model_loading, "PREBUILT_RESPONSES_PATH", str(path))
+    service_config.prebuilt_responses = True
+    prebuilt_client = TestClient(app=create_app(service_config))
+    # built at startup and saved for the next one
+    assert (path / "meta.json").exists()
+    headers = {"Authorization": "Bearer Team_5"}
+    for user_id in (0, 1, 3, 10**9):
+        path = GET_RECO_PATH.format(model_name="knn", user_id=user_id)
+        with client, prebuilt_client:
+            response = client.get(path, headers=headers)
+            prebuilt_response = prebuilt_client.get(path, headers=headers)
+        assert prebuilt_response.status_code == HTTPStatus.OK
+        assert prebuilt_response.headers["content-type"] == (
+            "application/json"
+        )
+        assert prebuilt_response.content == response.content
+
+
+def test_metrics(
+    client: TestClient,
+) -> None:
+    path = GET_RECO_PATH.format(model_name="knn", user_id=1)
+    with client:
+        client.get(path, headers={"Authorization": "Bearer Team_5"})
+        client.get("/reco/unknown/1", headers={"Authorization": "Bearer 1"})
+        response = client.get("/metrics")
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics = response.text
+    assert (
+        'http_request_duration_seconds_count{method="GET",'
+        'route="/reco/{model_name}/{user_id}",status_code="200"}'
+    ) in metrics
+    assert 'reco_duration_seconds_count{model_name="knn"}' in metrics
+    assert 'errors_total{error_key="incorrect_bearer_key"}' in metrics
+    assert 'model_load_seconds{model_name="popular"}' in metrics
+
+
+def test_ready_after_eager_models_are_loaded(
+    client: TestClient,
+) -> None:
+    with client:
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == HTTPStatus.OK:
+                break
+            assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+            time.sleep(0.05)
+    assert response.status_code == HTTPStatus.OK
+    body = response.json()
+    assert body["ready"]
+    assert body["models"]["knn"]["loaded"]
+
+
+def test_reload_model_version(
+    service_config: ServiceConfig,
+    tmp_path,
+    monkeypatch,
+) -> None:
+    manifest = model_loading.default_manifest()
+    Manifest(
+        "v2",
+        {name: os.path.abspath(path)
+         for name, path in manifest.artifacts.items()},
+    ).save(str(tmp_path / "v2"))
+    monkeypatch.setattr(admin, "MODEL_VERSIONS_PATH", str(tmp_path))
+    service_config.admin_token = "admin"
+    client = TestClient(app=create_app(service_config))
+    path = GET_RECO_PATH.format(model_name="knn", user_id=3)
+    headers = {"Authorization": "Bearer Team_5"}
+
+    try:
+        with client:
+            response = client.get(path, headers=headers)
+            assert response.headers["X-Model-Version"] == "default"
+
+            response = client.post(
+                "/admin/models/reload",
+                json={"version": "v2"},
+                headers={"Authorization": "Bearer Team_5"},
+            )
+            assert response.status_code == HTTPStatus.UNAUTHORIZED
+            response = client.post(
+                "/admin/models/reload",
+                json={"version": "v3"},
+                headers={"Authorization": "Bearer admin"},
+            )
+            assert response.status_code == HTTPStatus.NOT_FOUND
+            for version in ("..", "../v2", "v2/../v2"):
+                response = client.post(
+                    "/admin/models/reload",
+                    json={"version": version},
+                    headers={"Authorization": "Bearer admin"},
+                )
+                assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+            response = client.post(
+                "/admin/models/reload",
+                json={"version": "v2"},
+                headers={"Authorization": "Bearer admin"},
+            )
+            assert response.json() == {"version": "v2"}
+
+            response = client.get(path, headers=headers)
+            assert response.status_code == HTTPStatus.OK
+            assert response.headers["X-Model-Version"] == "v2"
+        assert (tmp_path / "CURRENT").read_text() == "v2"
+    finally:
+        model_loading.model_registry.reload(manifest)
+
+
+def test_models_are_loaded_off_the_event_loop(monkeypatch) -> None:
+    def slow_loader(manifest: tp.Optional[Manifest]) -> str:
+        time.sleep(0.2)
+        return "model"
+
+    registry = ModelRegistry()
+    registry.register("knn", slow_loader)
+    monkeypatch.setattr(model_loading, "model_registry", registry)
+
+    async def scenario() -> int:
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        await model_loading.load_models("knn")
+        ticker.cancel()
+        return ticks
+
+    # the loop went on while the model was loading
+    assert asyncio.run(scenario()) >= 5
+    assert registry.is_ready(["knn"])
+
+
+def test_get_reco_over_latency_budget(
+    service_config: ServiceConfig,
+    monkeypatch,
+) -> None:
+    service_config.latency_budgets_ms = {"online_knn": 50}
+    service_config.cache_config.enabled = True
+    # predicted by the micro-batcher, in predict_batch
+    service_config.online_knn_max_batch_size = 8
+    client = TestClient(app=create_app(service_config))
+    model = model_loading.model_registry.get("online_knn")
+    slow_reco = [7] * service_config.k_recs
+
+    def slow_predict_batch(user_ids):
+        time.sleep(0.3)
+        return [slow_reco for _ in user_ids]
+
+    monkeypatch.setattr(model, "predict_batch", slow_predict_batch)
+    path = GET_RECO_PATH.format(model_name="online_knn", user_id=3)
+    headers = {"Authorization": "Bearer Team_5"}
+    fallbacks = recommend.POPULAR_FALLBACKS.values.get(
+        ("online_knn", recommend.DEADLINE_EXCEEDED), 0
+    )
+
+    with client:
+        started_at = time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert time.perf_counter() - started_at < 0.3
+        assert response.json()["items"] == (
+            model_loading.model_registry.get("popular").predict(
+                3, service_config.k_recs
+            )
+        )
+        assert recommend.POPULAR_FALLBACKS.values[
+            ("online_knn", recommend.DEADLINE_EXCEEDED)
+        ] == fallbacks + 1
+
+        # the slow computation has filled the cache meanwhile
+        time.sleep(0.4)
+        response = client.get(path, headers=headers)
+        assert response.json()["items"] == slow_reco
+
+
+def test_get_reco_model_overloaded(
+    service_config: ServiceConfig,
+    monkeypatch,
+) -> None:
+    errors: tp.List[tp.Any] = []
+    monkeypatch.setattr(
+        app_logger, "error", lambda *args: errors.append(args)
+    )
+    service_config.admission_config.enabled = True
+    service_config.admission_config.max_concurrency = {"test_model": 0}
+    service_config.admission_config.max_queue_size = 0
+    client = TestClient(app=create_app(service_config))
+    headers = {"Authorization": "Bearer Team_5"}
+    with client:
+        response = client.get(
+            GET_RECO_PATH.format(model_name="test_model", user_id=1),
+            headers=headers,
+        )
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.json()["errors"][0]["error_key"] == (
+            "model_overloaded"
+        )
+        # rejections are counted, not logged as errors
+        assert not errors
+        # the other models are limited separately
+        response = client.get(
+            GET_RECO_PATH.format(model_name="knn", user_id=1),
+            headers=headers,
+        )
+        assert response.status_code == HTTPStatus.OK
+        stats = client.get("/stats/admission").json()
+    assert stats["test_model"]["rejected"]["concurrency"] == 1
+
+
+def test_profiling(
+    service_config: ServiceConfig,
+) -> None:
+    path = GET_RECO_PATH.format(model_name="test_model", user_id=1)
+    headers = {"Authorization": "Bearer admin", "X-Profile": "text"}
+    service_config.admin_token = "admin"
+    with TestClient(app=create_app(service_config)) as client:
+        # nothing is added to the app without the profiling flag
+        assert client.get("/debug/profile").status_code == (
+            HTTPStatus.NOT_FOUND
+        )
+        assert client.get(path, headers=headers).json()["user_id"] == 1
+
+    service_config.profiling = True
+    with TestClient(app=create_app(service_config)) as client:
+        response = client.get(path, headers=headers)
+        assert response.headers["X-Profiled-Status"] == "200"
+        assert "function calls" in response.text
+
+        # the user token serves the request without a profile
+        response = client.get(
+            path, headers={**headers, "Authorization": "Bearer Team_5"}
+        )
+        assert response.json()["user_id"] == 1
+        response = client.get(
+            path, headers={**headers, "Authorization": "Bearer admit"}
+        )
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+        response = client.get(
+            "/debug/profile?seconds=0.05",
+            headers={"Authorization": "Bearer admin"},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.text.splitlines()[0].rsplit(" ", 1)[1].isdigit()
+        response = client.get(
+            "/debug/profile?seconds=0.05",
+            headers={"Authorization": "Bearer Team_5"},
+        )
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_get_reco_server_timing(
+    client: TestClient,
+) -> None:
+    path = GET_RECO_PATH.format(model_name="knn", user_id=1)
+    with client:
+        response = client.get(path, headers={"Authorization": "Bearer Team_5"})
+        metrics = client.get("/metrics").text
+    stages = [
+        metric.split(";")[0]
+        for metric in response.headers["Server-Timing"].split(", ")
+    ]
+    assert stages == ["auth", "model", "serialize", "total"]
+    assert (
+        'reco_stage_duration_seconds_count{model_name="knn",stage="model"}'
+    ) in metrics
+
+
+def test_popularity_events(
+    service_config: ServiceConfig,
+    tmp_path,
+    monkeypatch,
+) -> None:
+    monkeypatch.setattr(
+        model_loading,
+        "PREBUILT_RESPONSES_PATH",
+        str(tmp_path / "knn-responses"),
+    )
+    service_config.prebuilt_responses = True
+    # more than the snapshots used to keep
+    service_config.k_recs = 25
+    service_config.admin_token = "admin"
+    service_config.popularity_config.enabled = True
+    service_config.popularity_config.publish_interval_seconds = 0.05
+    admin_auth = {"Authorization": "Bearer admin"}
+    events = {"events": [{"user_id": -1, "item_id": 424242}] * 3}
+
+    reco_path = GET_RECO_PATH.format(model_name="online_knn", user_id=-1)
+    user = {"Authorization": "Bearer Team_5"}
+
+    with TestClient(app=create_app(service_config)) as client:
+        response = client.get(reco_path, headers=user)
+        assert 424242 not in response.json()["items"]
+        response = client.post("/events", json=events, headers=user)
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+        response = client.post("/events", json=events, headers=admin_auth)
+        assert response.json() == {"accepted": 3, "dropped": 0}
+        time.sleep(0.2)
+        # the popular fallback serves the published snapshot
+        assert model_loading.popular_model().predict(-1, 10)[0] == 424242
+        # the popular fallback of online_knn is not cached
+        response = client.get(reco_path, headers=user)
+        assert response.json()["items"][0] == 424242
+        # filled up with the artifact items up to k_recs
+        base = model_loading.model_registry.get("popular").predict(-1, 25)
+        assert response.json()["items"] == [424242] + base[:24]
+        # and the prebuilt knn responses too
+        response = client.get(
+            GET_RECO_PATH.format(model_name="knn", user_id=-1), headers=user
+        )
+        assert response.json()["items"][0] == 424242
+        stats = client.get("/stats/popularity").json()
+        assert stats["events"] == 3
+        assert stats["published_at"] is not None
+
+    # nothing is added to the app when the stream is off
+    service_config.popularity_config.enabled = False
+    with TestClient(app=create_app(service_config)) as client:
+        response = client.post("/events", json=events, headers=admin_auth)
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert model_loading.popular_model() is (
+            model_loading.model_registry.get("popular")
+        )
@@ -0,0 +1,43 @@
+import numpy as np
+
+from service.reco_models.columnar import ColumnarIndex, write_columnar
+from service.reco_models.reco_models import ColumnarKnnModel
+
+MAPPING = {
+    15: [3, 2, 1],
+    4: [10],
+    1_000_000: [],
+    7: [5, 6],
+}
+
+
+def test_columnar_index_roundtrip(tmp_path) -> None:
+    write_columnar(MAPPING, str(tmp_path))
+    index = ColumnarIndex.load(str(tmp_path))
+
+    assert len(index) == len(MAPPING)
+    assert isinstance(index.item_ids, np.memmap)
+    for user_id, items in MAPPING.items():
+        assert index.get(user_id).tolist() == items
+    for unknown_user_id in (-1, 0, 5, 16, 10**9):
+        assert index.get(unknown_user_id) is None
+
+
+def test_columnar_knn_model(tmp_path) -> None:
+    write_columnar(MAPPING, str(tmp_path))
+    model = ColumnarKnnModel(str(tmp_path))
+
+    assert model.predict(15) == [3, 2, 1]
+    assert model.predict(1_000_000) == []
+    assert model.predict(8) is None
+
+
+def test_columnar_knn_model_predict_batch(tmp_path) -> None:
+    write_columnar(MAPPING, str(tmp_path))
+    model = ColumnarKnnModel(str(tmp_path))
+
+    user_ids = [7, 8, -1, 15, 10**9, 1_000_000]
+    assert model.predict_batch(user_ids) == [
+        model.predict(user_id) for user_id in user_ids
+    ]
+    assert model.predict_batch([]) == []
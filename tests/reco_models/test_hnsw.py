@@ -0,0 +1,172 @@
+import typing as tp
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from benchmarks.fixtures import make_pandas_user_knn
+from service.reco_models.hnsw import (
+    ExactIndex,
+    HnswIndex,
+    engine_recall,
+    recall_at_n,
+    to_table,
+)
+from service.reco_models.offline_knn import bm25_weight
+from service.reco_models.user_knn import UserKnn
+
+
+def make_vectors(n_users: int, n_items: int = 100) -> sp.csr_matrix:
+    return sp.random(
+        n_users, n_items, density=0.1, format="csr", dtype=np.float32,
+        random_state=0,
+    )
+
+
+def test_to_table() -> None:
+    table, scores = to_table(
+        3,
+        rows=np.array([0, 0, 2]),
+        neighbours=np.array([5, 7, 1]),
+        scores=np.array([2.0, 1.0, 3.0]),
+        k=2,
+    )
+    assert table.tolist() == [[5, 7], [-1, -1], [1, -1]]
+    assert scores.tolist() == [[2.0, 1.0], [0.0, 0.0], [3.0, 0.0]]
+
+
+def test_recall_at_n() -> None:
+    exact = np.array([[1, 2, 3, -1], [4, -1, -1, -1], [-1, -1, -1, -1]])
+    approx = np.array([[3, 1, 9, 8], [-1, -1, -1, -1], [5, -1, -1, -1]])
+    assert recall_at_n(approx, exact) == pytest.approx((2 / 3 + 0) / 2)
+    assert recall_at_n(exact, exact) == 1.0
+
+
+def test_exact_index() -> None:
+    vectors = make_vectors(50)
+    index = ExactIndex(vectors, np.arange(50), block_size=7)
+    rows = np.array([3, 10, 49, 0])
+    table, scores = index.search(rows, k=5)
+
+    similarity = (vectors @ vectors.T).toarray()
+    for row, neighbours, row_scores in zip(rows, table, scores):
+        valid = neighbours >= 0
+        expected = np.sort(similarity[row][similarity[row] > 0])[::-1][:5]
+        assert np.allclose(row_scores[valid], expected)
+        assert np.allclose(similarity[row, neighbours[valid]], expected)
+
+
+def test_user_knn_with_neighbour_index() -> None:
+    legacy = make_pandas_user_knn(n_users=300, n_items=100, n_neighbours=10)
+    engine = UserKnn.from_user_knn_bm25(legacy)
+    index = ExactIndex(make_vectors(len(engine.user_ids)), engine.user_ids)
+    with_index = UserKnn.from_user_knn_bm25(legacy)
+    with_index.set_neighbour_index(index)
+    # the same neighbours in the table
+    rows = np.arange(len(engine.user_ids))
+    engine.neighbours_table, engine.neighbour_scores = index.search(rows, 10)
+
+    user_ids = engine.user_ids[::5].tolist() + [-1]
+    assert with_index.predict_batch(user_ids) == engine.predict_batch(
+        user_ids
+    )
+    for user_id in user_ids[:5]:
+        assert with_index.predict(user_id) == engine.predict(user_id)
+
+    with pytest.raises(ValueError):
+        engine.set_neighbour_index(ExactIndex(index.vectors, rows))
+
+
+class FakeNmslibIndex:
+    """The calls of HnswIndex on an nmslib index, over given results."""
+
+    def __init__(
+        self, results: tp.List[tp.Tuple[np.ndarray, np.ndarray]]
+    ) -> None:
+        self.results = results
+        self.params: tp.Dict[str, int] = {}
+
+    def setQueryTimeParams(  # pylint: disable=invalid-name
+        self, params: tp.Dict[str, int]
+    ) -> None:
+        self.params = params
+
+    def knnQueryBatch(  # pylint: disable=invalid-name
+        self, queries: sp.csr_matrix, k: int, num_threads: int
+    ) -> tp.List[tp.Tuple[np.ndarray, np.ndarray]]:
+        assert queries.shape[0] == len(self.results)
+        assert num_threads == 1
+        return [(ids[:k], distances[:k]) for ids, distances in self.results]
+
+
+def test_hnsw_search_reads_nmslib_results() -> None:
+    # ids are int32 and distances float32 negative dot products,
+    # the closest first, fewer than k when the graph finds fewer
+    results = [
+        (np.array([4, 1, 0], np.int32), np.array([-3, -2, 0], np.float32)),
+        (np.zeros(0, np.int32), np.zeros(0, np.float32)),
+        (np.array([2], np.int32), np.array([-1.5], np.float32)),
+    ]
+    index = HnswIndex(
+        FakeNmslibIndex(results), make_vectors(5), np.arange(5), ef=30
+    )
+    assert index.index.params == {"efSearch": 30}
+
+    table, scores = index.search(np.array([3, 0, 2]), k=3)
+    assert table.tolist() == [[4, 1, -1], [-1, -1, -1], [2, -1, -1]]
+    assert scores.tolist() == [[3, 2, 0], [0, 0, 0], [1.5, 0, 0]]
+
+
+def bm25_neighbours_table(matrix: np.ndarray, k: int) -> np.ndarray:
+    """Neighbours of BM25Recommender over the dense users x items matrix."""
+    stored = matrix != 0
+    idf = np.log(len(matrix)) - np.log1p(stored.sum(axis=0))
+    lengths = matrix.sum(axis=1)
+    length_norm = 0.25 + 0.75 * lengths / lengths.mean()
+    weighted = np.where(
+        stored,
+        matrix * 2.2 / (1.2 * length_norm[:, None] + matrix) * idf[None, :],
+        0,
+    )
+    similarity = weighted @ weighted.T
+    table = np.argsort(-similarity, axis=1, kind="stable")[:, :k]
+    found = np.take_along_axis(similarity, table, axis=1) > 0
+    return np.where(found, table, -1).astype(np.int32)
+
+
+def test_exact_index_matches_engine_table() -> None:
+    vectors = make_vectors(80)
+    engine = UserKnn(
+        user_ids=np.arange(80) * 2,
+        item_ids=np.arange(100),
+        item_idf=np.zeros(100),
+        watched_indptr=np.zeros(81, dtype=np.int64),
+        watched_indices=np.zeros(0, dtype=np.int32),
+        neighbours=bm25_neighbours_table(vectors.toarray(), 10),
+        neighbour_scores=np.zeros((80, 10), dtype=np.float32),
+    )
+    index = ExactIndex(bm25_weight(vectors), engine.user_ids)
+    rows = np.arange(0, 80, 3)
+
+    assert engine_recall(index, engine, rows, 10) == 1.0
+    # the transposed weights find other neighbours
+    transposed = bm25_weight(vectors.T.tocsr()).T.tocsr()
+    assert engine_recall(
+        ExactIndex(transposed, engine.user_ids), engine, rows, 10
+    ) < 1.0
+    with pytest.raises(ValueError):
+        engine_recall(ExactIndex(vectors, np.arange(80)), engine, rows, 10)
+
+
+def test_hnsw_index(tmp_path) -> None:
+    pytest.importorskip("nmslib")
+    vectors = make_vectors(500)
+    user_ids = np.arange(500) * 3
+    HnswIndex.build(vectors, user_ids).save(str(tmp_path), {})
+    index = HnswIndex.load(str(tmp_path), ef=200)
+
+    rows = np.arange(0, 500, 10)
+    approx, _ = index.search(rows, 10)
+    exact, _ = ExactIndex(vectors, user_ids).search(rows, 10)
+    assert (index.user_ids == user_ids).all()
+    assert recall_at_n(approx, exact) > 0.9
@@ -0,0 +1,167 @@
+import typing as tp
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+from benchmarks.fixtures import make_interactions
+from service.reco_models.columnar import ColumnarIndex, save_columnar
+from service.reco_models.offline_knn import (
+    bm25_weight,
+    build_offline_knn,
+    read_interactions,
+)
+
+
+@pytest.fixture(name="interactions_path")
+def fixture_interactions_path(tmp_path) -> str:
+    interactions = make_interactions(n_users=300, n_items=80, seed=1)
+    rng = np.random.default_rng(1)
+    interactions["watched_pct"] = rng.integers(0, 101, len(interactions))
+    interactions.loc[::7, "watched_pct"] = np.nan
+    path = str(tmp_path / "interactions.csv")
+    interactions.to_csv(path, index=False)
+    return path
+
+
+def implicit_bm25_weight(
+    matrix: np.ndarray, K1: float = 1.2, B: float = 0.75
+) -> np.ndarray:
+    """`bm25_weight` of implicit 0.4.4 on a dense matrix, rows are docs."""
+    stored = matrix != 0
+    idf = np.log(len(matrix)) - np.log1p(stored.sum(axis=0))
+    row_sums = matrix.sum(axis=1)
+    length_norm = (1.0 - B) + B * row_sums / row_sums.mean()
+    return np.where(
+        stored,
+        matrix * (K1 + 1.0) / (K1 * length_norm[:, None] + matrix)
+        * idf[None, :],
+        0,
+    )
+
+
+def naive_recs(
+    path: str,
+    min_interactions: int,
+    n_neighbours: int,
+    n_recs: int,
+) -> tp.Dict[int, tp.List[int]]:
+    interactions = pd.read_csv(path)
+    counts = interactions["user_id"].value_counts()
+    hot = interactions[
+        interactions["user_id"].map(counts) >= min_interactions
+    ]
+    users = np.sort(hot["user_id"].unique())
+    items = np.sort(hot["item_id"].unique())
+    matrix = np.zeros((len(users), len(items)))
+    matrix[
+        np.searchsorted(users, hot["user_id"]),
+        np.searchsorted(items, hot["item_id"]),
+    ] = hot["watched_pct"].fillna(0)
+
+    # BM25 of implicit over the users x items matrix, the interactions
+    # with a zero weight are stored and counted in the IDF too
+    n_users = len(users)
+    users_per_item = hot["item_id"].value_counts()[items].to_numpy()
+    idf = np.log(n_users) - np.log1p(users_per_item)
+    lengths = matrix.sum(axis=1)
+    length_norm = 0.25 + 0.75 * lengths / lengths.mean()
+    weighted = np.where(
+        matrix != 0,
+        matrix * 2.2 / (1.2 * length_norm[:, None] + matrix) * idf[None, :],
+        0,
+    )
+    similarity = weighted @ weighted.T
+
+    item_counts = hot["item_id"].value_counts()
+    item_idf = np.log((1 + len(hot)) / (1 + item_counts) + 1)
+    watched = hot.groupby("user_id")["item_id"].apply(set)
+
+    recs = {}
+    for row, user_id in enumerate(users):
+        order = np.argsort(-similarity[row], kind="stable")
+        neighbours = [
+            n for n in order[:n_neighbours] if similarity[row, n] > 0
+        ]
+        scores: tp.Dict[int, float] = {}
+        for neighbour in neighbours:
+            if neighbour == row:
+                continue
+            for item in watched[users[neighbour]]:
+                if item not in watched[user_id] and item not in scores:
+                    scores[item] = similarity[row, neighbour]
+        ranked = sorted(
+            (-score * item_idf[item], item) for item, score in scores.items()
+        )
+        if ranked:
+            recs[int(user_id)] = [item for _, item in ranked[:n_recs]]
+    return recs
+
+
+def test_read_interactions(interactions_path) -> None:
+    interactions = read_interactions(
+        interactions_path, min_interactions=10, chunk_size=100,
+        progress=lambda message: None,
+    )
+    frame = pd.read_csv(interactions_path)
+    counts = frame["user_id"].value_counts()
+
+    assert interactions.user_ids.tolist() == sorted(
+        counts[counts >= 10].index
+    )
+    assert interactions.n_interactions == counts[counts >= 10].sum()
+    assert interactions.matrix.shape == (
+        len(interactions.user_ids), len(interactions.item_ids)
+    )
+    assert interactions.item_counts.sum() == interactions.n_interactions
+
+
+def test_bm25_weight_keeps_structure(interactions_path) -> None:
+    interactions = read_interactions(
+        interactions_path, progress=lambda message: None
+    )
+    weighted = bm25_weight(interactions.matrix)
+
+    assert weighted.dtype == np.float32
+    assert (weighted.indptr == interactions.matrix.indptr).all()
+    assert (weighted.indices == interactions.matrix.indices).all()
+
+
+def test_bm25_weight_matches_implicit(interactions_path) -> None:
+    interactions = read_interactions(
+        interactions_path, progress=lambda message: None
+    )
+    # no zero weights, a dense matrix does not store them
+    matrix = interactions.matrix.toarray()
+    matrix[matrix == 0] = 0.5
+    weighted = bm25_weight(sp.csr_matrix(matrix), K1=1.2, B=0.75)
+
+    assert np.allclose(
+        weighted.toarray(), implicit_bm25_weight(matrix), rtol=1e-5
+    )
+
+
+@pytest.mark.parametrize("workers", (1, 2))
+def test_build_offline_knn(interactions_path, tmp_path, workers) -> None:
+    interactions = read_interactions(
+        interactions_path, min_interactions=10, chunk_size=100,
+        progress=lambda message: None,
+    )
+    user_ids, offsets, item_ids = build_offline_knn(
+        interactions,
+        n_neighbours=5,
+        n_recs=4,
+        block_size=16,
+        workers=workers,
+        progress=lambda message: None,
+    )
+    save_columnar(str(tmp_path / "recs"), user_ids, offsets, item_ids)
+    index = ColumnarIndex.load(str(tmp_path / "recs"))
+    expected = naive_recs(
+        interactions_path, min_interactions=10, n_neighbours=5, n_recs=4
+    )
+
+    assert len(index) == len(expected)
+    for user_id, items in expected.items():
+        assert index.get(user_id).tolist() == items
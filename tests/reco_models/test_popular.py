@@ -0,0 +1,71 @@
+import pickle
+import typing as tp
+
+import numpy as np
+import pytest
+
+from config.configuration import POPULAR_MODEL_RECS, POPULAR_MODEL_USERS
+from service.reco_models.popular import CompactPopularModel
+from service.reco_models.reco_models import SimplePopularModel
+
+USERS = {7: "kids", 3: "old", 2**32 - 1: "kids", 5: "no_recs"}
+POPULAR = {
+    "kids": [1, 2, 3],
+    "old": [9],
+    "popular_for_all": [4, 5, 6, 7],
+}
+USER_IDS = [7, 3, 2**32 - 1, 5, 0, 8, -1, 2**32, 10**12]
+
+
+def make_models(
+    tmp_path,
+) -> tp.Tuple[SimplePopularModel, CompactPopularModel]:
+    users_path = tmp_path / "users.pickle"
+    recs_path = tmp_path / "recs.pickle"
+    users_path.write_bytes(pickle.dumps(USERS))
+    recs_path.write_bytes(pickle.dumps(POPULAR))
+    return (
+        SimplePopularModel(str(users_path), str(recs_path)),
+        CompactPopularModel.from_pickles(str(users_path), str(recs_path)),
+    )
+
+
+@pytest.mark.parametrize("k_recs", [1, 3, 10])
+def test_compact_model_matches_simple_model(tmp_path, k_recs) -> None:
+    simple, compact = make_models(tmp_path)
+
+    assert compact.user_ids.dtype == np.uint32
+    assert compact.user_categories.dtype == np.uint8
+    for user_id in USER_IDS:
+        assert compact.predict(user_id, k_recs) == (
+            simple.predict(user_id, k_recs)
+        )
+    assert compact.predict_batch(USER_IDS, k_recs) == [
+        simple.predict(user_id, k_recs) for user_id in USER_IDS
+    ]
+    assert compact.predict_batch([], k_recs) == []
+
+
+def test_save_load(tmp_path) -> None:
+    _, compact = make_models(tmp_path)
+    compact.save(str(tmp_path / "compact"))
+    loaded = CompactPopularModel.load(str(tmp_path / "compact"))
+
+    assert isinstance(loaded.user_ids, np.memmap)
+    assert loaded.categories == compact.categories
+    assert loaded.predict_batch(USER_IDS, 2) == (
+        compact.predict_batch(USER_IDS, 2)
+    )
+    assert loaded.category(7) == "kids"
+    assert loaded.predict_category("kids", 2) == [1, 2]
+
+
+def test_compact_model_on_repository_pickles() -> None:
+    simple = SimplePopularModel(POPULAR_MODEL_USERS, POPULAR_MODEL_RECS)
+    compact = CompactPopularModel.from_pickles(
+        POPULAR_MODEL_USERS, POPULAR_MODEL_RECS
+    )
+    user_ids = list(simple.users_dictionary)[:1000] + [0, 10**9]
+    assert compact.predict_batch(user_ids, 10) == (
+        simple.predict_batch(user_ids, 10)
+    )
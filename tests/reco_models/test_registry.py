@@ -0,0 +1,152 @@
+import threading
+import time
+import typing as tp
+
+import pytest
+
+from service.reco_models.manifest import Manifest
+from service.reco_models.registry import ModelRegistry
+
+
+class Loader:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(
+        self,
+        manifest: tp.Optional[Manifest],
+    ) -> tp.Dict[str, tp.Any]:
+        self.calls += 1
+        time.sleep(self.delay)
+        return {
+            "model": self.calls,
+            "version": manifest.version if manifest else None,
+        }
+
+
+def test_models_are_loaded_on_first_use() -> None:
+    warmed_up = []
+    loads = []
+    registry = ModelRegistry(
+        warm_up_user_ids=[1, 2],
+        on_load=lambda name, seconds: loads.append(name),
+    )
+    loader = Loader()
+    registry.register(
+        "knn", loader, lambda model, user_ids: warmed_up.append(user_ids)
+    )
+
+    assert not registry.is_ready(["knn"])
+    assert loader.calls == 0
+    assert registry.get("knn")["model"] == 1
+    assert registry.get("knn")["model"] == 1
+    assert loader.calls == 1
+    assert warmed_up == [[1, 2]]
+    assert loads == ["knn"]
+    assert registry.is_ready(["knn"])
+    assert registry.status()["knn"]["loaded"]
+
+    with pytest.raises(ValueError):
+        registry.register("knn", loader)
+
+
+def test_concurrent_get_loads_once() -> None:
+    registry = ModelRegistry()
+    loader = Loader(delay=0.05)
+    registry.register("knn", loader)
+
+    threads = [
+        threading.Thread(target=registry.get, args=("knn",))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loader.calls == 1
+
+
+def test_failed_warm_up_leaves_model_unloaded() -> None:
+    def warm_up(model: tp.Any, user_ids: tp.List[int]) -> None:
+        raise RuntimeError("boom")
+
+    registry = ModelRegistry()
+    registry.register("knn", Loader(), warm_up)
+    with pytest.raises(RuntimeError):
+        registry.load()
+    assert not registry.is_ready(["knn"])
+
+
+def test_reload_swaps_loaded_models() -> None:
+    registry = ModelRegistry(Manifest("v1", {}))
+    knn_loader, popular_loader = Loader(), Loader()
+    registry.register("knn", knn_loader)
+    registry.register("popular", popular_loader)
+    old_knn = registry.get("knn")
+
+    registry.reload(Manifest("v2", {}))
+    assert registry.version == "v2"
+    assert old_knn == {"model": 1, "version": "v1"}
+    assert registry.get("knn") == {"model": 2, "version": "v2"}
+    # models that were not loaded stay lazy
+    assert popular_loader.calls == 0
+
+
+def test_current_keeps_its_version_over_reload() -> None:
+    registry = ModelRegistry(Manifest("v1", {}))
+    registry.register("knn", Loader())
+    registry.register("popular", Loader())
+    registry.get("knn")
+
+    models = registry.current()
+    registry.reload(Manifest("v2", {}))
+    assert models.version == "v1"
+    assert models.get("knn")["version"] == "v1"
+    # loaded lazily, from the manifest of its own version
+    assert models.get("popular")["version"] == "v1"
+    assert registry.current().get("popular")["version"] == "v2"
+
+
+def test_failed_reload_keeps_current_version() -> None:
+    def warm_up(model: tp.Any, user_ids: tp.List[int]) -> None:
+        if model["version"] == "broken":
+            raise RuntimeError("boom")
+
+    registry = ModelRegistry(Manifest("v1", {}))
+    registry.register("knn", Loader(), warm_up)
+    registry.load()
+    with pytest.raises(RuntimeError):
+        registry.reload(Manifest("broken", {}))
+    assert registry.version == "v1"
+    assert registry.get("knn")["version"] == "v1"
+
+
+def test_loader_options_are_passed_to_every_load() -> None:
+    def loader(
+        manifest: tp.Optional[Manifest], ef: int = 0
+    ) -> tp.Dict[str, tp.Any]:
+        return {"version": manifest.version if manifest else None, "ef": ef}
+
+    registry = ModelRegistry(Manifest("v1", {}))
+    registry.register("online_knn", loader)
+    registry.register("knn", loader)
+    registry.loader_options["online_knn"] = {"ef": 50}
+    assert registry.get("online_knn") == {"version": "v1", "ef": 50}
+    assert registry.get("knn") == {"version": "v1", "ef": 0}
+
+    registry.reload(Manifest("v2", {}))
+    assert registry.get("online_knn") == {"version": "v2", "ef": 50}
+
+
+def test_warm_up_options() -> None:
+    warmed_up = []
+    registry = ModelRegistry(warm_up_user_ids=[1])
+    registry.register(
+        "popular",
+        Loader(),
+        lambda model, user_ids, k_recs=10: warmed_up.append(k_recs),
+    )
+    registry.warm_up_options["popular"] = {"k_recs": 20}
+    registry.load()
+    assert warmed_up == [20]
@@ -0,0 +1,95 @@
+import os
+import pickle
+import typing as tp
+
+import numpy as np
+
+from service.reco_models.reco_models import SimplePopularModel
+from service.reco_models.response_store import ResponseStore
+from service.response import reco_response
+
+USER_IDS = [15, 4, 1_000_000, 7]
+RECOS: tp.List[tp.Optional[tp.Union[tp.List[int], np.ndarray]]] = [
+    [3, 2, 1], np.array([10], dtype=np.int32), [], None,
+]
+
+
+def make_popular_model(tmp_path) -> SimplePopularModel:
+    users_path = tmp_path / "users.pickle"
+    recs_path = tmp_path / "recs.pickle"
+    users_path.write_bytes(pickle.dumps({7: "kids", 8: "kids", 9: "old"}))
+    recs_path.write_bytes(pickle.dumps({
+        "kids": [1, 2, 3],
+        "popular_for_all": [4, 5, 6],
+    }))
+    return SimplePopularModel(str(users_path), str(recs_path))
+
+
+def test_bodies_match_reco_response(tmp_path) -> None:
+    popular_model = make_popular_model(tmp_path)
+    store = ResponseStore.build(
+        USER_IDS, RECOS, lambda: popular_model, k_recs=2
+    )
+
+    assert store.get(15) == reco_response(15, [3, 2, 1]).body
+    assert store.get(4) == reco_response(4, [10]).body
+    # users with empty knn recos and unknown users get popular
+    for user_id in (1_000_000, 7, 8):
+        assert store.get(user_id) == reco_response(
+            user_id, popular_model.predict(user_id, 2)
+        ).body
+    for user_id in (9, 10**9):
+        assert store.get(user_id) == reco_response(user_id, [4, 5]).body
+
+
+def test_malformed_recos_get_model_error_fallback(tmp_path) -> None:
+    # the recos service.recommend.predict would fail on with a TypeError
+    recos: tp.List[tp.Any] = [[3, 2, 1], 42, [object()]]
+    popular_model = make_popular_model(tmp_path)
+    store = ResponseStore.build(
+        [1, 2, 3], recos, lambda: popular_model, k_recs=2
+    )
+    assert store.get(1) == reco_response(1, [3, 2, 1]).body
+    for user_id in (2, 3):
+        assert store.get(user_id) == reco_response(user_id, [0, 1]).body
+
+
+def test_save_load(tmp_path) -> None:
+    popular_model = make_popular_model(tmp_path)
+    store = ResponseStore.build(
+        USER_IDS, RECOS, lambda: popular_model, k_recs=2
+    )
+    store.save(str(tmp_path / "store"))
+    # saved over the previous one
+    store.save(str(tmp_path / "store"))
+    assert sorted(os.listdir(tmp_path)) == [
+        "recs.pickle", "store", "users.pickle"
+    ]
+    loaded = ResponseStore.load(
+        str(tmp_path / "store"), lambda: popular_model
+    )
+
+    assert loaded.k_recs == 2
+    assert isinstance(loaded.index.item_ids, np.memmap)
+    for user_id in USER_IDS + [8, 9, 10**9]:
+        assert loaded.get(user_id) == store.get(user_id)
+
+
+def test_fallbacks_follow_the_popular_model(tmp_path) -> None:
+    models = [make_popular_model(tmp_path)]
+    store = ResponseStore.build(
+        USER_IDS, RECOS, lambda: models[-1], k_recs=2
+    )
+    assert store.get(7) == reco_response(7, [1, 2]).body
+
+    (tmp_path / "recs.pickle").write_bytes(pickle.dumps({
+        "kids": [9, 8],
+        "popular_for_all": [4, 5, 6],
+    }))
+    models.append(SimplePopularModel(
+        str(tmp_path / "users.pickle"), str(tmp_path / "recs.pickle")
+    ))
+    # the empty knn recos of user 7 are not stored either
+    assert store.get(7) == reco_response(7, [9, 8]).body
+    assert store.get(8) == reco_response(8, [9, 8]).body
+    assert store.get(15) == reco_response(15, [3, 2, 1]).body
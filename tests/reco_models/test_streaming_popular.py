@@ -0,0 +1,144 @@
+import pickle
+from collections import Counter
+
+import numpy as np
+
+from service.reco_models.popular import POPULAR_FOR_ALL, CompactPopularModel
+from service.reco_models.reco_models import SimplePopularModel
+from service.reco_models.streaming_popular import (
+    EventFileReader,
+    PopularityWindow,
+    StreamingPopularity,
+    parse_event,
+)
+
+USERS = {1: "kids", 2: "kids", 3: "adults"}
+POPULAR = {
+    "kids": [100, 101, 102],
+    "adults": [200, 201, 202],
+    POPULAR_FOR_ALL: [300, 301, 302],
+}
+
+
+def test_window_matches_recount() -> None:
+    window = PopularityWindow(bucket_seconds=10, window_buckets=3)
+    rng = np.random.default_rng(0)
+    events = []
+    for timestamp in np.sort(rng.uniform(0, 200, size=2000)):
+        # some events are late by up to a bucket
+        timestamp = max(0.0, timestamp - rng.uniform(0, 10))
+        item_id = int(rng.zipf(1.5)) % 50
+        if window.add("all", item_id, timestamp):
+            events.append((timestamp, item_id))
+
+        oldest = (window.last_bucket - 2) * 10
+        expected = Counter(
+            item_id for at, item_id in events if at >= oldest
+        )
+        top = window.top("all", 5)
+        assert len(top) == min(5, len(expected))
+        counts = sorted(expected.values(), reverse=True)[:5]
+        assert [expected[item_id] for item_id in top] == counts
+
+    # an event older than the window
+    assert not window.add("all", 1, 0.0)
+    assert window.stats()["buckets"] <= 3
+
+
+def test_window_forgets_expired_items() -> None:
+    window = PopularityWindow(bucket_seconds=1, window_buckets=2)
+    window.add("all", 1, 0.5)
+    window.add("all", 2, 1.5)
+    assert window.pop_dirty() == {"all"}
+    assert sorted(window.top("all", 10)) == [1, 2]
+
+    window.add("all", 3, 2.5)
+    assert window.changed
+    assert sorted(window.top("all", 10)) == [2, 3]
+    window.add("all", 4, 10.0)
+    assert window.top("all", 10) == [4]
+    assert window.stats()["items"] == {"all": 1}
+
+
+def is_stale(engine: StreamingPopularity) -> bool:
+    # a call, mypy would narrow the property between the asserts
+    return engine.stale
+
+
+def test_streaming_popularity() -> None:
+    base = CompactPopularModel.from_dictionaries(USERS, POPULAR)
+    engine = StreamingPopularity(
+        base=lambda: base,
+        window=PopularityWindow(bucket_seconds=60, window_buckets=10),
+        k_recs=3,
+        clock=lambda: 1000.0,
+    )
+    assert not is_stale(engine)
+
+    for user_id, item_id in [(1, 7), (2, 7), (1, 8), (3, 9), (-1, 5)]:
+        assert engine.add(user_id, item_id)
+    assert not engine.add(1, 6, timestamp=0.0)
+    assert is_stale(engine)
+
+    snapshot = engine.publish()
+    assert engine.snapshot is snapshot
+    assert not is_stale(engine)
+    # the top of the window first, filled up with the artifact items
+    assert snapshot.predict(1, 3) == [7, 8, 100]
+    assert snapshot.predict(3, 3) == [9, 200, 201]
+    assert snapshot.predict(-1, 3) == [7, 8, 9]
+    assert engine.stats()["events"] == 5
+    assert engine.stats()["dropped"] == 1
+
+    engine.add(3, 210)
+    engine.add(3, 210)
+    assert engine.publish().predict(3, 3) == [210, 9, 200]
+    # published snapshots are never changed
+    assert snapshot.predict(3, 3) == [9, 200, 201]
+
+
+def test_streaming_popularity_over_simple_model(tmp_path) -> None:
+    users_path, recs_path = tmp_path / "users", tmp_path / "recs"
+    users_path.write_bytes(pickle.dumps(USERS))
+    recs_path.write_bytes(pickle.dumps(POPULAR))
+    base = SimplePopularModel(str(users_path), str(recs_path))
+    engine = StreamingPopularity(
+        base=lambda: base,
+        window=PopularityWindow(bucket_seconds=60, window_buckets=10),
+        k_recs=3,
+        clock=lambda: 1000.0,
+    )
+    engine.add(3, 9)
+    snapshot = engine.publish()
+
+    assert snapshot.predict(3, 3) == [9, 200, 201]
+    assert snapshot.predict(1, 3) == base.predict(1, 3)
+    # converted once per loaded model
+    converted = engine._compact_base  # pylint: disable=protected-access
+    engine.add(1, 7)
+    assert engine.publish().user_ids is converted.user_ids
+
+
+def test_event_file_reader(tmp_path) -> None:
+    path = tmp_path / "events.jsonl"
+    reader = EventFileReader(str(path), from_end=False)
+    assert reader.read_lines() == []
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"user_id": 1, "item_id": 2}\n{"user_id": 3')
+    lines = reader.read_lines()
+    assert [parse_event(line) for line in lines] == [(1, 2, None)]
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(', "item_id": 4, "timestamp": 5}\n')
+    assert [parse_event(line) for line in reader.read_lines()] == [
+        (3, 4, 5.0)
+    ]
+
+    # truncated, read from the start
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"user_id": 6, "item_id": 7}\n')
+    assert [parse_event(line) for line in reader.read_lines()] == [
+        (6, 7, None)
+    ]
+    reader.close()
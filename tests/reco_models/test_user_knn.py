@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import make_pandas_user_knn
+from service.reco_models.user_knn import (
+    NEIGHBOURS_FILE,
+    NEIGHBOURS_INDICES_FILE,
+    NEIGHBOURS_INDPTR_FILE,
+    NEIGHBOUR_SCORES_FILE,
+    UserKnn,
+    gather_rows,
+    top_k_smallest,
+    upgrade_neighbour_lists,
+)
+
+
+def test_gather_rows() -> None:
+    indptr = np.array([0, 2, 2, 5])
+    indices = np.array([1, 2, 3, 4, 5])
+    assert gather_rows(indptr, indices, np.array([2, 0])).tolist() == [
+        3, 4, 5, 1, 2
+    ]
+    assert gather_rows(indptr, indices, np.array([1])).tolist() == []
+
+
+def test_top_k_smallest_keeps_order_of_ties() -> None:
+    scores = np.array([3.0, 1.0, 2.0, 1.0, 2.0, 5.0])
+    assert top_k_smallest(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_smallest(scores, 10).tolist() == [1, 3, 2, 4, 0, 5]
+
+
+def test_user_knn_matches_pandas_path(tmp_path) -> None:
+    legacy = make_pandas_user_knn(n_users=300, n_items=100, n_neighbours=10)
+    UserKnn.from_user_knn_bm25(legacy).save(str(tmp_path))
+    engine = UserKnn.load(str(tmp_path))
+
+    for user_id in engine.user_ids[::7].tolist():
+        for n_recs in (1, 10):
+            assert engine.predict(user_id, n_recs) == legacy.predict(
+                user_id, n_recs
+            )
+    assert engine.predict(-1) is None
+
+
+def test_user_knn_predict_batch() -> None:
+    legacy = make_pandas_user_knn(n_users=300, n_items=100, n_neighbours=10)
+    engine = UserKnn.from_user_knn_bm25(legacy)
+
+    user_ids = engine.user_ids[::5].tolist() + [-1, 10**9]
+    for n_recs in (1, 10):
+        assert engine.predict_batch(user_ids, n_recs) == [
+            engine.predict(user_id, n_recs) for user_id in user_ids
+        ]
+    assert not engine.predict_batch([])
+
+
+def test_user_knn_neighbour_table(tmp_path) -> None:
+    legacy = make_pandas_user_knn(n_users=300, n_items=100, n_neighbours=10)
+    UserKnn.from_user_knn_bm25(legacy).save(str(tmp_path))
+    engine = UserKnn.load(str(tmp_path))
+
+    assert engine.neighbours_table.dtype == np.int32
+    assert engine.neighbour_scores.dtype == np.float32
+    assert engine.neighbours_table.shape == (len(engine.user_ids), 10)
+
+    user_id = int(engine.user_ids[3])
+    similar_users, scores = engine.similar_users(user_id)
+    expected = legacy.user_knn.similar_items(
+        legacy.users_mapping[user_id], N=10
+    )
+    assert similar_users.tolist() == [
+        legacy.users_inv_mapping[user] for user, _ in expected
+    ]
+    assert np.allclose(scores, [score for _, score in expected])
+    assert engine.similar_users(-1) is None
+
+
+def test_user_knn_upgrades_neighbour_lists(tmp_path) -> None:
+    legacy = make_pandas_user_knn(n_users=300, n_items=100, n_neighbours=10)
+    engine = UserKnn.from_user_knn_bm25(legacy)
+    engine.save(str(tmp_path))
+    # the layout of the artifacts saved before the neighbour table
+    rows = [engine.neighbours(i) for i in range(len(engine.user_ids))]
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    np.save(str(tmp_path / NEIGHBOURS_INDPTR_FILE), indptr)
+    np.save(str(tmp_path / NEIGHBOURS_INDICES_FILE), np.concatenate(rows))
+    (tmp_path / NEIGHBOURS_FILE).unlink()
+    (tmp_path / NEIGHBOUR_SCORES_FILE).unlink()
+    with pytest.raises(FileNotFoundError):
+        UserKnn.load(str(tmp_path))
+
+    upgrade_neighbour_lists(str(tmp_path))
+    assert not (tmp_path / NEIGHBOURS_INDPTR_FILE).exists()
+    loaded = UserKnn.load(str(tmp_path))
+    assert (loaded.neighbours_table == engine.neighbours_table).all()
+    user_ids = engine.user_ids[::5].tolist()
+    assert loaded.predict_batch(user_ids) == engine.predict_batch(user_ids)
@@ -0,0 +1,96 @@
+import asyncio
+import typing as tp
+
+import pytest
+
+from service.admission import (
+    CONCURRENCY,
+    RATE,
+    AdmissionControl,
+    AdmissionLimiter,
+    AdmissionRejected,
+)
+from service.settings import AdmissionConfig
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_limiter_hands_slots_to_waiters_in_order() -> None:
+    limiter = AdmissionLimiter("model", 1, 2, max_wait_ms=1000)
+    admitted: tp.List[int] = []
+
+    async def request(i: int) -> None:
+        await limiter.acquire()
+        admitted.append(i)
+        await asyncio.sleep(0.01)
+        limiter.release()
+
+    async def scenario() -> tp.List[tp.Any]:
+        return await asyncio.gather(
+            *(request(i) for i in range(4)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    # one request runs, two wait, the last one is rejected at once
+    assert admitted == [0, 1, 2]
+    assert isinstance(results[3], AdmissionRejected)
+    assert results[3].reason == CONCURRENCY
+    assert limiter.in_flight == 0
+    assert limiter.waiting == 0
+    assert limiter.stats()["rejected"] == {CONCURRENCY: 1, RATE: 0}
+
+
+def test_limiter_rejects_after_max_wait() -> None:
+    limiter = AdmissionLimiter("model", 1, 10, max_wait_ms=10)
+
+    async def scenario() -> None:
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        limiter.release()
+        await limiter.acquire()
+
+    asyncio.run(scenario())
+    assert limiter.in_flight == 1
+    assert limiter.waiting == 0
+
+
+def test_limiter_rate() -> None:
+    clock = Clock()
+    limiter = AdmissionLimiter(
+        "model", None, 0, max_wait_ms=0, rate=2, burst=2, clock=clock
+    )
+
+    async def scenario() -> None:
+        await limiter.acquire()
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        clock.now = 0.5
+        await limiter.acquire()
+
+    asyncio.run(scenario())
+    assert limiter.rejected[RATE] == 1
+    assert limiter.admitted == 3
+
+
+def test_admission_control_limits_listed_models_only() -> None:
+    control = AdmissionControl(
+        AdmissionConfig(
+            enabled=True, max_concurrency={"a": 1}, rates={"b": 10}
+        )
+    )
+    assert control.get("a").max_concurrency == 1
+    assert control.get("b").rate == 10
+    assert control.get("c") is None
+    assert set(control.stats()) == {"a", "b"}
+    # off by default
+    assert AdmissionControl(
+        AdmissionConfig(max_concurrency={"a": 1})
+    ).stats() == {}
@@ -0,0 +1,73 @@
+import asyncio
+import typing as tp
+
+import pytest
+
+from service.batching import MicroBatcher
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.batches: tp.List[tp.List[int]] = []
+
+    async def __call__(self, keys: tp.List[int]) -> tp.List[int]:
+        self.batches.append(keys)
+        return [key * 10 for key in keys]
+
+
+def test_concurrent_calls_are_coalesced() -> None:
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=100, max_wait_ms=10)
+
+    async def scenario() -> tp.List[int]:
+        return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30, 40]
+    assert recorder.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_full_batch_is_flushed_without_waiting() -> None:
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=2, max_wait_ms=10_000)
+
+    async def scenario() -> tp.List[int]:
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i) for i in range(4))), 1
+        )
+
+    assert asyncio.run(scenario()) == [0, 10, 20, 30]
+    assert recorder.batches == [[0, 1], [2, 3]]
+    assert batcher.stats()["mean_batch_size"] == 2
+
+
+def test_batch_error_is_raised_for_every_caller() -> None:
+    async def fail(keys: tp.List[int]) -> tp.List[int]:
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(fail, max_batch_size=10, max_wait_ms=1)
+
+    async def scenario() -> tp.Sequence[tp.Any]:
+        return await asyncio.gather(
+            batcher.submit(1), batcher.submit(2), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(batcher.submit(3))
+
+
+def test_batch_tasks_are_kept_until_done() -> None:
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=1, max_wait_ms=10)
+    tasks = batcher._tasks  # pylint: disable=protected-access
+
+    async def scenario() -> int:
+        submitted = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0)
+        assert len(tasks) == 1
+        return await submitted
+
+    assert asyncio.run(scenario()) == 10
+    assert not tasks
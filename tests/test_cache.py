@@ -0,0 +1,132 @@
+import asyncio
+import typing as tp
+
+from service.cache import LRUCache, RecoCache
+from service.settings import CacheConfig
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache = LRUCache(capacity=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_lru_cache_ttl() -> None:
+    clock = Clock()
+    cache = LRUCache(capacity=10, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4
+    assert cache.get("a") == (True, 1)
+    clock.now = 6
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+def make_compute(
+    calls: tp.List[int],
+    value: int,
+) -> tp.Callable[[], tp.Awaitable[int]]:
+    async def compute() -> int:
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    return compute
+
+
+def test_reco_cache_single_flight() -> None:
+    cache = RecoCache(
+        CacheConfig(enabled=True, capacities={"model": 10})
+    )
+    calls: tp.List[int] = []
+
+    async def scenario() -> tp.List[int]:
+        results = await asyncio.gather(
+            *(
+                cache.get_or_compute("model", 1, make_compute(calls, i))
+                for i in range(3)
+            )
+        )
+        results.append(
+            await cache.get_or_compute("model", 1, make_compute(calls, 9))
+        )
+        return results
+
+    assert asyncio.run(scenario()) == [0, 0, 0, 0]
+    assert calls == [0]
+    assert cache.stats()["model"]["coalesced"] == 2
+    assert cache.stats()["model"]["hits"] == 1
+
+
+def test_reco_cache_skips_not_configured_models() -> None:
+    cache = RecoCache(
+        CacheConfig(enabled=True, capacities={"model": 10})
+    )
+    calls: tp.List[int] = []
+
+    async def scenario() -> None:
+        for i in range(2):
+            await cache.get_or_compute("other", 1, make_compute(calls, i))
+
+    asyncio.run(scenario())
+    assert calls == [0, 1]
+
+
+def test_reco_cache_invalidate_drops_in_flight_results() -> None:
+    cache = RecoCache(
+        CacheConfig(enabled=True, capacities={"model": 10})
+    )
+    calls: tp.List[int] = []
+
+    async def scenario() -> tp.Tuple[int, int]:
+        old = asyncio.ensure_future(
+            cache.get_or_compute("model", 1, make_compute(calls, 1))
+        )
+        await asyncio.sleep(0)
+        cache.invalidate("model")
+        new = await cache.get_or_compute("model", 1, make_compute(calls, 2))
+        return await old, new
+
+    assert asyncio.run(scenario()) == (1, 2)
+    assert calls == [1, 2]
+    assert asyncio.run(
+        cache.get_or_compute("model", 1, make_compute(calls, 3))
+    ) == 2
+
+
+def test_reco_cache_does_not_store_rejected_results() -> None:
+    cache = RecoCache(
+        CacheConfig(enabled=True, capacities={"model": 10})
+    )
+    calls: tp.List[int] = []
+
+    async def scenario() -> tp.List[int]:
+        return [
+            await cache.get_or_compute(
+                "model",
+                1,
+                make_compute(calls, i),
+                cacheable=lambda value: value > 0,
+            )
+            for i in range(3)
+        ]
+
+    assert asyncio.run(scenario()) == [0, 1, 1]
+    assert calls == [0, 1]
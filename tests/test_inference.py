@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import typing as tp
+
+import pytest
+
+from service.inference import (
+    ExecutionMode,
+    InferenceExecutor,
+    InferenceExecutors,
+    InferenceQueueFull,
+)
+from service.settings import InferenceConfig
+
+
+def test_inline_executor_runs_in_caller_thread() -> None:
+    executor = InferenceExecutor("model", ExecutionMode.INLINE, 1, 0)
+    thread_name = asyncio.run(
+        executor.run(lambda: threading.current_thread().name)
+    )
+    assert thread_name == threading.current_thread().name
+    assert executor.in_flight == 0
+
+
+def test_thread_executor_rejects_over_queue_limit() -> None:
+    executor = InferenceExecutor("model", ExecutionMode.THREAD, 1, 1)
+    release = threading.Event()
+
+    async def scenario() -> tp.List[tp.Any]:
+        tasks = [
+            asyncio.ensure_future(executor.run(release.wait, 5))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        stats = executor.stats()
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return [stats] + results
+
+    stats, *results = asyncio.run(scenario())
+    executor.shutdown()
+
+    assert stats["in_flight"] == 2
+    assert stats["queue_depth"] == 1
+    assert results[:2] == [True, True]
+    assert isinstance(results[2], InferenceQueueFull)
+    assert executor.stats()["rejected"] == 1
+
+
+def test_abandoned_calls_stay_in_flight_until_done() -> None:
+    executor = InferenceExecutor("model", ExecutionMode.THREAD, 1, 0)
+    release = threading.Event()
+
+    async def scenario() -> tp.List[int]:
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(executor.run(release.wait, 5), 0.01)
+        # the worker is still busy, there is no room for another call
+        with pytest.raises(InferenceQueueFull):
+            await executor.run(release.wait, 5)
+        in_flight = [executor.in_flight]
+        release.set()
+        await asyncio.sleep(0.05)
+        return in_flight + [executor.in_flight]
+
+    assert asyncio.run(scenario()) == [1, 0]
+    executor.shutdown()
+
+
+def test_executors_use_configured_modes() -> None:
+    executors = InferenceExecutors(
+        InferenceConfig(modes={"slow": "process"}, max_workers=2)
+    )
+    assert executors.get("slow").mode == ExecutionMode.PROCESS
+    assert executors.get("fast").mode == ExecutionMode.INLINE
+    assert set(executors.stats()) == {"slow", "fast"}
+
+
+def test_executors_reject_unknown_mode() -> None:
+    executors = InferenceExecutors(InferenceConfig(modes={"slow": "gpu"}))
+    with pytest.raises(ValueError):
+        executors.get("slow")
@@ -0,0 +1,72 @@
+import io
+import logging
+import sys
+
+from service.log import AccessSampleFilter, LogWriter, QueueLogHandler
+
+
+def make_record(status_code: int) -> logging.LogRecord:
+    record = logging.LogRecord("access", logging.INFO, "", 0, "", (), None)
+    record.status_code = status_code
+    return record
+
+
+def test_access_sample_filter() -> None:
+    sampler = AccessSampleFilter(rate=0.0)
+    assert not sampler.filter(make_record(200))
+    assert sampler.filter(make_record(404))
+    assert sampler.filter(make_record(503))
+    assert AccessSampleFilter(rate=1.0).filter(make_record(200))
+
+
+def test_queue_log_handler_writes_in_background() -> None:
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter('message="%(message)s"'))
+    writer = LogWriter(batch_size=4)
+    writer.start()
+
+    logger = logging.getLogger("test_queue_log_handler")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = QueueLogHandler(target, writer)
+    logger.addHandler(handler)
+    try:
+        for i in range(10):
+            logger.info("user_id: %d", i)
+    finally:
+        logger.removeHandler(handler)
+        writer.stop()
+
+    assert stream.getvalue().splitlines() == [
+        f'message="user_id: {i}"' for i in range(10)
+    ]
+
+
+def test_queue_log_handler_formats_args_when_called() -> None:
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    # not started, records wait in the queue
+    writer = LogWriter(batch_size=4)
+    handler = QueueLogHandler(target, writer)
+
+    errors = ["first"]
+    handler.handle(logging.LogRecord(
+        "test", logging.ERROR, __file__, 1, "errors: %s", (errors,), None,
+    ))
+    errors.append("second")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        handler.handle(logging.LogRecord(
+            "test", logging.ERROR, __file__, 1, "failed", None,
+            sys.exc_info(),
+        ))
+    writer.start()
+    writer.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == "errors: ['first']"
+    assert lines[1] == "failed"
+    assert lines[-1] == "ValueError: boom"
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from service.memory import child_pids, memory_usage
+
+
+@pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps_rollup"), reason="Linux only"
+)
+def test_memory_usage() -> None:
+    usage = memory_usage()
+    assert usage["rss"] > 0
+    assert usage["rss"] == usage["shared"] + usage["uss"]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="Linux only")
+def test_child_pids() -> None:
+    child = subprocess.Popen([sys.executable, "-c", "input()"],
+                             stdin=subprocess.PIPE)
+    try:
+        assert child.pid in child_pids(os.getpid())
+    finally:
+        child.communicate(b"\n")
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import typing as tp
+
+import orjson
+
+from service.metrics import (
+    ARCHIVE_FILE,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+)
+
+
+def make_registry(
+    multiprocess_dir: tp.Optional[str] = None,
+) -> tp.Tuple[MetricsRegistry, Counter, Gauge, Histogram]:
+    registry = MetricsRegistry(multiprocess_dir)
+    counter = registry.register(Counter("hits_total", "Hits", ("model",)))
+    gauge = registry.register(Gauge("load_seconds", "Load", ("model",)))
+    histogram = registry.register(
+        Histogram("latency_seconds", "Latency", ("model",), (0.1, 1.0))
+    )
+    return registry, counter, gauge, histogram
+
+
+def test_render() -> None:
+    registry, counter, gauge, histogram = make_registry()
+    counter.inc("knn")
+    counter.inc("knn", amount=2)
+    gauge.set(1.5, 'a"b')
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "knn")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE hits_total counter" in lines
+    assert 'hits_total{model="knn"} 3.0' in lines
+    assert 'load_seconds{model="a\\"b"} 1.5' in lines
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{model="knn",le="0.1"} 2.0' in lines
+    assert 'latency_seconds_bucket{model="knn",le="1.0"} 3.0' in lines
+    assert 'latency_seconds_bucket{model="knn",le="+Inf"} 4.0' in lines
+    assert 'latency_seconds_sum{model="knn"} 3.65' in lines
+    assert 'latency_seconds_count{model="knn"} 4.0' in lines
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path) -> None:
+    registry, counter, gauge, histogram = make_registry(str(tmp_path))
+    counter.inc("knn")
+    gauge.set(1.0, "knn")
+    histogram.observe(0.5, "knn")
+
+    # snapshot of another worker
+    other, other_counter, other_gauge, other_histogram = make_registry()
+    other_counter.inc("knn", amount=2)
+    other_counter.inc("popular")
+    other_gauge.set(2.0, "knn")
+    other_histogram.observe(0.01, "knn")
+    (tmp_path / "1.json").write_bytes(orjson.dumps(other.snapshot()))
+
+    lines = registry.render().splitlines()
+    assert 'hits_total{model="knn"} 3.0' in lines
+    assert 'hits_total{model="popular"} 1.0' in lines
+    assert 'load_seconds{model="knn"} 2.0' in lines
+    assert 'latency_seconds_bucket{model="knn",le="0.1"} 1.0' in lines
+    assert 'latency_seconds_count{model="knn"} 2.0' in lines
+    # merging does not change the values of this process
+    assert counter.values == {("knn",): 1.0}
+
+
+def test_histogram_empty_copy_keeps_buckets() -> None:
+    _, _, _, histogram = make_registry()
+    histogram.observe(0.5, "knn")
+    copy = histogram.empty_copy()
+
+    assert copy.buckets == (0.1, 1.0)
+    assert copy.labelnames == ("model",)
+    assert not copy.values
+
+
+def test_snapshots_of_exited_workers_are_archived(tmp_path) -> None:
+    registry, counter, _, _ = make_registry(str(tmp_path))
+    counter.inc("knn")
+    for _ in range(2):
+        # the snapshot of a worker that has exited
+        with subprocess.Popen([sys.executable, "-c", ""]) as worker:
+            worker.wait()
+        other, other_counter, _, _ = make_registry()
+        other_counter.inc("knn", amount=2)
+        (tmp_path / f"{worker.pid}.json").write_bytes(
+            orjson.dumps(other.snapshot())
+        )
+        lines = registry.render().splitlines()
+
+    assert 'hits_total{model="knn"} 5.0' in lines
+    assert sorted(path.name for path in tmp_path.glob("*.json")) == sorted(
+        [ARCHIVE_FILE, f"{os.getpid()}.json"]
+    )
+    # archived snapshots are counted once
+    assert 'hits_total{model="knn"} 5.0' in registry.render().splitlines()
+
+
+def test_record_threadsafe() -> None:
+    registry, _, gauge, _ = make_registry()
+    registry.record_threadsafe(gauge.set, 1.0, "popular")
+    assert gauge.values == {("popular",): 1.0}
+
+    async def scenario() -> tp.List[tp.Any]:
+        registry.loop = asyncio.get_running_loop()
+        thread = threading.Thread(
+            target=registry.record_threadsafe, args=(gauge.set, 2.0, "knn")
+        )
+        thread.start()
+        thread.join()
+        # recorded on the loop, not in the thread
+        recorded = [dict(gauge.values)]
+        await asyncio.sleep(0)
+        return recorded + [dict(gauge.values)]
+
+    before, after = asyncio.run(scenario())
+    assert ("knn",) not in before
+    assert after[("knn",)] == 2.0
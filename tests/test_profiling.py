@@ -0,0 +1,46 @@
+import cProfile
+import marshal
+import threading
+
+from service.profiling import (
+    PSTATS,
+    TEXT,
+    format_collapsed,
+    profile_report,
+    sample_stacks,
+)
+
+
+def busy_wait(stop: threading.Event) -> None:
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+def test_sample_stacks() -> None:
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_wait, args=(stop,), name="busy")
+    thread.start()
+    try:
+        stacks = sample_stacks(0.05, interval_seconds=0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    busy_stacks = [stack for stack in stacks if stack.startswith("busy;")]
+    assert busy_stacks
+    assert all("busy_wait (" in stack for stack in busy_stacks)
+    # the sampling thread itself is skipped
+    assert not any("sample_stacks (" in stack for stack in stacks)
+
+    line = format_collapsed(stacks).splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert stacks[stack] == int(count)
+
+
+def test_profile_report() -> None:
+    profiler = cProfile.Profile()
+    profiler.runcall(sorted, range(10))
+    assert b"function calls" in profile_report(profiler, TEXT)
+    stats = marshal.loads(profile_report(profiler, PSTATS))
+    assert any(name == "<built-in method builtins.sorted>"
+               for _, _, name in stats)
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from http import HTTPStatus
+
+import numpy as np
+import orjson
+import pytest
+
+from service.models import Error
+from service.response import create_response, reco_response
+
+
+def test_reco_response_serializes_numpy_items() -> None:
+    response = reco_response(7, np.array([3, 2, 1], dtype=np.int32))
+    assert orjson.loads(response.body) == {"user_id": 7, "items": [3, 2, 1]}
+    assert reco_response(7, [np.int64(3), 2]).body == (
+        b'{"user_id":7,"items":[3,2]}'
+    )
+
+
+def test_error_envelope() -> None:
+    error = Error(
+        error_key="user_not_found",
+        error_message="User is unknown",
+        error_loc=("path", "user_id"),
+    )
+    response = create_response(HTTPStatus.NOT_FOUND, errors=[error])
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert orjson.loads(response.body) == {
+        "errors": [
+            {
+                "error_key": "user_not_found",
+                "error_message": "User is unknown",
+                "error_loc": ["path", "user_id"],
+            }
+        ]
+    }
+
+
+def test_unknown_objects_are_serialized_as_strings() -> None:
+    response = create_response(HTTPStatus.OK, data={"value": Decimal()})
+    assert orjson.loads(response.body) == {"data": {"value": "0"}}
+
+
+def test_non_str_keys() -> None:
+    response = create_response(HTTPStatus.OK, data={1: "a", None: "b"})
+    assert orjson.loads(response.body) == {"data": {"1": "a", "null": "b"}}
+
+
+def test_non_finite_floats_are_rejected() -> None:
+    for value in (
+        float("nan"),
+        [1.0, float("inf")],
+        np.array([0.5, np.nan]),
+        {"score": np.float32("-inf")},
+    ):
+        with pytest.raises(ValueError):
+            create_response(HTTPStatus.OK, data=value)
+    response = create_response(
+        HTTPStatus.OK, data={"items": [1, None], "score": 0.5}
+    )
+    assert orjson.loads(response.body) == {
+        "data": {"items": [1, None], "score": 0.5}
+    }
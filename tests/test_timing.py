@@ -0,0 +1,30 @@
+import asyncio
+
+from service.timing import server_timing, stage, start_stages
+
+
+def test_stages_of_the_current_task() -> None:
+    async def request(sleep: float) -> dict:
+        stages = start_stages()
+        with stage("model"):
+            await asyncio.sleep(sleep)
+        with stage("model"):
+            pass
+        return stages
+
+    async def scenario() -> list:
+        return await asyncio.gather(request(0.02), request(0))
+
+    slow, fast = asyncio.run(scenario())
+    assert slow["model"] >= 0.02
+    assert fast["model"] < 0.02
+
+    # outside of a request nothing is recorded
+    with stage("model"):
+        pass
+
+
+def test_server_timing() -> None:
+    assert server_timing({"auth": 0.0001, "model": 0.0123}) == (
+        "auth;dur=0.100, model;dur=12.300"
+    )